@@ -0,0 +1,74 @@
+"""
+Benchmark scheduler event loop latency while running a 500-trial
+``study.optimize`` with SQLite-backed ``DaskStorage``, both with storage calls
+made on the scheduler's event loop (the default) and offloaded to a separate
+thread (``offload=True``).
+
+Latency is measured by a coroutine on the scheduler which repeatedly sleeps for
+a fixed interval and records how late it wakes up.
+"""
+
+import asyncio
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import optuna
+from dask.distributed import Client
+import dask_optuna
+
+optuna.logging.set_verbosity(optuna.logging.WARN)
+
+INTERVAL = 0.005
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    y = trial.suggest_uniform("y", -10, 10)
+    return (x - 2) ** 2 + (y + 3) ** 2
+
+
+def start_monitor(dask_scheduler=None):
+    lags = dask_scheduler._optuna_benchmark_lags = []
+
+    async def monitor():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(INTERVAL)
+            lags.append(time.perf_counter() - start - INTERVAL)
+
+    dask_scheduler._optuna_benchmark_monitor = asyncio.ensure_future(monitor())
+
+
+def stop_monitor(dask_scheduler=None):
+    dask_scheduler._optuna_benchmark_monitor.cancel()
+    return dask_scheduler._optuna_benchmark_lags
+
+
+def run(client, offload, n_trials=500):
+    with tempfile.NamedTemporaryFile() as f:
+        storage = dask_optuna.DaskStorage(f"sqlite:///{f.name}", offload=offload)
+        study = optuna.create_study(storage=storage)
+        client.run_on_scheduler(start_monitor)
+        start = time.perf_counter()
+        with joblib.parallel_backend("dask"):
+            study.optimize(objective, n_trials=n_trials, n_jobs=-1)
+        elapsed = time.perf_counter() - start
+        lags = np.array(client.run_on_scheduler(stop_monitor)) * 1000
+
+    print(
+        f"offload={offload!s:<5}  "
+        f"wall time = {elapsed:6.2f} s  "
+        f"event loop lag: median = {np.median(lags):6.2f} ms  "
+        f"p99 = {np.percentile(lags, 99):6.2f} ms  "
+        f"max = {lags.max():6.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+
+    with Client() as client:
+        print(f"Dask dashboard is available at {client.dashboard_link}")
+        for offload in [False, True]:
+            run(client, offload=offload)
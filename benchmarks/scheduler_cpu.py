@@ -0,0 +1,81 @@
+"""
+Benchmark the scheduler's CPU usage while workers run 1000 trials, both with
+``DaskStorage`` hosted on the scheduler (the default), hosted in a subprocess
+next to the scheduler (``sidecar=True``), and hosted in a Dask Actor on a
+dedicated worker (``actor=...``).
+
+Each optimizing worker runs a single task which calls ``study.optimize``, so
+almost all of the scheduler's work comes from storage operations rather than
+from scheduling tasks. CPU time is measured with ``psutil`` in the scheduler
+process.
+
+Pass a storage URL (e.g. ``sqlite:///benchmark.db``) as the first argument to
+benchmark a storage other than the in-memory one.
+"""
+
+import sys
+import time
+
+import optuna
+import psutil
+from dask.distributed import Client, LocalCluster
+import dask_optuna
+
+optuna.logging.set_verbosity(optuna.logging.WARN)
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    y = trial.suggest_uniform("y", -10, 10)
+    return (x - 2) ** 2 + (y + 3) ** 2
+
+
+def optimize(storage, study_name, n_trials):
+    study = optuna.load_study(study_name=study_name, storage=storage)
+    study.optimize(objective, n_trials=n_trials)
+
+
+def cpu_time(dask_scheduler=None):
+    times = psutil.Process().cpu_times()
+    return times.user + times.system
+
+
+def run(client, workers, url=None, n_trials=1000, **kwargs):
+    storage = dask_optuna.DaskStorage(url, **kwargs)
+    study = optuna.create_study(storage=storage)
+    start_cpu = client.run_on_scheduler(cpu_time)
+    start = time.perf_counter()
+    futures = [
+        client.submit(
+            optimize,
+            storage,
+            study.study_name,
+            n_trials // len(workers),
+            workers=[worker],
+            pure=False,
+        )
+        for worker in workers
+    ]
+    client.gather(futures)
+    elapsed = time.perf_counter() - start
+    cpu = client.run_on_scheduler(cpu_time) - start_cpu
+
+    hosted = ", ".join(f"{k}={v is not False}" for k, v in kwargs.items())
+    print(
+        f"{hosted or 'scheduler':<12}  "
+        f"wall time = {elapsed:6.2f} s  "
+        f"scheduler CPU time = {cpu:6.2f} s  "
+        f"({100 * cpu / elapsed:5.1f}% of one core)"
+    )
+
+
+if __name__ == "__main__":
+
+    with LocalCluster(n_workers=5, threads_per_worker=1) as cluster:
+        with Client(cluster) as client:
+            print(f"Dask dashboard is available at {client.dashboard_link}")
+            actor_worker, *workers = client.scheduler_info()["workers"]
+            url = sys.argv[1] if len(sys.argv) > 1 else None
+            run(client, workers, url)
+            run(client, workers, url, sidecar=True)
+            run(client, workers, url, actor=actor_worker)
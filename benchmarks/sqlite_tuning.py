@@ -0,0 +1,84 @@
+"""
+Benchmark trials per second for a SQLite ``DaskStorage`` hosted on the
+scheduler, with SQLAlchemy's default engine settings and with
+``sqlite_tuning`` (WAL, ``synchronous`` level, a single writer connection and
+group commit), and for an in-memory ``DaskStorage`` persisted to SQLite in the
+background (``persist``).
+
+Workers each run a single task which calls ``study.optimize`` on a cheap
+objective, so throughput is bound by the storage. Each run uses a fresh
+database file.
+"""
+
+import os
+import tempfile
+import time
+
+import optuna
+from dask.distributed import Client, LocalCluster
+import dask_optuna
+
+optuna.logging.set_verbosity(optuna.logging.WARN)
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    y = trial.suggest_uniform("y", -10, 10)
+    return (x - 2) ** 2 + (y + 3) ** 2
+
+
+def optimize(storage, study_name, n_trials):
+    study = optuna.load_study(study_name=study_name, storage=storage)
+    study.optimize(objective, n_trials=n_trials)
+
+
+def run(client, workers, label, n_trials=400, persist=False, **kwargs):
+    with tempfile.TemporaryDirectory() as directory:
+        url = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+        if persist:
+            storage = dask_optuna.DaskStorage(persist=url, **kwargs)
+        else:
+            storage = dask_optuna.DaskStorage(url, **kwargs)
+        study = optuna.create_study(storage=storage)
+        start = time.perf_counter()
+        futures = [
+            client.submit(
+                optimize,
+                storage,
+                study.study_name,
+                n_trials // len(workers),
+                workers=[worker],
+                pure=False,
+            )
+            for worker in workers
+        ]
+        client.gather(futures)
+        elapsed = time.perf_counter() - start
+        storage.close()
+    print(
+        f"{label:<32}  wall time = {elapsed:6.2f} s  "
+        f"{n_trials / elapsed:7.1f} trials/s"
+    )
+
+
+if __name__ == "__main__":
+
+    with LocalCluster(n_workers=4, threads_per_worker=1) as cluster:
+        with Client(cluster) as client:
+            workers = list(client.scheduler_info()["workers"])
+            run(client, workers, "default engine")
+            run(client, workers, "default engine, offload", offload=True)
+            run(
+                client,
+                workers,
+                "tuned, synchronous=FULL",
+                sqlite_tuning={"synchronous": "FULL", "group_commit": 0},
+            )
+            run(
+                client,
+                workers,
+                "tuned, synchronous=NORMAL",
+                sqlite_tuning={"group_commit": 0},
+            )
+            run(client, workers, "tuned, group commit 10ms", sqlite_tuning=True)
+            run(client, workers, "in-memory, persisted", persist=True)
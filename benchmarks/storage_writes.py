@@ -0,0 +1,80 @@
+"""
+Benchmark trials per second written directly to the Optuna storages which
+``OptunaSchedulerExtension`` can host, without Dask: in-memory, SQLite with
+default and tuned engine settings, in-memory persisted to SQLite in the
+background (``HybridStorage``), and the append-only ``JournalStorage``.
+
+Also measures how long a ``JournalStorage`` takes to recover its trials by
+replaying the journal, and by loading a snapshot after compaction.
+"""
+
+import os
+import tempfile
+import time
+
+import optuna
+from dask_optuna import HybridStorage, JournalStorage
+from dask_optuna.sqlite import tuned_sqlite_storage
+from dask_optuna.storage import _close_base_storage
+
+optuna.logging.set_verbosity(optuna.logging.WARN)
+
+N_TRIALS = 1000
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    y = trial.suggest_uniform("y", -10, 10)
+    return (x - 2) ** 2 + (y + 3) ** 2
+
+
+def run(label, make_storage):
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_storage(directory)
+        study = optuna.create_study(
+            storage=storage, sampler=optuna.samplers.RandomSampler()
+        )
+        start = time.perf_counter()
+        study.optimize(objective, n_trials=N_TRIALS)
+        elapsed = time.perf_counter() - start
+        _close_base_storage(storage)
+    print(f"{label:<28}  {N_TRIALS / elapsed:8.1f} trials/s")
+
+
+def recovery():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "optuna.journal")
+        storage = JournalStorage(path, compact_after=10**9)
+        study = optuna.create_study(
+            storage=storage, sampler=optuna.samplers.RandomSampler()
+        )
+        study.optimize(objective, n_trials=N_TRIALS)
+        storage.close()
+        for label in ["replaying journal", "loading snapshot"]:
+            start = time.perf_counter()
+            storage = JournalStorage(path)
+            elapsed = time.perf_counter() - start
+            assert len(storage.get_all_trials(study._study_id)) == N_TRIALS
+            print(f"recovery, {label:<18}  {elapsed * 1000:8.1f} ms")
+            storage.compact()
+            storage.close()
+
+
+def sqlite_url(directory):
+    return f"sqlite:///{os.path.join(directory, 'optuna.db')}"
+
+
+if __name__ == "__main__":
+    run("in-memory", lambda d: optuna.storages.InMemoryStorage())
+    run("SQLite, default engine", lambda d: optuna.storages.get_storage(sqlite_url(d)))
+    run("SQLite, tuned", lambda d: tuned_sqlite_storage(sqlite_url(d)))
+    run("hybrid, persisted to SQLite", lambda d: HybridStorage(sqlite_url(d)))
+    run(
+        "journal",
+        lambda d: JournalStorage(os.path.join(d, "optuna.journal")),
+    )
+    run(
+        "journal, fsync every write",
+        lambda d: JournalStorage(os.path.join(d, "optuna.journal"), sync_interval=0),
+    )
+    recovery()
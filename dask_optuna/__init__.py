@@ -1,4 +1,8 @@
-from .storage import DaskStorage, OptunaSchedulerExtension
+from .storage import DaskStorage, OptunaSchedulerExtension, OptunaStorageActor
+from .sharding import ShardedDaskStorage
+from .sidecar import StorageSidecar
+from .hybrid import HybridStorage
+from .journal import JournalStorage
 
 from ._version import get_versions
 
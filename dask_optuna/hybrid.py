@@ -0,0 +1,430 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Union
+import uuid
+
+import optuna
+from optuna.distributions import BaseDistribution
+from optuna import study
+from optuna.storages._base import DEFAULT_STUDY_NAME_PREFIX
+from optuna.trial import FrozenTrial
+from optuna.trial import TrialState
+
+from dask.utils import parse_timedelta
+
+from .sqlite import deferred_commits
+from .storage import _close_base_storage, use_basestorage_doc
+
+logger = logging.getLogger(__name__)
+
+
+def _unpickle_in_memory(storage):
+    return storage
+
+
+class MemoryBackedStorage(optuna.storages.BaseStorage):
+    """Base class for Optuna storages which serve all calls from memory
+
+    Calls are served by an ``InMemoryStorage`` in ``_primary``. Subclasses
+    implement ``_write``, which makes each change to ``_primary`` and records
+    it elsewhere, e.g. ``HybridStorage`` or ``JournalStorage``.
+
+    Pickling the storage (e.g. to send it to a client) makes a copy of the
+    in-memory storage only.
+    """
+
+    def __reduce__(self):
+        return (_unpickle_in_memory, (self._primary,))
+
+    def _write(self, method, *args, **kwargs):
+        """Call ``method`` on the in-memory storage and record the change"""
+        raise NotImplementedError
+
+    # Basic study manipulation
+
+    @use_basestorage_doc
+    def create_new_study(self, study_name: Optional[str] = None) -> int:
+        if study_name is None:
+            # Named here so that recorded changes name the same study
+            study_name = DEFAULT_STUDY_NAME_PREFIX + str(uuid.uuid4())
+        return self._write("create_new_study", study_name)
+
+    @use_basestorage_doc
+    def delete_study(self, study_id: int) -> None:
+        return self._write("delete_study", study_id)
+
+    @use_basestorage_doc
+    def set_study_user_attr(self, study_id: int, key: str, value: Any) -> None:
+        return self._write("set_study_user_attr", study_id, key, value)
+
+    @use_basestorage_doc
+    def set_study_system_attr(self, study_id: int, key: str, value: Any) -> None:
+        return self._write("set_study_system_attr", study_id, key, value)
+
+    @use_basestorage_doc
+    def set_study_direction(
+        self, study_id: int, direction: study.StudyDirection
+    ) -> None:
+        return self._write("set_study_direction", study_id, direction)
+
+    # Basic study access
+
+    @use_basestorage_doc
+    def get_study_id_from_name(self, study_name: str) -> int:
+        return self._primary.get_study_id_from_name(study_name)
+
+    @use_basestorage_doc
+    def get_study_id_from_trial_id(self, trial_id: int) -> int:
+        return self._primary.get_study_id_from_trial_id(trial_id)
+
+    @use_basestorage_doc
+    def get_study_name_from_id(self, study_id: int) -> str:
+        return self._primary.get_study_name_from_id(study_id)
+
+    @use_basestorage_doc
+    def get_study_direction(self, study_id: int) -> study.StudyDirection:
+        return self._primary.get_study_direction(study_id)
+
+    @use_basestorage_doc
+    def get_study_user_attrs(self, study_id: int) -> Dict[str, Any]:
+        return self._primary.get_study_user_attrs(study_id)
+
+    @use_basestorage_doc
+    def get_study_system_attrs(self, study_id: int) -> Dict[str, Any]:
+        return self._primary.get_study_system_attrs(study_id)
+
+    @use_basestorage_doc
+    def get_all_study_summaries(self) -> List[study.StudySummary]:
+        return self._primary.get_all_study_summaries()
+
+    # Basic trial manipulation
+
+    @use_basestorage_doc
+    def create_new_trial(
+        self, study_id: int, template_trial: Optional[FrozenTrial] = None
+    ) -> int:
+        return self._write("create_new_trial", study_id, template_trial=template_trial)
+
+    @use_basestorage_doc
+    def set_trial_state(self, trial_id: int, state: TrialState) -> bool:
+        return self._write("set_trial_state", trial_id, state)
+
+    @use_basestorage_doc
+    def set_trial_param(
+        self,
+        trial_id: int,
+        param_name: str,
+        param_value_internal: float,
+        distribution: BaseDistribution,
+    ) -> None:
+        return self._write(
+            "set_trial_param", trial_id, param_name, param_value_internal, distribution
+        )
+
+    @use_basestorage_doc
+    def get_trial_number_from_id(self, trial_id: int) -> int:
+        return self._primary.get_trial_number_from_id(trial_id)
+
+    @use_basestorage_doc
+    def get_trial_param(self, trial_id: int, param_name: str) -> float:
+        return self._primary.get_trial_param(trial_id, param_name)
+
+    @use_basestorage_doc
+    def set_trial_value(self, trial_id: int, value: float) -> None:
+        return self._write("set_trial_value", trial_id, value)
+
+    @use_basestorage_doc
+    def set_trial_intermediate_value(
+        self, trial_id: int, step: int, intermediate_value: float
+    ) -> None:
+        return self._write(
+            "set_trial_intermediate_value", trial_id, step, intermediate_value
+        )
+
+    @use_basestorage_doc
+    def set_trial_user_attr(self, trial_id: int, key: str, value: Any) -> None:
+        return self._write("set_trial_user_attr", trial_id, key, value)
+
+    @use_basestorage_doc
+    def set_trial_system_attr(self, trial_id: int, key: str, value: Any) -> None:
+        return self._write("set_trial_system_attr", trial_id, key, value)
+
+    # Basic trial access
+
+    @use_basestorage_doc
+    def get_trial(self, trial_id: int) -> FrozenTrial:
+        return self._primary.get_trial(trial_id)
+
+    @use_basestorage_doc
+    def get_all_trials(self, study_id: int, deepcopy: bool = True) -> List[FrozenTrial]:
+        return self._primary.get_all_trials(study_id, deepcopy=deepcopy)
+
+    @use_basestorage_doc
+    def get_best_trial(self, study_id: int) -> FrozenTrial:
+        return self._primary.get_best_trial(study_id)
+
+    @use_basestorage_doc
+    def get_n_trials(self, study_id: int, state: Optional[TrialState] = None) -> int:
+        return self._primary.get_n_trials(study_id, state)
+
+    @use_basestorage_doc
+    def read_trials_from_remote_storage(self, study_id: int) -> None:
+        return self._primary.read_trials_from_remote_storage(study_id)
+
+
+class HybridStorage(MemoryBackedStorage):
+    """In-memory Optuna storage which persists its changes in the background
+
+    All calls are served by an in-memory storage. Changes are queued and
+    written to a persistent storage (e.g. ``"sqlite:///example.db"``) in
+    batches by a background thread every ``flush_interval``, so writes have
+    in-memory latency while the persistent copy trails behind by at most
+    ``flush_interval`` or ``max_unpersisted_writes`` writes. When created, the
+    in-memory storage is loaded from the persistent storage, so a restarted
+    storage picks up where the last one's persisted changes left off.
+
+    Within a batch, all the changes to a trial created in that batch are
+    persisted with a single ``create_new_trial`` call with the trial as its
+    template. Other changes are persisted in the order they were made. If
+    persisting fails, the batch's remaining changes are kept and retried
+    with the next batch. A change which fails ``max_persist_attempts`` times
+    in a row (e.g. one which always fails) is logged and dropped, along with
+    the queued changes which depend on it.
+
+    Study and trial IDs are those of the in-memory storage and may differ
+    from the IDs in the persistent storage.
+
+    Parameters
+    ----------
+    url
+        Optuna storage class or url for the persistent storage, e.g.
+        ``"sqlite:///example.db"``.
+    flush_interval
+        Time (e.g. ``"1s"`` or a number of seconds) between writes to the
+        persistent storage. Defaults to ``"1s"``.
+    max_unpersisted_writes
+        Maximum number of changes which may be waiting to be persisted, and so
+        be lost if the process dies. A change which would go over this waits
+        for the queued changes to be persisted first. If they can't be
+        persisted, it raises ``StorageInternalError`` until a later flush
+        succeeds. Defaults to ``1000``.
+    max_persist_attempts
+        Number of batches in a row in which a change may fail to be persisted
+        before it's dropped. Defaults to ``3``.
+    """
+
+    def __init__(
+        self,
+        url: Union[str, optuna.storages.BaseStorage],
+        flush_interval: Union[str, float] = "1s",
+        max_unpersisted_writes: int = 1000,
+        max_persist_attempts: int = 3,
+    ):
+        self.flush_interval = parse_timedelta(flush_interval)
+        self.max_unpersisted_writes = max_unpersisted_writes
+        self.max_persist_attempts = max_persist_attempts
+        self._primary = optuna.storages.InMemoryStorage()
+        self._persistent = optuna.storages.get_storage(url)
+        # In-memory study/trial ID -> persistent study/trial ID
+        self._study_ids = {}
+        self._trial_ids = {}
+        # Changes which haven't been persisted yet, as (method, args) tuples
+        self._pending = []
+        # Change at the start of ``_pending`` which the last batch failed to
+        # persist, and the number of batches in a row which failed on it
+        self._failed_change = None
+        self._failed_attempts = 0
+        # Orders changes in ``_pending`` the same way as in the in-memory storage
+        self._lock = threading.Lock()
+        # Held while persisting, so batches are persisted one at a time and in order
+        self._persist_lock = threading.Lock()
+        self._load()
+        self._remove_session()
+        self._closed = threading.Event()
+        self._persister = threading.Thread(
+            target=self._persist_periodically, name="optuna-persist", daemon=True
+        )
+        self._persister.start()
+
+    def _load(self):
+        """Copy the studies in the persistent storage into the in-memory storage"""
+        for summary in self._persistent.get_all_study_summaries():
+            study_id = self._primary.create_new_study(summary.study_name)
+            self._study_ids[study_id] = summary._study_id
+            if summary.direction != study.StudyDirection.NOT_SET:
+                self._primary.set_study_direction(study_id, summary.direction)
+            for key, value in summary.user_attrs.items():
+                self._primary.set_study_user_attr(study_id, key, value)
+            for key, value in summary.system_attrs.items():
+                self._primary.set_study_system_attr(study_id, key, value)
+            for trial in self._persistent.get_all_trials(
+                summary._study_id, deepcopy=False
+            ):
+                trial_id = self._primary.create_new_trial(
+                    study_id, template_trial=trial
+                )
+                self._trial_ids[trial_id] = trial._trial_id
+
+    def _write(self, method, *args, **kwargs):
+        # Queues the change to be persisted
+        while True:
+            with self._lock:
+                n_pending = len(self._pending)
+                if n_pending < self.max_unpersisted_writes:
+                    result = getattr(self._primary, method)(*args, **kwargs)
+                    if method == "set_trial_state" and not result:
+                        # The trial was already running, so nothing changed
+                        return result
+                    if method.startswith("create_new_"):
+                        args = (result,) + args
+                    self._pending.append((method, args, kwargs))
+                    return result
+            if self._failed_change is not None:
+                # Left to the background thread to retry
+                raise optuna.exceptions.StorageInternalError(
+                    f"{n_pending} changes are waiting to be persisted, which failed"
+                )
+            # Checked again afterwards, since other writers may fill the queue
+            self.flush()
+
+    def flush(self) -> None:
+        """Persist all queued changes"""
+        with self._persist_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                # Trials created in this batch are persisted as they are now
+                templates = {}
+                for method, args, _ in pending:
+                    if method == "create_new_trial":
+                        try:
+                            templates[args[0]] = self._primary.get_trial(args[0])
+                        except KeyError:
+                            # Its study was deleted since
+                            templates[args[0]] = None
+            try:
+                failed = len(pending)
+                # Index in ``pending`` of the first change in each group commit
+                # of a persistent ``tuned_sqlite_storage``, which the batch's
+                # changes share instead of each waiting for their own
+                groups = {}
+                with deferred_commits() as commits:
+                    for i, (method, args, kwargs) in enumerate(pending):
+                        n_commits = len(commits)
+                        try:
+                            self._persist(method, args, kwargs, templates)
+                        except Exception:
+                            logger.exception(
+                                "Failed to persist %s, retrying with the next batch",
+                                method,
+                            )
+                            failed = i
+                            break
+                        for commit in commits[n_commits:]:
+                            groups.setdefault(commit, i)
+                for commit, i in groups.items():
+                    try:
+                        commit.result()
+                    except Exception:
+                        logger.exception(
+                            "Failed to commit %s, retrying with the next batch",
+                            pending[i][0],
+                        )
+                        failed = min(failed, i)
+                        break
+                remaining = pending[failed:]
+                if not remaining:
+                    self._failed_change = None
+                elif self._failed_again(remaining[0]):
+                    remaining = self._drop_failed(remaining)
+                with self._lock:
+                    self._pending[:0] = self._remaining(remaining, templates)
+            finally:
+                self._remove_session()
+
+    def _remove_session(self):
+        """Release this thread's database connection, see ``RDBStorage.remove_session``
+
+        Otherwise, SQLite connections may be closed by whichever thread garbage
+        collects them, which SQLite doesn't allow.
+        """
+        # RDB storages are wrapped in a _CachedStorage, which doesn't pass this on
+        getattr(self._persistent, "_backend", self._persistent).remove_session()
+
+    def _failed_again(self, change):
+        """Count a failure to persist ``change``, whether it should be dropped"""
+        if change is self._failed_change:
+            self._failed_attempts += 1
+        else:
+            self._failed_change = change
+            self._failed_attempts = 1
+        return self._failed_attempts >= self.max_persist_attempts
+
+    def _drop_failed(self, pending):
+        """``pending`` without its first change and the changes which depend on it"""
+        method, args, _ = pending[0]
+        logger.error(
+            "Dropping %s%r, which failed to be persisted %d times",
+            method,
+            args,
+            self._failed_attempts,
+        )
+        self._failed_change = None
+        self._failed_attempts = 0
+        study_ids = {args[0]} if method == "create_new_study" else set()
+        trial_ids = {args[0]} if method == "create_new_trial" else set()
+        remaining = []
+        for change in pending[1:]:
+            method, args, _ = change
+            if method == "create_new_trial":
+                dropped = args[1] in study_ids
+                if dropped:
+                    trial_ids.add(args[0])
+            elif method.startswith("set_trial_"):
+                dropped = args[0] in trial_ids
+            else:
+                dropped = method != "create_new_study" and args[0] in study_ids
+            if not dropped:
+                remaining.append(change)
+        return remaining
+
+    def _remaining(self, pending, templates):
+        """Changes in ``pending`` which are still needed once ``templates`` are dropped"""
+        remaining = []
+        for change in pending:
+            method, args, _ = change
+            if not method.startswith("set_trial_") or args[0] not in templates:
+                remaining.append(change)
+        return remaining
+
+    def _persist(self, method, args, kwargs, templates):
+        """Make the change from a call to ``method`` to the persistent storage"""
+        if method == "create_new_study":
+            study_id, study_name = args
+            self._study_ids[study_id] = self._persistent.create_new_study(study_name)
+        elif method == "create_new_trial":
+            trial_id, study_id = args[:2]
+            template = templates[trial_id]
+            if template is not None:
+                self._trial_ids[trial_id] = self._persistent.create_new_trial(
+                    self._study_ids[study_id], template_trial=template
+                )
+        elif method == "delete_study":
+            self._persistent.delete_study(self._study_ids.pop(args[0]))
+        elif method.startswith("set_study_"):
+            getattr(self._persistent, method)(self._study_ids[args[0]], *args[1:])
+        elif args[0] not in templates:
+            # Changes to trials created in this batch are part of their template
+            getattr(self._persistent, method)(
+                self._trial_ids[args[0]], *args[1:], **kwargs
+            )
+
+    def _persist_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Persist all queued changes and stop persisting in the background"""
+        self._closed.set()
+        self._persister.join()
+        self.flush()
+        _close_base_storage(self._persistent)
@@ -0,0 +1,314 @@
+import copy
+import os
+import pickle
+import struct
+import threading
+from typing import Union
+from urllib.parse import parse_qsl, urlsplit
+import zlib
+
+import optuna
+
+from dask.utils import parse_timedelta
+
+from .hybrid import MemoryBackedStorage
+
+# Methods recorded in the journal, a record's opcode is the method's index
+_METHODS = [
+    "create_new_study",
+    "delete_study",
+    "set_study_user_attr",
+    "set_study_system_attr",
+    "set_study_direction",
+    "create_new_trial",
+    "set_trial_state",
+    "set_trial_param",
+    "set_trial_value",
+    "set_trial_intermediate_value",
+    "set_trial_user_attr",
+    "set_trial_system_attr",
+]
+_OPCODES = {method: opcode for opcode, method in enumerate(_METHODS)}
+
+# Magic bytes, format version and generation at the start of each file
+_JOURNAL_HEADER = struct.Struct("!4sBQ")
+_SNAPSHOT_HEADER = struct.Struct("!4sBQ")
+_JOURNAL_MAGIC = b"OPTJ"
+_SNAPSHOT_MAGIC = b"OPTS"
+_VERSION = 1
+# Payload length, opcode and CRC-32 of the opcode and payload
+_RECORD_HEADER = struct.Struct("!IBI")
+
+
+def _encode_record(method, args):
+    payload = pickle.dumps(args, protocol=pickle.HIGHEST_PROTOCOL)
+    opcode = _OPCODES[method]
+    crc = zlib.crc32(payload, zlib.crc32(bytes([opcode])))
+    return _RECORD_HEADER.pack(len(payload), opcode, crc) + payload
+
+
+def _read_records(file):
+    """Yield ``(method, args)`` for each complete record in ``file``
+
+    Stops at the first incomplete or corrupt record, e.g. a record which was
+    only partly written when the process died, and leaves ``file`` positioned
+    at its start.
+    """
+    while True:
+        start = file.tell()
+        header = file.read(_RECORD_HEADER.size)
+        if len(header) < _RECORD_HEADER.size:
+            file.seek(start)
+            return
+        size, opcode, crc = _RECORD_HEADER.unpack(header)
+        payload = file.read(size)
+        if (
+            len(payload) < size
+            or opcode >= len(_METHODS)
+            or zlib.crc32(payload, zlib.crc32(bytes([opcode]))) != crc
+        ):
+            file.seek(start)
+            return
+        yield _METHODS[opcode], pickle.loads(payload)
+
+
+def _fsync_directory(path):
+    """Persist renames of files in the directory containing ``path``"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _replace(path, *chunks):
+    """Atomically replace the file at ``path`` with ``chunks``"""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as file:
+        for chunk in chunks:
+            file.write(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+    _fsync_directory(path)
+
+
+class JournalStorage(MemoryBackedStorage):
+    """In-memory Optuna storage which appends its changes to a journal file
+
+    All calls are served by an in-memory storage. Every change to it (e.g.
+    creating a trial or setting one of its parameters) is appended to the
+    journal at ``path`` as a small binary record: the call's arguments, a
+    method code, and a checksum. Values which the call generates are recorded
+    along with them, so replaying the journal gives the same trials: a new
+    trial is recorded as its own template, including its start time, and a
+    state change records the time at which the trial finished. Appends are
+    buffered and written to disk (``fsync``) in batches every
+    ``sync_interval``, so changes from that long may be lost if the process or
+    machine dies.
+
+    When created, the in-memory storage is rebuilt from the latest snapshot
+    (at ``path + ".snapshot"``) and the changes appended to the journal since
+    then. A partly written record at the end of the journal is dropped. Once
+    ``compact_after`` records have been appended, a new snapshot of the whole
+    storage is written and the journal is truncated, which bounds how much
+    has to be replayed. Changes wait while a snapshot is taken.
+
+    Only one process should use a journal at a time.
+
+    Parameters
+    ----------
+    path
+        Path of the journal file. It's created if it doesn't exist.
+    sync_interval
+        Time (e.g. ``"100ms"`` or a number of seconds) between writes of the
+        journal to disk. Set to ``0`` to write every change to disk before
+        it's acknowledged. Defaults to ``"100ms"``.
+    compact_after
+        Number of records appended to the journal after which it's compacted
+        into a new snapshot. Defaults to ``10000``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sync_interval: Union[str, float] = "100ms",
+        compact_after: int = 10000,
+    ):
+        self.path = path
+        self.snapshot_path = f"{path}.snapshot"
+        self.sync_interval = parse_timedelta(sync_interval)
+        self.compact_after = compact_after
+        # Orders records in the journal the same way as changes in memory
+        self._lock = threading.Lock()
+        self._primary, self._generation = self._load_snapshot()
+        self._n_records = self._replay()
+        self._unsynced = False
+        self._closed = threading.Event()
+        self._syncer = None
+        if self.sync_interval:
+            self._syncer = threading.Thread(
+                target=self._sync_periodically, name="optuna-journal", daemon=True
+            )
+            self._syncer.start()
+
+    @classmethod
+    def from_url(cls, url: str) -> "JournalStorage":
+        """Journal storage for a URL like ``"journal:///path/to/file?sync_interval=1s"``
+
+        Query parameters are passed on as keyword arguments.
+        """
+        parts = urlsplit(url)
+        if parts.scheme != "journal":
+            raise ValueError(f"Expected a journal:// URL, got {url!r}")
+        kwargs = dict(parse_qsl(parts.query))
+        if "compact_after" in kwargs:
+            kwargs["compact_after"] = int(kwargs["compact_after"])
+        return cls(parts.netloc + parts.path, **kwargs)
+
+    def _load_snapshot(self):
+        """In-memory storage and generation of the latest snapshot"""
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                header = file.read(_SNAPSHOT_HEADER.size)
+                magic, version, generation = _SNAPSHOT_HEADER.unpack(header)
+                if magic != _SNAPSHOT_MAGIC or version != _VERSION:
+                    raise ValueError(f"{self.snapshot_path} isn't a journal snapshot")
+                return pickle.load(file), generation
+        except FileNotFoundError:
+            return optuna.storages.InMemoryStorage(), 0
+
+    def _replay(self):
+        """Apply the journal's changes since the snapshot and open it for appends
+
+        Returns the number of records in the journal.
+        """
+        try:
+            file = open(self.path, "r+b")
+        except FileNotFoundError:
+            self._new_journal()
+            return 0
+
+        n_records = 0
+        current = False
+        with file:
+            header = file.read(_JOURNAL_HEADER.size)
+            if len(header) == _JOURNAL_HEADER.size:
+                magic, version, generation = _JOURNAL_HEADER.unpack(header)
+                if magic != _JOURNAL_MAGIC or version != _VERSION:
+                    raise ValueError(f"{self.path} isn't a journal")
+                if generation > self._generation:
+                    raise ValueError(f"The snapshot for {self.path} is missing")
+                current = generation == self._generation
+            if current:
+                for method, args in _read_records(file):
+                    self._apply(method, args)
+                    n_records += 1
+                # Drop anything after the last complete record
+                file.truncate()
+        if current:
+            self._file = open(self.path, "ab")
+        else:
+            # Empty, or from before the latest snapshot, which has its changes
+            self._new_journal()
+        return n_records
+
+    def _apply(self, method, args):
+        """Make the change from a record to the in-memory storage, see ``_record_args``"""
+        if method == "set_trial_state":
+            trial_id, state, datetime_complete = args
+            self._primary.set_trial_state(trial_id, state)
+            if datetime_complete is not None:
+                # The time at which the trial originally finished, not now
+                with self._primary._lock:
+                    trial = copy.copy(self._primary._get_trial(trial_id))
+                    trial.datetime_complete = datetime_complete
+                    self._primary._set_trial(trial_id, trial)
+        else:
+            getattr(self._primary, method)(*args)
+
+    def _record_args(self, method, args, kwargs, result):
+        """Arguments for the record of a change, which reproduce its result when replayed"""
+        if method == "create_new_trial":
+            # The trial as it was created, e.g. with its start time
+            return (args[0], self._primary.get_trial(result))
+        if method == "set_trial_state":
+            trial = self._primary.get_trial(args[0])
+            return args + (trial.datetime_complete,)
+        return args + tuple(kwargs.values())
+
+    def _new_journal(self):
+        """Start an empty journal for the current generation"""
+        _replace(
+            self.path,
+            _JOURNAL_HEADER.pack(_JOURNAL_MAGIC, _VERSION, self._generation),
+        )
+        self._file = open(self.path, "ab")
+
+    def _write(self, method, *args, **kwargs):
+        # Appends the change to the journal
+        with self._lock:
+            if self._file is None:
+                raise RuntimeError(f"Journal storage at {self.path} is closed")
+            result = getattr(self._primary, method)(*args, **kwargs)
+            if method == "set_trial_state" and not result:
+                # The trial was already running, so nothing changed
+                return result
+            args = self._record_args(method, args, kwargs, result)
+            self._file.write(_encode_record(method, args))
+            self._n_records += 1
+            self._unsynced = True
+            if not self.sync_interval:
+                self._sync_and_compact()
+        return result
+
+    def _sync(self):
+        """Write appended records to disk, must be called with ``_lock`` held"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = False
+
+    def _sync_periodically(self):
+        while not self._closed.wait(self.sync_interval):
+            self.sync()
+
+    def sync(self) -> None:
+        """Write appended records to disk, and compact the journal if it's due"""
+        with self._lock:
+            if self._file is not None:
+                self._sync_and_compact()
+
+    def _sync_and_compact(self):
+        if self._unsynced:
+            self._sync()
+        if self._n_records >= self.compact_after:
+            self._compact()
+
+    def compact(self) -> None:
+        """Write a snapshot of the storage and truncate the journal"""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        state = pickle.dumps(self._primary, protocol=pickle.HIGHEST_PROTOCOL)
+        self._sync()
+        self._file.close()
+        self._generation += 1
+        header = _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _VERSION, self._generation)
+        # The journal is only replayed on top of a snapshot of the same
+        # generation, so a crash between these two leaves a usable pair
+        _replace(self.snapshot_path, header, state)
+        self._new_journal()
+        self._n_records = 0
+
+    def close(self) -> None:
+        """Write appended records to disk and close the journal"""
+        self._closed.set()
+        if self._syncer is not None:
+            self._syncer.join()
+        with self._lock:
+            if self._file is None:
+                return
+            self._sync()
+            self._file.close()
+            self._file = None
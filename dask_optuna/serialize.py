@@ -1,5 +1,8 @@
 import datetime
+import threading
+import uuid
 
+import numpy as np
 from optuna.study import StudySummary, StudyDirection
 from optuna.trial import FrozenTrial, TrialState
 from optuna.distributions import distribution_to_json, json_to_distribution
@@ -17,7 +20,7 @@ def deserialize_datetime(obj):
     return obj
 
 
-def serialize_frozentrial(trial):
+def serialize_frozentrial(trial, table=None):
     data = trial.__dict__.copy()
     data["state"] = data["state"].name
     for attr in [
@@ -30,15 +33,24 @@ def serialize_frozentrial(trial):
         "datetime_start",
     ]:
         data[attr] = data.pop(f"_{attr}")
-    data["distributions"] = {
-        k: distribution_to_json(v) for k, v in data["distributions"].items()
-    }
+    if table is None:
+        data["distributions"] = {
+            k: distribution_to_json(v) for k, v in data["distributions"].items()
+        }
+    else:
+        # Reuse the JSON for distributions we've already seen
+        data["distributions"] = {
+            k: table.json[table.intern(v)] for k, v in data["distributions"].items()
+        }
     data["datetime_start"] = serialize_datetime(data["datetime_start"])
     data["datetime_complete"] = serialize_datetime(data["datetime_complete"])
     return data
 
 
 def deserialize_frozentrial(data):
+    # Don't modify the input, it may be shared (e.g. with the scheduler's cache
+    # of serialized trials when using in-process comms)
+    data = data.copy()
     data["state"] = getattr(TrialState, data["state"])
     data["distributions"] = {
         k: json_to_distribution(v) for k, v in data["distributions"].items()
@@ -54,16 +66,20 @@ def deserialize_frozentrial(data):
 def serialize_studysummary(summary):
     data = summary.__dict__.copy()
     data["study_id"] = data.pop("_study_id")
-    data["best_trial"] = serialize_frozentrial(data["best_trial"])
+    if data["best_trial"] is not None:
+        data["best_trial"] = serialize_frozentrial(data["best_trial"])
     data["datetime_start"] = serialize_datetime(data["datetime_start"])
-    data["direction"] = data["direction"]["name"]
+    data["direction"] = data["direction"].name
     return data
 
 
 def deserialize_studysummary(data):
+    data = data.copy()
     data["direction"] = getattr(StudyDirection, data["direction"])
-    data["best_trial"] = deserialize_frozentrial(data["best_trial"])
-    data["datetime_start"] = deserialize_datetime(data["datetime_start"])
+    if data["best_trial"] is not None:
+        data["best_trial"] = deserialize_frozentrial(data["best_trial"])
+    if data["datetime_start"] is not None:
+        data["datetime_start"] = deserialize_datetime(data["datetime_start"])
     summary = StudySummary(**data)
     return summary
 
@@ -74,3 +90,345 @@ def serialize_studydirection(direction):
 
 def deserialize_studydirection(data):
     return getattr(StudyDirection, data)
+
+
+class DistributionTable:
+    """Append-only table which assigns small integer IDs to distributions
+
+    The scheduler keeps a table for each study so trials and ``set_trial_param``
+    calls can reference distributions by ID instead of sending them as JSON.
+    Clients keep a copy of the table which they extend with the entries sent
+    along with trials. ``token`` identifies the table, so a client holding IDs
+    from a different table (e.g. from before the scheduler was restarted) can
+    tell its copy is out of date.
+    """
+
+    def __init__(self, token=None):
+        # Used from both the scheduler's event loop and storage executor threads
+        self._lock = threading.Lock()
+        self._reset(token or uuid.uuid4().hex)
+
+    def _reset(self, token):
+        self.token = token
+        self.distributions = []
+        self.json = []
+        self.ids = {}
+        self._json_ids = {}
+
+    def __len__(self):
+        return len(self.distributions)
+
+    def intern(self, distribution):
+        """ID for ``distribution``, adding it to the table if needed"""
+        i = self.ids.get(distribution)
+        if i is None:
+            with self._lock:
+                i = self.ids.get(distribution)
+                if i is None:
+                    i = self._append(distribution, distribution_to_json(distribution))
+        return i
+
+    def intern_json(self, data):
+        """ID for the JSON-serialized distribution ``data``, parsing it at most once"""
+        i = self._json_ids.get(data)
+        if i is None:
+            i = self.intern(json_to_distribution(data))
+            self._json_ids[data] = i
+        return i
+
+    def _append(self, distribution, data):
+        i = len(self.distributions)
+        self.json.append(data)
+        self._json_ids[data] = i
+        self.ids[distribution] = i
+        # Append last, readers use len(self.distributions) to see which IDs exist
+        self.distributions.append(distribution)
+        return i
+
+    def since(self, known=None):
+        """Entries a client with a copy of the table described by ``known`` is missing
+
+        ``known`` is the ``(token, length)`` of the client's copy, if it has one.
+        Returns the index of the first missing entry and the missing entries.
+        """
+        start = 0
+        if known is not None and known[0] == self.token:
+            start = known[1]
+        end = len(self.distributions)
+        return start, self.json[start:end]
+
+    @property
+    def known(self):
+        return (self.token, len(self))
+
+    def update(self, token, start, data):
+        """Add entries sent by the scheduler, see ``since``"""
+        with self._lock:
+            if token != self.token:
+                self._reset(token)
+            for i, d in enumerate(data, start=start):
+                if i == len(self.distributions):
+                    self._append(json_to_distribution(d), d)
+
+
+# Fields of a trial which can be selected with ``project_frozentrial``
+TRIAL_FIELDS = (
+    "trial_id",
+    "number",
+    "state",
+    "value",
+    "datetime_start",
+    "datetime_complete",
+    "params",
+    "distributions",
+    "user_attrs",
+    "system_attrs",
+    "intermediate_values",
+)
+
+
+def project_frozentrial(trial, fields, table=None):
+    """Serialize only ``fields`` of ``trial``, in the same form as ``serialize_frozentrial``"""
+    data = {}
+    for field in fields:
+        if field == "trial_id":
+            data[field] = trial._trial_id
+        elif field == "state":
+            data[field] = trial.state.name
+        elif field in ("datetime_start", "datetime_complete"):
+            data[field] = serialize_datetime(getattr(trial, field))
+        elif field == "distributions":
+            if table is None:
+                data[field] = {
+                    k: distribution_to_json(v) for k, v in trial.distributions.items()
+                }
+            else:
+                data[field] = {
+                    k: table.json[table.intern(v)]
+                    for k, v in trial.distributions.items()
+                }
+        elif field in TRIAL_FIELDS:
+            data[field] = getattr(trial, field)
+        else:
+            raise ValueError(f"Unknown trial field {field!r}")
+    return data
+
+
+def deserialize_projection(data):
+    """Inverse of ``project_frozentrial``"""
+    data = data.copy()
+    if "state" in data:
+        data["state"] = getattr(TrialState, data["state"])
+    if "distributions" in data:
+        data["distributions"] = {
+            k: json_to_distribution(v) for k, v in data["distributions"].items()
+        }
+    for field in ("datetime_start", "datetime_complete"):
+        if data.get(field) is not None:
+            data[field] = deserialize_datetime(data[field])
+    return data
+
+
+# Wire formats for sending trials between the scheduler and clients, from
+# oldest to newest. Clients use the newest format the scheduler supports.
+#
+# - "dict": a list with a dictionary per trial (see ``serialize_frozentrial``)
+# - "compact": a positional tuple per trial with timestamps as seconds since
+#   the epoch, states sent as their integer value, and distributions sent as
+#   IDs from the study's ``DistributionTable``
+WIRE_FORMATS = ("dict", "compact")
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def serialize_timestamp(obj):
+    if obj is None:
+        return None
+    # Naive datetimes, so avoid datetime.timestamp() and its local timezone handling
+    return (obj - _EPOCH).total_seconds()
+
+
+def deserialize_timestamp(data):
+    if data is None:
+        return None
+    return _EPOCH + datetime.timedelta(seconds=data)
+
+
+def compact_frozentrial(trial, table):
+    return (
+        trial._trial_id,
+        trial.number,
+        trial.state.value,
+        trial.value,
+        serialize_timestamp(trial.datetime_start),
+        serialize_timestamp(trial.datetime_complete),
+        trial.params,
+        {name: table.intern(d) for name, d in trial.distributions.items()},
+        trial.user_attrs,
+        trial.system_attrs,
+        trial.intermediate_values,
+    )
+
+
+# Serializers for a single trial in each wire format. Each is called with the
+# trial and the ``DistributionTable`` for the trial's study.
+TRIAL_SERIALIZERS = {"dict": serialize_frozentrial, "compact": compact_frozentrial}
+
+
+def encode_frozentrials(records, wire_format="dict", table=None, known=None):
+    """Build the message for trials serialized with ``TRIAL_SERIALIZERS[wire_format]``
+
+    For the compact format, ``table`` is the ``DistributionTable`` the trials were
+    serialized with and ``known`` describes the client's copy of it (see
+    ``DistributionTable.since``).
+    """
+    if wire_format == "dict":
+        return list(records)
+    start, distributions = table.since(known)
+    return {
+        "token": table.token,
+        "start": start,
+        "distributions": distributions,
+        "trials": list(records),
+    }
+
+
+def decode_frozentrials(data, wire_format="dict", table=None):
+    """Inverse of ``encode_frozentrials``
+
+    For the compact format, ``table`` is the client's copy of the
+    ``DistributionTable`` for the trials' study. It's updated with the
+    entries in the message.
+    """
+    if wire_format == "dict":
+        return [deserialize_frozentrial(t) for t in data]
+    if table is None:
+        table = DistributionTable()
+    table.update(data["token"], data["start"], data["distributions"])
+    distributions = table.distributions
+    trials = []
+    for (
+        trial_id,
+        number,
+        state,
+        value,
+        datetime_start,
+        datetime_complete,
+        params,
+        distribution_ids,
+        user_attrs,
+        system_attrs,
+        intermediate_values,
+    ) in data["trials"]:
+        trials.append(
+            FrozenTrial(
+                number=number,
+                state=TrialState(state),
+                value=value,
+                datetime_start=deserialize_timestamp(datetime_start),
+                datetime_complete=deserialize_timestamp(datetime_complete),
+                params=dict(params),
+                distributions={
+                    name: distributions[i] for name, i in distribution_ids.items()
+                },
+                user_attrs=dict(user_attrs),
+                system_attrs=dict(system_attrs),
+                intermediate_values=dict(intermediate_values),
+                trial_id=trial_id,
+            )
+        )
+    return trials
+
+
+def serialize_studysummaries(summaries, wire_format="dict"):
+    if wire_format == "dict":
+        return [serialize_studysummary(s) for s in summaries]
+    # Best trials come from different studies, so use a table just for this message
+    table = DistributionTable()
+    best_trials = encode_frozentrials(
+        [compact_frozentrial(s.best_trial, table) for s in summaries if s.best_trial],
+        wire_format,
+        table,
+    )
+    return {
+        "best_trials": best_trials,
+        "summaries": [
+            (
+                s._study_id,
+                s.study_name,
+                s.direction.value,
+                s.best_trial is not None,
+                s.user_attrs,
+                s.system_attrs,
+                s.n_trials,
+                serialize_timestamp(s.datetime_start),
+            )
+            for s in summaries
+        ],
+    }
+
+
+def deserialize_studysummaries(data, wire_format="dict"):
+    if wire_format == "dict":
+        return [deserialize_studysummary(s) for s in data]
+    best_trials = iter(decode_frozentrials(data["best_trials"], wire_format))
+    return [
+        StudySummary(
+            study_name=study_name,
+            direction=StudyDirection(direction),
+            best_trial=next(best_trials) if has_best_trial else None,
+            user_attrs=user_attrs,
+            system_attrs=system_attrs,
+            n_trials=n_trials,
+            datetime_start=deserialize_timestamp(datetime_start),
+            study_id=study_id,
+        )
+        for (
+            study_id,
+            study_name,
+            direction,
+            has_best_trial,
+            user_attrs,
+            system_attrs,
+            n_trials,
+            datetime_start,
+        ) in data["summaries"]
+    ]
+
+
+def columnar_frozentrials(trials, params=None):
+    """Build a column of NumPy values for each field of ``trials``
+
+    ``params`` are the names of the parameters to include, in their internal
+    representation. By default every parameter set in any of the trials is
+    included. Missing values and parameters are NaN, and missing timestamps
+    are NaT.
+    """
+    if params is None:
+        params = {}
+        for trial in trials:
+            params.update(dict.fromkeys(trial.distributions))
+    n = len(trials)
+    columns = {
+        "trial_id": np.empty(n, dtype=np.int64),
+        "number": np.empty(n, dtype=np.int64),
+        "state": np.empty(n, dtype=np.int8),
+        "value": np.full(n, np.nan),
+        "datetime_start": np.full(n, np.datetime64("NaT"), dtype="datetime64[us]"),
+        "datetime_complete": np.full(n, np.datetime64("NaT"), dtype="datetime64[us]"),
+        "params": {name: np.full(n, np.nan) for name in params},
+    }
+    for i, trial in enumerate(trials):
+        columns["trial_id"][i] = trial._trial_id
+        columns["number"][i] = trial.number
+        columns["state"][i] = trial.state.value
+        if trial.value is not None:
+            columns["value"][i] = trial.value
+        for field in ("datetime_start", "datetime_complete"):
+            if getattr(trial, field) is not None:
+                columns[field][i] = getattr(trial, field)
+        for name, column in columns["params"].items():
+            if name in trial.params:
+                distribution = trial.distributions[name]
+                column[i] = distribution.to_internal_repr(trial.params[name])
+    return columns
@@ -0,0 +1,318 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+import copy
+from typing import Any, Dict, List, Optional, Sequence, Union
+import uuid
+import zlib
+
+import optuna
+from optuna.distributions import BaseDistribution
+from optuna import study
+from optuna.storages._base import DEFAULT_STUDY_NAME_PREFIX
+from optuna.trial import FrozenTrial
+from optuna.trial import TrialState
+
+from distributed import Client
+from distributed.worker import get_client
+
+from .storage import DaskStorage, use_basestorage_doc
+
+
+class ShardedDaskStorage(optuna.storages.BaseStorage):
+    """Optuna storage which partitions studies across several ``DaskStorage`` shards
+
+    Each shard is a separate ``DaskStorage`` with its own underlying storage,
+    hosted on its own actor (or, with ``actor=False``, as its own storage on
+    the scheduler), so traffic for many concurrent studies is spread across
+    several hosts instead of going through a single storage object.
+
+    A study is placed on the shard given by a hash of its name. Study and trial
+    IDs handed out by this storage encode the shard they live on (``local_id *
+    n_shards + shard``), so clients route every call without asking anyone
+    where a study lives. ``get_all_study_summaries`` asks every shard and
+    merges the results.
+
+    Parameters
+    ----------
+    storages
+        Optuna storage class or url to use for the underlying storage of each
+        shard (e.g. ``["sqlite:///shard-0.db", "sqlite:///shard-1.db"]``). Each
+        shard needs its own underlying storage. Defaults to an in-memory
+        storage for each of ``n_shards`` shards.
+    n_shards
+        Number of in-memory shards to use if ``storages`` isn't provided.
+        Defaults to ``4``.
+    name
+        Unique identifier for the sharded storage. Shard ``i`` is a
+        ``DaskStorage`` named ``f"{name}-shard-{i}"``. If not provided, a
+        random name will be generated.
+    client
+        Dask ``Client`` to connect to. If not provided, will attempt to find an
+        existing ``Client``.
+    actor
+        Where to host the shards. Either ``True`` to host each shard on an actor
+        on a worker picked by the scheduler, a list with the address of the
+        worker for each shard, or ``False`` to host them all on the scheduler.
+        Defaults to ``True``.
+    **kwargs
+        Additional keyword arguments (e.g. ``offload`` or ``write_behind``) are
+        passed to the ``DaskStorage`` of every shard.
+    """
+
+    def __init__(
+        self,
+        storages: Optional[Sequence] = None,
+        n_shards: int = 4,
+        name: str = None,
+        client: Client = None,
+        actor: Union[bool, List[str]] = True,
+        **kwargs,
+    ):
+        self.name = name or f"dask-sharded-storage-{uuid.uuid4().hex}"
+        client = client or get_client()
+        if storages is None:
+            storages = [None] * n_shards
+        if isinstance(actor, bool):
+            actor = [actor] * len(storages)
+        if len(actor) != len(storages):
+            raise ValueError(
+                f"Got {len(actor)} actor workers for {len(storages)} shards"
+            )
+        self.shards = [
+            DaskStorage(
+                storage,
+                name=f"{self.name}-shard-{i}",
+                client=client,
+                actor=shard_actor,
+                **kwargs,
+            )
+            for i, (storage, shard_actor) in enumerate(zip(storages, actor))
+        ]
+
+    def __await__(self):
+        async def _():
+            for shard in self.shards:
+                await shard
+            return self
+
+        return _().__await__()
+
+    @property
+    def n_shards(self) -> int:
+        return len(self.shards)
+
+    def _shard_for_name(self, study_name):
+        """Index of the shard for the study named ``study_name``"""
+        # Not ``hash``, which is salted differently in each process
+        return zlib.crc32(study_name.encode()) % self.n_shards
+
+    def _encode(self, local_id, shard):
+        return local_id * self.n_shards + shard
+
+    def _decode(self, global_id):
+        """Shard and ID within that shard for a study or trial ID"""
+        local_id, shard = divmod(global_id, self.n_shards)
+        return self.shards[shard], local_id
+
+    def _encode_trial(self, trial, shard):
+        # Shallow copy so objects cached by the shard keep their own IDs
+        trial = copy.copy(trial)
+        trial._trial_id = self._encode(trial._trial_id, shard)
+        return trial
+
+    def flush(self) -> None:
+        """Send this thread's buffered writes and queued batch operations for every shard"""
+        for shard in self.shards:
+            shard.flush()
+
+    def close(self) -> None:
+        """Close every shard, see ``DaskStorage.close``"""
+        for shard in self.shards:
+            shard.close()
+
+    @contextmanager
+    def batch(self):
+        """Group storage operations, see ``DaskStorage.batch``"""
+        with ExitStack() as stack:
+            for shard in self.shards:
+                stack.enter_context(shard.batch())
+            yield self
+
+    # Basic study manipulation
+
+    @use_basestorage_doc
+    def create_new_study(self, study_name: Optional[str] = None) -> int:
+        if study_name is None:
+            # Name the study here, since the name decides which shard it's on
+            study_name = DEFAULT_STUDY_NAME_PREFIX + str(uuid.uuid4())
+        shard = self._shard_for_name(study_name)
+        local_id = self.shards[shard].create_new_study(study_name)
+        return self._encode(local_id, shard)
+
+    @use_basestorage_doc
+    def delete_study(self, study_id: int) -> None:
+        storage, local_id = self._decode(study_id)
+        storage.delete_study(local_id)
+
+    @use_basestorage_doc
+    def set_study_user_attr(self, study_id: int, key: str, value: Any) -> None:
+        storage, local_id = self._decode(study_id)
+        return storage.set_study_user_attr(local_id, key, value)
+
+    @use_basestorage_doc
+    def set_study_system_attr(self, study_id: int, key: str, value: Any) -> None:
+        storage, local_id = self._decode(study_id)
+        return storage.set_study_system_attr(local_id, key, value)
+
+    @use_basestorage_doc
+    def set_study_direction(
+        self, study_id: int, direction: study.StudyDirection
+    ) -> None:
+        storage, local_id = self._decode(study_id)
+        return storage.set_study_direction(local_id, direction)
+
+    # Basic study access
+
+    @use_basestorage_doc
+    def get_study_id_from_name(self, study_name: str) -> int:
+        # Not cached, since other processes may delete and recreate the study
+        shard = self._shard_for_name(study_name)
+        local_id = self.shards[shard].get_study_id_from_name(study_name)
+        return self._encode(local_id, shard)
+
+    @use_basestorage_doc
+    def get_study_id_from_trial_id(self, trial_id: int) -> int:
+        storage, local_id = self._decode(trial_id)
+        return self._encode(
+            storage.get_study_id_from_trial_id(local_id), trial_id % self.n_shards
+        )
+
+    @use_basestorage_doc
+    def get_study_name_from_id(self, study_id: int) -> str:
+        storage, local_id = self._decode(study_id)
+        return storage.get_study_name_from_id(local_id)
+
+    @use_basestorage_doc
+    def get_study_direction(self, study_id: int) -> study.StudyDirection:
+        storage, local_id = self._decode(study_id)
+        return storage.get_study_direction(local_id)
+
+    @use_basestorage_doc
+    def get_study_user_attrs(self, study_id: int) -> Dict[str, Any]:
+        storage, local_id = self._decode(study_id)
+        return storage.get_study_user_attrs(local_id)
+
+    @use_basestorage_doc
+    def get_study_system_attrs(self, study_id: int) -> Dict[str, Any]:
+        storage, local_id = self._decode(study_id)
+        return storage.get_study_system_attrs(local_id)
+
+    @use_basestorage_doc
+    def get_all_study_summaries(self) -> List[study.StudySummary]:
+        # Buffered writes are per-thread, so send this thread's before fanning out
+        self.flush()
+        # Shards are independent, so ask all of them at once
+        with ThreadPoolExecutor(max_workers=self.n_shards) as pool:
+            results = list(
+                pool.map(lambda shard: shard.get_all_study_summaries(), self.shards)
+            )
+        summaries = []
+        for shard, shard_summaries in enumerate(results):
+            for summary in shard_summaries:
+                summary._study_id = self._encode(summary._study_id, shard)
+                if summary.best_trial is not None:
+                    summary.best_trial = self._encode_trial(summary.best_trial, shard)
+                summaries.append(summary)
+        return sorted(summaries, key=lambda s: s._study_id)
+
+    # Basic trial manipulation
+
+    @use_basestorage_doc
+    def create_new_trial(
+        self, study_id: int, template_trial: Optional[FrozenTrial] = None
+    ) -> int:
+        storage, local_id = self._decode(study_id)
+        trial_id = storage.create_new_trial(local_id, template_trial=template_trial)
+        return self._encode(trial_id, study_id % self.n_shards)
+
+    @use_basestorage_doc
+    def set_trial_state(self, trial_id: int, state: TrialState) -> bool:
+        storage, local_id = self._decode(trial_id)
+        return storage.set_trial_state(local_id, state)
+
+    @use_basestorage_doc
+    def set_trial_param(
+        self,
+        trial_id: int,
+        param_name: str,
+        param_value_internal: float,
+        distribution: BaseDistribution,
+    ) -> None:
+        storage, local_id = self._decode(trial_id)
+        return storage.set_trial_param(
+            local_id, param_name, param_value_internal, distribution
+        )
+
+    @use_basestorage_doc
+    def get_trial_number_from_id(self, trial_id: int) -> int:
+        storage, local_id = self._decode(trial_id)
+        return storage.get_trial_number_from_id(local_id)
+
+    @use_basestorage_doc
+    def get_trial_param(self, trial_id: int, param_name: str) -> float:
+        storage, local_id = self._decode(trial_id)
+        return storage.get_trial_param(local_id, param_name)
+
+    @use_basestorage_doc
+    def set_trial_value(self, trial_id: int, value: float) -> None:
+        storage, local_id = self._decode(trial_id)
+        return storage.set_trial_value(local_id, value)
+
+    @use_basestorage_doc
+    def set_trial_intermediate_value(
+        self, trial_id: int, step: int, intermediate_value: float
+    ) -> None:
+        storage, local_id = self._decode(trial_id)
+        return storage.set_trial_intermediate_value(local_id, step, intermediate_value)
+
+    @use_basestorage_doc
+    def set_trial_user_attr(self, trial_id: int, key: str, value: Any) -> None:
+        storage, local_id = self._decode(trial_id)
+        return storage.set_trial_user_attr(local_id, key, value)
+
+    @use_basestorage_doc
+    def set_trial_system_attr(self, trial_id: int, key: str, value: Any) -> None:
+        storage, local_id = self._decode(trial_id)
+        return storage.set_trial_system_attr(local_id, key, value)
+
+    # Basic trial access
+
+    @use_basestorage_doc
+    def get_trial(self, trial_id: int) -> FrozenTrial:
+        storage, local_id = self._decode(trial_id)
+        return self._encode_trial(storage.get_trial(local_id), trial_id % self.n_shards)
+
+    @use_basestorage_doc
+    def get_all_trials(self, study_id: int, deepcopy: bool = True) -> List[FrozenTrial]:
+        storage, local_id = self._decode(study_id)
+        return [
+            self._encode_trial(t, study_id % self.n_shards)
+            for t in storage.get_all_trials(local_id, deepcopy=deepcopy)
+        ]
+
+    @use_basestorage_doc
+    def get_best_trial(self, study_id: int) -> FrozenTrial:
+        storage, local_id = self._decode(study_id)
+        return self._encode_trial(
+            storage.get_best_trial(local_id), study_id % self.n_shards
+        )
+
+    @use_basestorage_doc
+    def get_n_trials(self, study_id: int, state: Optional[TrialState] = None) -> int:
+        storage, local_id = self._decode(study_id)
+        return storage.get_n_trials(local_id, state)
+
+    @use_basestorage_doc
+    def read_trials_from_remote_storage(self, study_id: int) -> None:
+        storage, local_id = self._decode(study_id)
+        return storage.read_trials_from_remote_storage(local_id)
@@ -0,0 +1,239 @@
+import asyncio
+import itertools
+import multiprocessing
+import pickle
+import socket
+import struct
+from types import SimpleNamespace
+from typing import Any, Dict, Union
+
+import dask
+from distributed.protocol.serialize import Serialized, serialize
+
+
+def _write_frames(writer, *frames):
+    """Write length-prefixed ``frames`` to an ``asyncio.StreamWriter``"""
+    for frame in frames:
+        writer.write(struct.pack("!Q", len(frame)))
+        writer.write(frame)
+
+
+async def _read_frame(reader):
+    """Read a frame written by ``_write_frames``"""
+    (size,) = struct.unpack("!Q", await reader.readexactly(8))
+    return await reader.readexactly(size)
+
+
+def _write_response(writer, request_id, status, result):
+    """Write a response to the parent, see ``StorageSidecar._receive``"""
+    if status == "OK":
+        # Pickled here so the parent can forward the result to clients as-is
+        header, frames = serialize(result, serializers=("pickle",))
+        frames = [memoryview(frame).cast("B") for frame in frames]
+        message = pickle.dumps((request_id, status, header, len(frames)))
+        _write_frames(writer, message, *frames)
+        return
+    try:
+        message = pickle.dumps((request_id, status, result))
+    except Exception:
+        # The exception couldn't be pickled
+        message = pickle.dumps((request_id, status, RuntimeError(repr(result))))
+    _write_frames(writer, message)
+
+
+async def _handle(writer, host, name, request_id, method, kwargs):
+    from .storage import _unwrap_serialized
+
+    try:
+        if method == "get_base_storage":
+            result = host.extensions["optuna"].storages[name]
+        else:
+            handler = host.handlers[f"optuna_{method}"]
+            result = await handler(None, storage_name=name, **kwargs)
+            result = _unwrap_serialized(result)
+        _write_response(writer, request_id, "OK", result)
+    except Exception as e:
+        _write_response(writer, request_id, "error", e)
+    await writer.drain()
+
+
+async def _serve_requests(
+    sock, storage, name, offload, trial_cache_size, sqlite_tuning, persist
+):
+    # Not imported at module level since ``storage`` imports this module
+    from .storage import register_with_scheduler
+
+    reader, writer = await asyncio.open_unix_connection(sock=sock)
+    # Stands in for the scheduler, like ``OptunaStorageActor``
+    host = SimpleNamespace(handlers={}, extensions={})
+    try:
+        register_with_scheduler(
+            host,
+            storage=storage,
+            name=name,
+            offload=offload,
+            trial_cache_size=trial_cache_size,
+            sqlite_tuning=sqlite_tuning,
+            persist=persist,
+        )
+    except Exception as e:
+        _write_response(writer, None, "error", e)
+        await writer.drain()
+        writer.close()
+        return
+
+    tasks = set()
+    while True:
+        try:
+            request = pickle.loads(await _read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The parent went away
+            break
+        if request is None:
+            break
+        task = asyncio.ensure_future(_handle(writer, host, name, *request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+    # e.g. so a ``persist`` or journal storage writes its queued changes
+    closing = host.extensions["optuna"].remove_storage(name)
+    if closing is not None:
+        await asyncio.wrap_future(closing)
+    writer.close()
+
+
+def _serve(*args):
+    """Entry point of the sidecar process, see ``_serve_requests`` for ``args``"""
+    # A new loop rather than the current one, which a forked process inherits
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_serve_requests(*args))
+    finally:
+        loop.close()
+
+
+class StorageSidecar:
+    """Subprocess which hosts an Optuna storage for ``OptunaSchedulerExtension``
+
+    The storage is served by the same handlers as ``OptunaSchedulerExtension``,
+    which run in the subprocess. The extension forwards each request for the
+    storage over a local socket with ``call``. Results are serialized in the
+    subprocess and passed on to clients without being deserialized, so
+    storage calls and (de)serializing trials don't compete with the scheduler
+    for the GIL.
+
+    The subprocess is a daemon and exits along with the scheduler. It closes
+    the storage before exiting, e.g. so queued changes are persisted.
+    """
+
+    def __init__(
+        self,
+        storage=None,
+        name: str = None,
+        offload: bool = False,
+        trial_cache_size: Union[int, str] = "100 MiB",
+        sqlite_tuning: Union[bool, Dict[str, Any]] = False,
+        persist: Union[str, Dict[str, Any], None] = None,
+    ):
+        self.name = name
+        self._sock, child_sock = socket.socketpair()
+        # Started the same way as worker processes, forking a scheduler with
+        # running threads isn't safe
+        method = dask.config.get("distributed.worker.multiprocessing-method", "spawn")
+        self.process = multiprocessing.get_context(method).Process(
+            target=_serve,
+            args=(
+                child_sock,
+                storage,
+                name,
+                offload,
+                trial_cache_size,
+                sqlite_tuning,
+                persist,
+            ),
+            name=f"optuna-sidecar-{name}",
+            daemon=True,
+        )
+        self.process.start()
+        child_sock.close()
+        self._ids = itertools.count()
+        # request ID -> future for the response
+        self._pending = {}
+        self._writer = None
+        self._error = None
+        self._stopped = False
+
+    async def _receive(self, reader):
+        while True:
+            try:
+                request_id, status, *response = pickle.loads(await _read_frame(reader))
+                if status == "OK":
+                    header, n_frames = response
+                    frames = [await _read_frame(reader) for _ in range(n_frames)]
+                    result = Serialized(header, frames)
+                else:
+                    result = response[0]
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            if request_id is None:
+                # Creating the storage failed
+                self._error = result
+                continue
+            future = self._pending.pop(request_id)
+            if future.done():
+                continue
+            if status == "OK":
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+        if self._error is None:
+            self._error = RuntimeError(f"Storage sidecar for {self.name} exited")
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(self._error)
+        self._pending.clear()
+
+    async def call(self, method: str, kwargs: Dict[str, Any]) -> Serialized:
+        """Call the ``optuna_{method}`` handler with ``kwargs`` in the subprocess
+
+        Returns the serialized result of the call. ``method`` may also be
+        ``"get_base_storage"`` to get the storage itself.
+        """
+        if self._error is not None:
+            raise self._error
+        if self._writer is None:
+            reader, self._writer = await asyncio.open_unix_connection(sock=self._sock)
+            self._receiver = asyncio.ensure_future(self._receive(reader))
+        request_id = next(self._ids)
+        future = self._pending[request_id] = asyncio.get_event_loop().create_future()
+        _write_frames(self._writer, pickle.dumps((request_id, method, kwargs)))
+        return await future
+
+    def stop(self) -> None:
+        """Ask the subprocess to exit once it has answered any outstanding requests"""
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._writer is not None:
+            _write_frames(self._writer, pickle.dumps(None))
+            self._writer.close()
+        else:
+            self._sock.close()
+
+    def join(self, timeout: float = 5) -> None:
+        """Wait for the subprocess to exit, and terminate it after ``timeout`` seconds"""
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    async def close(self, timeout: float = 5) -> None:
+        """Stop the subprocess, see ``stop``, and wait for it to exit
+
+        The subprocess is waited for on a thread, so the event loop isn't blocked.
+        """
+        self.stop()
+        await asyncio.get_event_loop().run_in_executor(None, self.join, timeout)
@@ -0,0 +1,332 @@
+from concurrent.futures import Future
+from contextlib import contextmanager
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, Union
+
+import optuna
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import StaticPool
+
+from dask.utils import parse_timedelta
+
+# Group commits which this thread's committers don't wait for, see ``deferred_commits``
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_commits() -> Iterator[List[Future]]:
+    """Don't wait for group commits in this thread, collect them instead
+
+    Within the block, committing a transaction which wrote to a
+    ``GroupCommitConnection`` returns right away instead of waiting for its
+    group to be committed. The block's value is a list, to which the future
+    of each of these group commits is added. A future's result is ``None``
+    once its group is committed, or the error with which the group was lost.
+
+    This lets a single thread run several transactions which share a group
+    commit, as long as it waits for the futures before acknowledging them.
+    When the block ends, transactions which it left open (e.g. a SQLAlchemy
+    session's) are ended if they haven't written anything, so they don't
+    hold up their connection's group commit.
+    """
+    previous = getattr(_deferred, "commits", None), getattr(
+        _deferred, "connections", None
+    )
+    commits = _deferred.commits = []
+    connections = _deferred.connections = set()
+    try:
+        yield commits
+    finally:
+        _deferred.commits, _deferred.connections = previous
+        for connection in connections:
+            connection._end_idle_transaction()
+
+
+def _new_group():
+    """Future for a group commit, which waiters can't cancel for everyone else"""
+    group = Future()
+    group.set_running_or_notify_cancel()
+    return group
+
+
+class GroupCommitConnection:
+    """``sqlite3`` connection which commits transactions in groups
+
+    Committing a SQLite transaction is the expensive part of a small write,
+    since it has to wait for the write to reach the disk. Instead of committing
+    each transaction, this connection keeps one transaction open and runs the
+    transactions of its callers (e.g. SQLAlchemy) inside it as savepoints.
+    The transaction is committed once its oldest write is ``group_commit``
+    seconds old, either by the next caller to commit or by a background thread,
+    so all of the writes which arrived in that window share a single commit.
+
+    A caller's commit returns once its group is committed, so each write waits
+    for up to ``group_commit``. If the group is lost instead, e.g. because
+    SQLite rolled back the whole transaction after an error or the commit
+    failed, every caller whose writes were in it gets an exception. Writes
+    from one thread only share a commit if they are made within
+    ``deferred_commits``, which hands out the group commits to wait for later.
+
+    Rolling back only undoes the caller's own transaction. Transactions which
+    don't write anything are committed right away if no writes are waiting, so
+    idle connections don't hold on to a read snapshot. A group commit which is
+    due waits for the caller's open transaction to end, but ``flush`` carries
+    a transaction which hasn't written anything on in a new one, and so does
+    the end of a ``deferred_commits`` block.
+
+    Writes waiting for the group commit are visible through this connection,
+    but not to other connections to the database. ``close`` commits them.
+
+    The connection may be used from any thread, but not from several threads
+    at once.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, group_commit: float):
+        # Transactions are managed here rather than by the sqlite3 module
+        connection.isolation_level = None
+        self._connection = connection
+        self._group_commit = group_commit
+        self._condition = threading.Condition()
+        # Whether a caller's transaction (savepoint) is open
+        self._in_savepoint = False
+        # Total number of changes when the caller's transaction started
+        self._changes = 0
+        # Time by which the writes waiting for a group commit must be committed
+        self._deadline = None
+        # Completed once the writes waiting for a group commit are committed or lost
+        self._group = _new_group()
+        self._flusher = None
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        with self._condition:
+            connections = getattr(_deferred, "connections", None)
+            if connections is not None:
+                connections.add(self)
+            if not self._in_savepoint:
+                if not self._connection.in_transaction:
+                    self._connection.execute("BEGIN")
+                self._connection.execute("SAVEPOINT grouped")
+                self._in_savepoint = True
+                self._changes = self._connection.total_changes
+        return self._connection.cursor(*args, **kwargs)
+
+    def commit(self):
+        with self._condition:
+            if not self._in_savepoint:
+                return
+            self._connection.execute("RELEASE grouped")
+            self._in_savepoint = False
+            group = None
+            if self._connection.total_changes != self._changes:
+                group = self._group
+                if self._deadline is None:
+                    self._deadline = time.monotonic() + self._group_commit
+                    self._start_flusher()
+            self._maybe_commit_group()
+            if group is None:
+                return
+            deferred = getattr(_deferred, "commits", None)
+            if deferred is not None:
+                deferred.append(group)
+                return
+            while not group.done():
+                self._condition.wait()
+        group.result()
+
+    def rollback(self):
+        with self._condition:
+            if not self._in_savepoint:
+                return
+            self._in_savepoint = False
+            if self._connection.in_transaction:
+                self._connection.execute("ROLLBACK TO grouped")
+                self._connection.execute("RELEASE grouped")
+            else:
+                # SQLite rolled back the whole transaction after an error,
+                # including the writes waiting for the group commit
+                self._end_group(
+                    sqlite3.OperationalError(
+                        "The transaction was rolled back before its group commit"
+                    )
+                )
+            self._maybe_commit_group()
+
+    def flush(self):
+        """Commit writes which are waiting for the group commit
+
+        If the commit fails, the writes are rolled back and their group is
+        lost, see ``commit``. Like the rest of the connection, this must not
+        be called while another thread uses it.
+        """
+        with self._condition:
+            if self._holds_group():
+                # Committed once the caller's transaction is over
+                return
+            if not self._connection.in_transaction:
+                self._end_group()
+                return
+            if self._in_savepoint:
+                # The caller's transaction hasn't written anything, so it
+                # carries on in a new one rather than holding up the group
+                self._connection.execute("RELEASE grouped")
+            try:
+                self._connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                if self._connection.in_transaction:
+                    self._connection.execute("ROLLBACK")
+                self._end_group(e)
+            else:
+                self._end_group()
+            if self._in_savepoint:
+                self._connection.execute("BEGIN")
+                self._connection.execute("SAVEPOINT grouped")
+                self._changes = self._connection.total_changes
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            if self._in_savepoint:
+                self._connection.execute("ROLLBACK TO grouped")
+                self._connection.execute("RELEASE grouped")
+                self._in_savepoint = False
+            self.flush()
+            self._closed = True
+            self._condition.notify_all()
+        self._connection.close()
+
+    def _end_idle_transaction(self):
+        """End the caller's transaction if it hasn't written anything, see ``deferred_commits``"""
+        with self._condition:
+            if self._in_savepoint and not self._holds_group():
+                self._connection.execute("RELEASE grouped")
+                self._in_savepoint = False
+                self._maybe_commit_group()
+
+    def _holds_group(self):
+        """Whether the caller's open transaction has writes, so the group has to wait for it"""
+        return self._in_savepoint and self._connection.total_changes != self._changes
+
+    def _end_group(self, error=None):
+        """Complete the group commit of the waiting writes, which were lost if ``error``"""
+        group, self._group = self._group, _new_group()
+        self._deadline = None
+        if error is None:
+            group.set_result(None)
+        else:
+            group.set_exception(error)
+        self._condition.notify_all()
+
+    def _maybe_commit_group(self):
+        """Commit the open transaction if it's due, or has nothing to wait for"""
+        if self._deadline is None or time.monotonic() >= self._deadline:
+            self.flush()
+        else:
+            self._condition.notify_all()
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_when_due, name="optuna-group-commit", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_when_due(self):
+        with self._condition:
+            while not self._closed:
+                if self._deadline is None or self._in_savepoint:
+                    # The next caller to commit takes care of the group. The
+                    # caller's transaction is never ended from this thread,
+                    # since the caller may be using the connection.
+                    self._condition.wait()
+                    continue
+                delay = self._deadline - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                else:
+                    self.flush()
+
+
+class _SingleConnectionPool(StaticPool):
+    """``StaticPool`` which closes its connection when it's disposed"""
+
+    def dispose(self):
+        if "connection" in self.__dict__:
+            self.connection.close()
+            del self.__dict__["connection"]
+
+
+class _Connector:
+    """Picklable ``creator`` for the engine of ``tuned_sqlite_storage``"""
+
+    def __init__(self, database, synchronous, group_commit):
+        self.database = database
+        self.synchronous = synchronous
+        self.group_commit = group_commit
+
+    def __call__(self):
+        connection = sqlite3.connect(self.database, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={self.synchronous}")
+        if not self.group_commit:
+            return connection
+        return GroupCommitConnection(connection, self.group_commit)
+
+
+def tuned_sqlite_storage(
+    url: str,
+    synchronous: str = "NORMAL",
+    group_commit: Union[str, float] = "10ms",
+) -> optuna.storages.BaseStorage:
+    """Optuna storage for a SQLite URL which is tuned for a single writer
+
+    The database uses write-ahead logging (WAL), so readers in other processes
+    don't block writes and commits append to the log instead of rewriting the
+    database. All calls go through a single connection, see
+    ``GroupCommitConnection``. The storage should only be used from one
+    thread at a time, like a storage on a ``OptunaSchedulerExtension``
+    executor. Since each write waits for its group commit, that thread should
+    make its calls within ``deferred_commits`` (as the extension does) for
+    writes to share a commit.
+
+    Parameters
+    ----------
+    url
+        SQLite URL, e.g. ``"sqlite:///example.db"``.
+    synchronous
+        SQLite ``synchronous`` setting. With ``"NORMAL"`` and WAL, commits don't
+        wait for the disk, so a power loss (but not a crash of the process)
+        can lose the most recent commits. Use ``"FULL"`` to wait for the disk
+        on every commit. Defaults to ``"NORMAL"``.
+    group_commit
+        Time (e.g. ``"10ms"`` or a number of seconds) for which writes wait to be
+        committed along with later writes. Set to ``0`` to commit every
+        transaction on its own. Defaults to ``"10ms"``.
+    """
+    url_parts = make_url(url)
+    if url_parts.get_backend_name() != "sqlite":
+        raise ValueError(f"Expected a SQLite URL, got {url!r}")
+    synchronous = synchronous.upper()
+    if synchronous not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+        raise ValueError(
+            f"synchronous must be 'OFF', 'NORMAL', 'FULL' or 'EXTRA', got {synchronous!r}"
+        )
+    connector = _Connector(
+        url_parts.database or ":memory:", synchronous, parse_timedelta(group_commit)
+    )
+    with deferred_commits() as commits:
+        storage = optuna.storages.RDBStorage(
+            url,
+            engine_kwargs={"creator": connector, "poolclass": _SingleConnectionPool},
+        )
+    # Commits the schema now rather than with the first group of writes
+    storage.engine.dispose()
+    for commit in commits:
+        commit.result()
+    return optuna.storages._CachedStorage(storage)
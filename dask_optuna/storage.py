@@ -1,213 +1,1265 @@
 import asyncio
-from typing import Any, Dict, List, Optional
+import copy
+from contextlib import contextmanager
+from collections import Counter, defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple, Union
 import uuid
 
 import optuna
 from optuna.distributions import (
     BaseDistribution,
     distribution_to_json,
-    json_to_distribution,
 )
 from optuna import study
+from optuna.storages import RDBStorage
 from optuna.trial import FrozenTrial
 from optuna.trial import TrialState
 
+from dask.sizeof import sizeof
+from dask.utils import parse_bytes, parse_timedelta
 from distributed import Client
+from distributed.actor import Actor
+from distributed.protocol import to_serialize
+from distributed.pubsub import Sub
+from distributed.comm.inproc import InProc
+from distributed.metrics import time
+from distributed.protocol.serialize import Serialize, deserialize
 from distributed.utils import thread_state
+from tornado.ioloop import PeriodicCallback
 from distributed.worker import get_client
 
 from .serialize import (
-    serialize_frozentrial,
-    deserialize_frozentrial,
-    serialize_studysummary,
-    deserialize_studysummary,
+    DistributionTable,
+    TRIAL_FIELDS,
+    WIRE_FORMATS,
+    columnar_frozentrials,
+    project_frozentrial,
+    deserialize_projection,
+    TRIAL_SERIALIZERS,
+    encode_frozentrials,
+    decode_frozentrials,
+    serialize_studysummaries,
+    deserialize_studysummaries,
     serialize_studydirection,
     deserialize_studydirection,
 )
+from .sidecar import StorageSidecar
+from .sqlite import deferred_commits, tuned_sqlite_storage
+
+logger = logging.getLogger(__name__)
+
+
+class StudyChangeLog:
+    """Version stamps for changes made to the trials of a storage
+
+    Every trial creation or modification bumps a monotonically increasing
+    version counter and stamps the trial with it. Clients keep the latest
+    version they've seen and use ``since`` to find out which trials changed
+    after it. Changes made by other processes to a database are recorded
+    when they're found, see ``OptunaSchedulerExtension._sync_remote_changes``.
+    """
+
+    def __init__(self):
+        # Changes if the log is recreated, so clients holding a watermark
+        # from a previous log know to start over
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        # study_id -> {trial_id: version}, ordered from least to most recently changed
+        self.studies = defaultdict(OrderedDict)
+        # study_id -> version at which the study was last deleted
+        self.resets = {}
+        self.trial_study = {}
+
+    def record(self, study_id, trial_id):
+        self.version += 1
+        trials = self.studies[study_id]
+        trials[trial_id] = self.version
+        trials.move_to_end(trial_id)
+        self.trial_study[trial_id] = study_id
+
+    def reset_study(self, study_id):
+        self.version += 1
+        for trial_id in self.studies.pop(study_id, {}):
+            self.trial_study.pop(trial_id, None)
+        self.resets[study_id] = self.version
+
+    def since(self, study_id, version):
+        """IDs of trials in a study which changed after ``version``
+
+        Returns ``None`` if ``version`` is too old to compute the changes from.
+        """
+        if version is None or version < self.resets.get(study_id, 0):
+            return None
+        trial_ids = []
+        for trial_id, trial_version in reversed(self.studies[study_id].items()):
+            if trial_version <= version:
+                break
+            trial_ids.append(trial_id)
+        return trial_ids[::-1]
+
+
+class BestTrialIndex:
+    """Best completed trial of each study in a storage
+
+    A study is added the first time its best trial is requested, by asking
+    the storage for it. From then on the index is updated with
+    ``trial_completed`` as trials complete, so the storage doesn't have to
+    scan the study's trials again. Trials completed by other processes which
+    write to the same database are added when they're found, see
+    ``OptunaSchedulerExtension._sync_remote_changes``.
+
+    Methods take the storage they should use, and must be called from the
+    context where calls to it are made (see ``OptunaSchedulerExtension._run``).
+    """
+
+    def __init__(self):
+        # study_id -> (trial_id, value), or None if no trials are complete
+        self.best = {}
+        self.directions = {}
+
+    def _direction(self, storage, study_id):
+        direction = self.directions.get(study_id)
+        if direction is None:
+            direction = storage.get_study_direction(study_id)
+            if direction != study.StudyDirection.NOT_SET:
+                self.directions[study_id] = direction
+        return direction
+
+    def trial_completed(self, storage, study_id, trial):
+        if study_id not in self.best:
+            # Not indexed yet, the trial will be found when the study is added
+            return
+        current = self.best[study_id]
+        if current is not None:
+            if self._direction(storage, study_id) == study.StudyDirection.MAXIMIZE:
+                better = trial.value > current[1]
+            else:
+                better = trial.value < current[1]
+            if not better:
+                return
+        self.best[study_id] = (trial._trial_id, trial.value)
+
+    def get(self, storage, study_id):
+        """Best trial in a study, see ``BaseStorage.get_best_trial``"""
+        if study_id not in self.best:
+            try:
+                trial = storage.get_best_trial(study_id)
+            except ValueError:
+                self.best[study_id] = None
+            else:
+                self.best[study_id] = (trial._trial_id, trial.value)
+                return trial
+        current = self.best[study_id]
+        if current is None:
+            raise ValueError("No trials are completed yet.")
+        return storage.get_trial(current[0])
+
+    def reset_study(self, study_id):
+        self.best.pop(study_id, None)
+        self.directions.pop(study_id, None)
+
+
+class TrialCounter:
+    """Number of trials in each state for each study in a storage
+
+    Like ``BestTrialIndex``, a study is added by scanning its trials the first
+    time its trials are counted, and from then on kept up to date with
+    ``set_state`` as trials are created or change state, including by other
+    processes which write to the same database.
+    """
+
+    def __init__(self):
+        # study_id -> {state: number of trials}
+        self.counts = {}
+        # study_id -> {trial_id: state}
+        self.states = {}
+
+    def set_state(self, study_id, trial_id, state):
+        if study_id not in self.counts:
+            return
+        counts = self.counts[study_id]
+        states = self.states[study_id]
+        if trial_id in states:
+            counts[states[trial_id]] -= 1
+        states[trial_id] = state
+        counts[state] += 1
+
+    def get(self, storage, study_id, state=None):
+        """Number of trials in a study, see ``BaseStorage.get_n_trials``"""
+        if study_id not in self.counts:
+            trials = storage.get_all_trials(study_id=study_id, deepcopy=False)
+            self.states[study_id] = {t._trial_id: t.state for t in trials}
+            self.counts[study_id] = Counter(self.states[study_id].values())
+        counts = self.counts[study_id]
+        if state is None:
+            return sum(counts.values())
+        return counts[state]
+
+    def reset_study(self, study_id):
+        self.counts.pop(study_id, None)
+        self.states.pop(study_id, None)
+
+
+class SerializedTrialCache:
+    """LRU cache of serialized finished trials
+
+    Finished trials can't be modified, so their serialized form can be reused
+    across requests. The cache holds at most ``max_bytes`` worth of serialized
+    trials, as estimated by ``dask.sizeof``, and evicts the least recently used
+    trials first.
+    """
+
+    def __init__(self, max_bytes):
+        if isinstance(max_bytes, str):
+            max_bytes = parse_bytes(max_bytes)
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._data = OrderedDict()
+        # Accessed both on the event loop and storage executor threads
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def serialize(self, trial, wire_format="dict", table=None):
+        """Serialize ``trial``, reusing a cached copy if one exists
+
+        ``table`` is the ``DistributionTable`` for the trial's study.
+        """
+        key = (trial._trial_id, wire_format)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key][0]
+        data = TRIAL_SERIALIZERS[wire_format](trial, table)
+        if trial.state.is_finished():
+            self._put(key, data)
+        return data
+
+    def _put(self, key, data):
+        nbytes = sizeof(data)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (data, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key):
+        if key in self._data:
+            _, nbytes = self._data.pop(key)
+            self.nbytes -= nbytes
+
+    def invalidate(self, trial_id):
+        with self._lock:
+            for wire_format in WIRE_FORMATS:
+                self._pop((trial_id, wire_format))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+
+def _freeze(obj):
+    """Hashable version of ``obj``, which may contain lists and dictionaries"""
+    if isinstance(obj, (list, tuple)):
+        return tuple(_freeze(o) for o in obj)
+    if isinstance(obj, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in obj.items()))
+    return obj
+
+
+def _is_rdb_storage(storage):
+    """Whether ``storage`` is an RDB storage, which other processes may also write to"""
+    # RDB storages are usually wrapped in a _CachedStorage
+    return isinstance(getattr(storage, "_backend", storage), RDBStorage)
+
+
+def trials_topic(storage_name):
+    """Name of the pub/sub topic for changes to the trials of a storage"""
+    return f"optuna-trials-{storage_name}"
 
 
 class OptunaSchedulerExtension:
+    """Scheduler extension which hosts Optuna storages for ``DaskStorage``
+
+    Storages are registered by name with ``register_with_scheduler``. Storages
+    registered with ``offload=True`` have all of their method calls (and the
+    serialization of their results) run on a dedicated thread so that slow
+    backends, like SQLite, don't block the scheduler's event loop. Calls for
+    a given storage are still executed one at a time, in the order in which
+    they are received.
+
+    Concurrent identical reads (e.g. every worker fetching a study's trials
+    when an optimization starts) share a single storage call and serialized
+    result, see ``_read``.
+
+    Changes to trials are published on the ``trials_topic`` of their storage
+    for processes which keep a read replica of the trials, see
+    ``_publish_trial_changes``.
+
+    Storages registered with the same URL share a single Optuna storage (and
+    so a single database engine and connection pool) and, when offloaded, a
+    single thread. It's closed once the last of them is removed. They also
+    share the bookkeeping for the storage's trials (e.g. its ``StudyChangeLog``
+    and ``BestTrialIndex``), since a change made through any of them changes
+    the trials seen through all of them, see ``_track_storage``.
+
+    Storages stay registered until they're removed with ``remove_storage``,
+    either explicitly (see ``DaskStorage.close``) or because they were
+    registered with an ``idle_timeout`` and no requests were made for them in
+    that long.
+    """
+
+    # Seconds between checks for idle storages
+    idle_check_interval = 0.5
+    # Seconds for which reads may miss changes made to an RDB storage by other
+    # processes, see ``_sync_remote_changes``
+    remote_sync_interval = 1.0
+
     def __init__(self, scheduler):
         self.scheduler = scheduler
         self.storages = {}
-
+        self.executors = {}
+        self.changes = {}
+        self.trial_caches = {}
+        # storage name -> study_id -> DistributionTable
+        self.distribution_tables = {}
+        self.best_trials = {}
+        self.trial_counts = {}
+        # storage name -> number of writes submitted to the storage
+        self.generations = defaultdict(int)
+        # (storage name, generation, read) -> task computing the read's result
+        self.reads = {}
+        self.sidecars = {}
+        # storage name -> study_id -> version the last published changes go up to
+        self.published = defaultdict(dict)
+        # storage name -> IDs of studies with changes waiting to be published
+        self.unpublished = defaultdict(set)
+        # storage name -> time of the latest request for the storage
+        self.last_used = {}
+        # storage name -> seconds without requests after which it's removed
+        self.idle_timeouts = {}
+        # URL -> Optuna storage shared by the storages registered with the URL,
+        # ("persist", URL) -> HybridStorage shared by storages persisting to the URL
+        self.shared = {}
+        # storage name -> URL (or ("persist", URL)) of its shared Optuna storage
+        self.urls = {}
+        # storage name -> study_id -> {trial_id: trial} as of the last
+        # ``_sync_remote_changes`` for the study
+        self.remote_trials = {}
+        # storage name -> study_id -> time of the study's last ``_sync_remote_changes``
+        self.remote_synced = {}
+
+        handlers = {
+            "optuna_create_new_study": self.create_new_study,
+            "optuna_delete_study": self.delete_study,
+            "optuna_set_study_user_attr": self.set_study_user_attr,
+            "optuna_set_study_system_attr": self.set_study_system_attr,
+            "optuna_set_study_direction": self.set_study_direction,
+            "optuna_get_study_id_from_name": self.get_study_id_from_name,
+            "optuna_get_study_id_from_trial_id": self.get_study_id_from_trial_id,
+            "optuna_get_study_name_from_id": self.get_study_name_from_id,
+            "optuna_read_trials_from_remote_storage": self.read_trials_from_remote_storage,
+            "optuna_get_study_direction": self.get_study_direction,
+            "optuna_get_study_user_attrs": self.get_study_user_attrs,
+            "optuna_get_study_system_attrs": self.get_study_system_attrs,
+            "optuna_get_all_study_summaries": self.get_all_study_summaries,
+            "optuna_create_new_trial": self.create_new_trial,
+            "optuna_set_trial_state": self.set_trial_state,
+            "optuna_set_trial_param": self.set_trial_param,
+            "optuna_get_trial_number_from_id": self.get_trial_number_from_id,
+            "optuna_get_trial_param": self.get_trial_param,
+            "optuna_set_trial_value": self.set_trial_value,
+            "optuna_set_trial_intermediate_value": self.set_trial_intermediate_value,
+            "optuna_set_trial_user_attr": self.set_trial_user_attr,
+            "optuna_set_trial_system_attr": self.set_trial_system_attr,
+            "optuna_get_trial": self.get_trial,
+            "optuna_get_all_trials": self.get_all_trials,
+            "optuna_get_trials_since": self.get_trials_since,
+            "optuna_get_trials_columnar": self.get_trials_columnar,
+            "optuna_get_best_trial": self.get_best_trial,
+            "optuna_query_trials": self.query_trials,
+            "optuna_get_n_trials": self.get_n_trials,
+            "optuna_batch": self.batch,
+            "optuna_wire_formats": self.wire_formats,
+            "optuna_set_trial_intermediate_values": self.set_trial_intermediate_values,
+            "optuna_start_trial": self.start_trial,
+            "optuna_finish_trial": self.finish_trial,
+        }
+        self.scheduler.handlers.update(
+            {
+                name: self._sidecar_or(name, handler)
+                for name, handler in handlers.items()
+            }
+        )
         self.scheduler.handlers.update(
             {
-                "optuna_create_new_study": self.create_new_study,
-                "optuna_delete_study": self.delete_study,
-                "optuna_set_study_user_attr": self.set_study_user_attr,
-                "optuna_set_study_system_attr": self.set_study_system_attr,
-                "optuna_set_study_direction": self.set_study_direction,
-                "optuna_get_study_id_from_name": self.get_study_id_from_name,
-                "optuna_get_study_id_from_trial_id": self.get_study_id_from_trial_id,
-                "optuna_get_study_name_from_id": self.get_study_name_from_id,
-                "optuna_read_trials_from_remote_storage": self.read_trials_from_remote_storage,
-                "optuna_get_study_direction": self.get_study_direction,
-                "optuna_get_study_user_attrs": self.get_study_user_attrs,
-                "optuna_get_study_system_attrs": self.get_study_system_attrs,
-                "optuna_get_all_study_summaries": self.get_all_study_summaries,
-                "optuna_create_new_trial": self.create_new_trial,
-                "optuna_set_trial_state": self.set_trial_state,
-                "optuna_set_trial_param": self.set_trial_param,
-                "optuna_get_trial_number_from_id": self.get_trial_number_from_id,
-                "optuna_get_trial_param": self.get_trial_param,
-                "optuna_set_trial_value": self.set_trial_value,
-                "optuna_set_trial_intermediate_value": self.set_trial_intermediate_value,
-                "optuna_set_trial_user_attr": self.set_trial_user_attr,
-                "optuna_set_trial_system_attr": self.set_trial_system_attr,
-                "optuna_get_trial": self.get_trial,
-                "optuna_get_all_trials": self.get_all_trials,
-                "optuna_get_n_trials": self.get_n_trials,
+                "optuna_close_storage": self.close_storage,
+                "optuna_memory_usage": self.memory_usage,
             }
         )
 
         self.scheduler.extensions["optuna"] = self
 
+    def _sidecar_or(self, name, handler):
+        """Handler which forwards calls for storages hosted in a ``StorageSidecar``
+
+        Calls for other storages go to ``handler``.
+        """
+        method = name.replace("optuna_", "", 1)
+
+        async def _(comm, storage_name: str = None, **kwargs):
+            if storage_name in self.last_used:
+                self.last_used[storage_name] = time()
+            sidecar = self.sidecars.get(storage_name)
+            if sidecar is None:
+                return await handler(comm, storage_name=storage_name, **kwargs)
+            result = await sidecar.call(method, kwargs)
+            if comm is None or isinstance(comm, InProc):
+                # In-process comms don't deserialize results for us
+                return deserialize(result.header, result.frames)
+            return result
+
+        return _
+
+    def teardown(self):
+        # Called synchronously as the scheduler shuts down. Storages are closed
+        # first, e.g. so ``persist`` storages write their queued changes. All
+        # the sidecars are stopped before waiting for any of them, so they exit
+        # in parallel.
+        closing = {name: self.remove_storage(name) for name in list(self.storages)}
+        for name, future in closing.items():
+            try:
+                if future is not None:
+                    future.result()
+            except Exception:
+                logger.exception("Failed to close storage %s", name)
+        for sidecar in self.sidecars.values():
+            sidecar.stop()
+        for sidecar in self.sidecars.values():
+            sidecar.join()
+        self.sidecars.clear()
+
     def get_storage(self, name):
-        return self.storages[name]
+        try:
+            return self.storages[name]
+        except KeyError:
+            raise KeyError(f"No storage named {name!r}, it may have been closed")
+
+    def _acquire_storage(
+        self, name, storage, offload, sqlite_tuning=False, persist=None
+    ):
+        """Optuna storage and executor (if ``offload``) for a new storage
+
+        Storages registered with the same URL share an Optuna storage, and so
+        a single database engine and connection pool, as well as a single
+        executor. Shared storages are reference counted, see ``_release_storage``.
+        The settings of the first storage registered with a URL are used.
+
+        With ``persist``, the storage is a ``HybridStorage`` which persists to
+        the given URL, and is shared by the storages persisting to that URL.
+
+        With ``sqlite_tuning``, the SQLite database is opened with
+        ``tuned_sqlite_storage``. Such storages are always offloaded, so their
+        thread is the database's single writer, and so are ``persist``
+        storages, whose writes may wait for a flush to the persistent storage.
+        """
+        key = storage
+        if persist is not None:
+            if storage is not None:
+                raise ValueError("persist requires an in-memory storage (storage=None)")
+            options = {"url": persist} if isinstance(persist, str) else dict(persist)
+            key = ("persist", options["url"])
+        url = key[1] if isinstance(key, tuple) else key
+        if sqlite_tuning and not isinstance(url, str):
+            raise ValueError("sqlite_tuning requires a SQLite URL for the storage")
+        if not isinstance(url, str):
+            executor = None
+            if offload:
+                # A single thread per storage keeps storage calls serialized and
+                # in the same order as they arrived at the scheduler
+                executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix=f"optuna-{name}"
+                )
+            return optuna.storages.get_storage(storage), executor
+
+        shared = self.shared.get(key)
+        if shared is None:
+            base_storage = url
+            if sqlite_tuning:
+                tuning = {} if sqlite_tuning is True else sqlite_tuning
+                base_storage = tuned_sqlite_storage(url, **tuning)
+            if persist is not None:
+                # Not imported at module level since ``hybrid`` imports this module
+                from .hybrid import HybridStorage
+
+                base_storage = HybridStorage(**{**options, "url": base_storage})
+            shared = self.shared[key] = SimpleNamespace(
+                storage=_open_storage(base_storage),
+                executor=None,
+                names=set(),
+                always_offload=bool(sqlite_tuning) or persist is not None,
+                # Set by ``_track_storage``
+                tracking=None,
+            )
+        offload = offload or shared.always_offload
+        if offload and shared.executor is None:
+            shared.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="optuna-shared"
+            )
+        shared.names.add(name)
+        self.urls[name] = key
+        return shared.storage, shared.executor if offload else None
+
+    def _sharing(self, name):
+        """Names of the storages which share an Optuna storage with ``name``, including itself"""
+        url = self.urls.get(name)
+        if url is None:
+            return [name]
+        return list(self.shared[url].names)
+
+    def _track_storage(self, name, trial_cache_size):
+        """Set up the bookkeeping for the trials of a newly registered storage
+
+        Storages which share an Optuna storage (see ``_acquire_storage``) share
+        a single ``StudyChangeLog``, ``SerializedTrialCache``, distribution
+        tables, ``BestTrialIndex`` and ``TrialCounter``, so changes made through
+        one of them are seen through the others. The ``trial_cache_size`` of
+        the first of them is used.
+        """
+        shared = self.shared.get(self.urls.get(name))
+        tracking = getattr(shared, "tracking", None)
+        if tracking is None:
+            tracking = SimpleNamespace(
+                changes=StudyChangeLog(),
+                trial_cache=SerializedTrialCache(trial_cache_size),
+                distribution_tables=defaultdict(DistributionTable),
+                best_trials=BestTrialIndex(),
+                trial_counts=TrialCounter(),
+                remote_trials={},
+                remote_synced={},
+            )
+            if shared is not None:
+                shared.tracking = tracking
+        self.changes[name] = tracking.changes
+        self.trial_caches[name] = tracking.trial_cache
+        self.distribution_tables[name] = tracking.distribution_tables
+        self.best_trials[name] = tracking.best_trials
+        self.trial_counts[name] = tracking.trial_counts
+        self.remote_trials[name] = tracking.remote_trials
+        self.remote_synced[name] = tracking.remote_synced
+
+    def _release_storage(self, name, storage, executor):
+        """Close a storage's Optuna storage and executor once nothing else uses them
+
+        Returns a ``concurrent.futures.Future`` for the close if it's left to
+        the executor.
+        """
+        url = self.urls.pop(name, None)
+        if url is not None:
+            shared = self.shared[url]
+            shared.names.discard(name)
+            if shared.names:
+                return
+            del self.shared[url]
+            executor = shared.executor
+        if executor is None:
+            _close_base_storage(storage)
+        else:
+            # After any calls which are still queued
+            closing = executor.submit(_close_base_storage, storage)
+            executor.shutdown(wait=False)
+            return closing
+
+    def remove_storage(self, name):
+        """Forget the named storage and everything kept for it, freeing its memory
+
+        Storage calls which are already running are allowed to finish. If the
+        storage is closed in the background, i.e. on its executor or by
+        stopping its sidecar, returns a future which completes once it's closed.
+        """
+        storage = self.storages.pop(name, None)
+        executor = self.executors.pop(name, None)
+        sidecar = self.sidecars.pop(name, None)
+        for state in (
+            self.changes,
+            self.trial_caches,
+            self.distribution_tables,
+            self.best_trials,
+            self.trial_counts,
+            self.remote_trials,
+            self.remote_synced,
+            self.generations,
+            self.published,
+            self.unpublished,
+            self.last_used,
+            self.idle_timeouts,
+        ):
+            state.pop(name, None)
+        closing = None
+        if storage is not None:
+            closing = self._release_storage(name, storage, executor)
+        if sidecar is not None:
+            closing = asyncio.ensure_future(sidecar.close())
+        return closing
+
+    def _start_idle_checks(self):
+        callbacks = getattr(self.scheduler, "periodic_callbacks", None)
+        if callbacks is None or "optuna-idle-storages" in callbacks:
+            # e.g. storages hosted in an actor, which aren't removed when idle
+            return
+        pc = PeriodicCallback(
+            self.remove_idle_storages, self.idle_check_interval * 1000
+        )
+        callbacks["optuna-idle-storages"] = pc
+        pc.start()
+
+    def remove_idle_storages(self):
+        """Remove storages with no requests for longer than their ``idle_timeout``"""
+        now = time()
+        for name, idle_timeout in list(self.idle_timeouts.items()):
+            if now - self.last_used.get(name, now) > idle_timeout:
+                self.remove_storage(name)
+
+    async def close_storage(self, comm, storage_name: str = None) -> None:
+        """Remove a storage, see ``remove_storage``"""
+        closing = self.remove_storage(storage_name)
+        if closing is not None:
+            await asyncio.wrap_future(closing)
+
+    async def memory_usage(
+        self, comm, storage_name: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Estimated memory used by each storage registered here, in bytes
+
+        Only ``storage_name`` is included if it's given.
+
+        ``"storage"`` is an estimate of the memory used by the trials which
+        the underlying Optuna storage holds in memory, i.e. all the trials of
+        an in-memory storage and the trials cached by an RDB storage, see
+        ``_estimate_storage_nbytes``. Storages registered with the same URL
+        share an Optuna storage and ``SerializedTrialCache``, which are only
+        counted once: their sizes are reported for the first of them, while
+        the others report ``0`` and have ``"shared_with"`` set to the name of
+        that storage. ``"trial_cache"`` is the size of the ``SerializedTrialCache``.
+        Storages hosted in a sidecar report the memory used in the sidecar,
+        and have ``"sidecar"`` set. ``"idle"`` is the number of seconds since
+        the last request for the storage, if it has an ``idle_timeout``.
+        """
+        report = {}
+        # id of an Optuna storage -> name of the storage it was reported for
+        counted = {}
+        for name in sorted(self.storages):
+            if storage_name is not None and name != storage_name:
+                continue
+            storage = self.storages.get(name)
+            if storage is None:
+                # Removed in the meantime
+                continue
+            report[name] = {
+                "storage": 0,
+                "trial_cache": self.trial_caches[name].nbytes,
+                "sidecar": False,
+            }
+            if id(storage) in counted:
+                report[name]["trial_cache"] = 0
+                report[name]["shared_with"] = counted[id(storage)]
+                continue
+            counted[id(storage)] = name
+            try:
+                report[name]["storage"] = await self._run(
+                    name, _estimate_storage_nbytes, read_only=True
+                )
+            except KeyError:
+                del report[name]
+        for name, sidecar in list(self.sidecars.items()):
+            if storage_name is not None and name != storage_name:
+                continue
+            result = await sidecar.call("memory_usage", {})
+            report[name] = deserialize(result.header, result.frames)[name]
+            report[name]["sidecar"] = True
+        now = time()
+        for name, last_used in self.last_used.items():
+            if name in report:
+                report[name]["idle"] = now - last_used
+        return report
+
+    async def _run(self, storage_name, func, read_only=False):
+        """Run ``func(storage)`` for the named storage
+
+        ``func`` is called on the storage's executor if the storage was
+        registered with ``offload=True``, otherwise it's called directly on
+        the event loop. Pass ``read_only=True`` if ``func`` doesn't modify the
+        storage.
+
+        On the executor, the result is only returned once ``func``'s writes
+        are committed, without holding up the executor, so calls submitted
+        meanwhile can share their group commit (see ``deferred_commits``).
+        """
+        if not read_only:
+            for name in self._sharing(storage_name):
+                self.generations[name] += 1
+        storage = self.get_storage(storage_name)
+        executor = self.executors.get(storage_name)
+        if executor is None:
+            return func(storage)
+
+        def _(storage):
+            with deferred_commits() as commits:
+                return func(storage), commits
+
+        loop = asyncio.get_event_loop()
+        result, commits = await loop.run_in_executor(executor, _, storage)
+        for commit in commits:
+            await asyncio.wrap_future(commit)
+        return result
+
+    async def _coalesce(self, storage_name, key, func):
+        """Await ``func()``, sharing the result with concurrent calls for the same ``key``
+
+        ``func`` must only read from the named storage, and ``key`` must
+        identify the read and all of its arguments. A call only joins an
+        in-flight read if no writes were submitted to the storage since that
+        read started, so clients still see their own writes.
+        """
+        key = (storage_name, self.generations[storage_name], _freeze(key))
+        task = self.reads.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self.reads[key] = task
+            task.add_done_callback(lambda _: self.reads.pop(key, None))
+        # Don't cancel the read for everyone else if this call is cancelled
+        return await asyncio.shield(task)
+
+    async def _read(self, storage_name, key, func):
+        """Run ``func(storage)``, which only reads from the named storage, see ``_coalesce``"""
+        return await self._coalesce(
+            storage_name, key, lambda: self._run(storage_name, func, read_only=True)
+        )
+
+    async def _call(self, storage_name, method, **kwargs):
+        """Call ``method`` on the named storage with ``kwargs``"""
+        return await self._run(
+            storage_name, lambda storage: getattr(storage, method)(**kwargs)
+        )
+
+    async def _run_trial_update(self, storage_name, trial_id, func):
+        """Run ``func(storage)``, which modifies ``trial_id``, for the named storage
+
+        Same as ``_run``, but also records the change to ``trial_id`` with
+        ``_trial_updated`` once ``func`` has succeeded.
+        """
+
+        def _(storage):
+            result = func(storage)
+            return result, self._trial_study_id(storage_name, storage, trial_id)
+
+        result, study_id = await self._run(storage_name, _)
+        self._trial_updated(storage_name, study_id, trial_id)
+        return result
+
+    def _trial_study_id(self, storage_name, storage, trial_id):
+        """Study ID for ``trial_id``, without a storage call if it's known"""
+        study_id = self.changes[storage_name].trial_study.get(trial_id)
+        if study_id is None:
+            study_id = storage.get_study_id_from_trial_id(trial_id)
+        return study_id
+
+    def _encode_trials(self, storage_name, study_id, trials, wire_format, known):
+        """Serialize ``trials`` from a study into a message for a client
+
+        ``known`` describes the client's copy of the study's
+        ``DistributionTable``, see ``DistributionTable.since``.
+        """
+        cache = self.trial_caches[storage_name]
+        table = self.distribution_tables[storage_name][study_id]
+        message = encode_frozentrials(
+            [cache.serialize(t, wire_format, table) for t in trials],
+            wire_format,
+            table,
+            known,
+        )
+        if wire_format != "dict":
+            message["study_id"] = study_id
+        return message
+
+    def _trial_state_changed(
+        self, storage_name, storage, study_id, trial_id, state, trial=None
+    ):
+        """Bookkeeping for a trial that was created or changed state
+
+        Unlike ``_trial_updated``, this is called from the context where storage
+        calls are made, right after the call which set the trial's state.
+        ``trial`` is the updated trial, if it's already been fetched.
+        """
+        self.trial_counts[storage_name].set_state(study_id, trial_id, state)
+        if state == TrialState.COMPLETE:
+            if trial is None:
+                trial = storage.get_trial(trial_id)
+            self.best_trials[storage_name].trial_completed(storage, study_id, trial)
+
+    async def _call_trial_update(self, storage_name, method, trial_id, **kwargs):
+        """Call a trial-mutating ``method`` on the named storage with ``kwargs``"""
+        return await self._run_trial_update(
+            storage_name,
+            trial_id,
+            lambda storage: getattr(storage, method)(trial_id=trial_id, **kwargs),
+        )
 
-    def create_new_study(
+    def _trial_updated(self, storage_name, study_id, trial_id):
+        """Bookkeeping for a trial that was created or modified
+
+        Always called on the event loop, after the storage call which created
+        or modified the trial has completed.
+        """
+        self.changes[storage_name].record(study_id, trial_id)
+        self.trial_caches[storage_name].invalidate(trial_id)
+        for name in self._sharing(storage_name):
+            self._trial_changes_unpublished(name, study_id)
+
+    def _has_trial_subscribers(self, storage_name):
+        pubsub = self.scheduler.extensions.get("pubsub")
+        if pubsub is None:
+            # e.g. storages hosted in an actor
+            return False
+        topic = trials_topic(storage_name)
+        return bool(
+            pubsub.subscribers.get(topic) or pubsub.client_subscribers.get(topic)
+        )
+
+    def _trial_changes_unpublished(self, storage_name, study_id):
+        """Schedule publishing the latest changes to the trials of a study"""
+        published = self.published[storage_name]
+        if not self._has_trial_subscribers(storage_name):
+            # Nobody could have applied the changes since the last publish
+            published.pop(study_id, None)
+            return
+        if study_id not in published:
+            # Subscribers which synced before the latest change can apply it
+            published[study_id] = self.changes[storage_name].version - 1
+        unpublished = self.unpublished[storage_name]
+        if not unpublished:
+            asyncio.ensure_future(self._publish_trial_changes(storage_name))
+        unpublished.add(study_id)
+
+    async def _publish_trial_changes(self, storage_name):
+        """Publish the changes to trials since they were last published
+
+        Each message is a list with an item for every study with changes, which
+        is a result of ``get_trials_since`` (in the compact wire format) for the
+        ``"since"`` version. Only subscribers whose copy of the study is at
+        least as recent as ``"since"`` can apply it.
+
+        Changes made while a message is being prepared are published in the
+        next message.
+        """
+        changes = self.changes[storage_name]
+        published = self.published[storage_name]
+        while self.unpublished[storage_name]:
+            study_ids = self.unpublished[storage_name]
+            # Leave a placeholder so new changes don't start another publisher
+            self.unpublished[storage_name] = {None}
+            version = changes.version
+            requests = []
+            for study_id in study_ids:
+                since = published.get(study_id)
+                if since is None:
+                    continue
+                requests.append((study_id, since, changes.since(study_id, since)))
+                published[study_id] = version
+
+            def _(storage):
+                messages = []
+                for study_id, since, trial_ids in requests:
+                    if trial_ids is None:
+                        # The study was deleted since it was last published
+                        try:
+                            trials = storage.get_all_trials(study_id, deepcopy=False)
+                        except KeyError:
+                            trials = []
+                    else:
+                        trials = [storage.get_trial(t) for t in trial_ids]
+                    messages.append(
+                        {
+                            "study_id": study_id,
+                            "epoch": changes.epoch,
+                            "since": since,
+                            "version": version,
+                            "full": trial_ids is None,
+                            "wire_format": "compact",
+                            "trials": self._encode_trials(
+                                storage_name, study_id, trials, "compact", None
+                            ),
+                        }
+                    )
+                return messages
+
+            try:
+                messages = await self._run(storage_name, _, read_only=True)
+            finally:
+                self.unpublished[storage_name].discard(None)
+            if messages and storage_name in self.storages:
+                # Messages "from a client" are sent to both client and worker
+                # subscribers, which is what we want
+                self.scheduler.extensions["pubsub"].handle_message(
+                    name=trials_topic(storage_name), msg=messages, client="scheduler"
+                )
+        if storage_name not in self.storages:
+            # Removed while publishing
+            self.published.pop(storage_name, None)
+            self.unpublished.pop(storage_name, None)
+
+    async def create_new_study(
         self, comm, study_name: Optional[str] = None, storage_name: str = None
     ) -> int:
-        return self.get_storage(storage_name).create_new_study(study_name=study_name)
+        return await self._call(storage_name, "create_new_study", study_name=study_name)
+
+    def _study_reset(self, storage_name, study_id):
+        """Bookkeeping for a study that was deleted
+
+        Always called on the event loop, after the study's trials are gone
+        from the storage.
+        """
+        self.changes[storage_name].reset_study(study_id)
+        self.trial_caches[storage_name].clear()
+        self.distribution_tables[storage_name].pop(study_id, None)
+        self.best_trials[storage_name].reset_study(study_id)
+        self.trial_counts[storage_name].reset_study(study_id)
+        self.remote_trials[storage_name].pop(study_id, None)
+        self.remote_synced[storage_name].pop(study_id, None)
+        for name in self._sharing(storage_name):
+            self._trial_changes_unpublished(name, study_id)
+
+    async def _sync_remote_changes(self, storage_name, study_id, max_age=None):
+        """Record changes made to the trials of a study by other processes
+
+        Only RDB storages can be changed by other processes. Their trials
+        are read from the database again (which a ``_CachedStorage`` only does
+        for trials that weren't finished when they were last read) and
+        compared with the trials at the last sync. Trials which were added or
+        changed since are recorded as if they were changed through this
+        extension. If trials are gone, e.g. because the study was deleted and
+        its ID reused, the study is reset like with ``delete_study``.
+
+        This reads all of the study's trials, so it's skipped if the study was
+        synced less than ``max_age`` seconds ago. Defaults to
+        ``remote_sync_interval``, which bounds how long reads served from the
+        extension's bookkeeping (e.g. ``get_n_trials``) may miss other
+        processes' changes.
+        """
+        storage = self.get_storage(storage_name)
+        if not _is_rdb_storage(storage):
+            return
+        if max_age is None:
+            max_age = self.remote_sync_interval
+        remote_synced = self.remote_synced[storage_name]
+        if study_id in remote_synced and time() - remote_synced[study_id] < max_age:
+            return
+        remote_trials = self.remote_trials[storage_name]
+
+        def _(storage):
+            try:
+                storage.read_trials_from_remote_storage(study_id)
+                trials = storage.get_all_trials(study_id, deepcopy=False)
+            except KeyError:
+                trials = []
+            previous = remote_trials.get(study_id, {})
+            current = remote_trials[study_id] = {t._trial_id: t for t in trials}
+            if any(trial_id not in current for trial_id in previous):
+                return True, []
+            # A _CachedStorage keeps the same object for trials which weren't
+            # read again, or which it changed itself
+            changed = [t for t in trials if previous.get(t._trial_id) is not t]
+            for trial in changed:
+                self._trial_state_changed(
+                    storage_name, storage, study_id, trial._trial_id, trial.state, trial
+                )
+            return False, [t._trial_id for t in changed]
 
-    def delete_study(
+        async def sync():
+            synced = time()
+            reset, changed = await self._run(storage_name, _, read_only=True)
+            remote_synced[study_id] = synced
+            if reset:
+                self._study_reset(storage_name, study_id)
+            for trial_id in changed:
+                self._trial_updated(storage_name, study_id, trial_id)
+
+        await self._coalesce(storage_name, ("sync_remote_changes", study_id), sync)
+
+    async def delete_study(
         self, comm, study_id: int = None, storage_name: str = None
     ) -> None:
-        return self.get_storage(storage_name).delete_study(study_id=study_id)
+        result = await self._call(storage_name, "delete_study", study_id=study_id)
+        self._study_reset(storage_name, study_id)
+        return result
 
-    def set_study_user_attr(
+    async def set_study_user_attr(
         self, comm, study_id: int, key: str, value: Any, storage_name: str = None
     ) -> None:
-        return self.get_storage(storage_name).set_study_user_attr(
-            study_id=study_id, key=key, value=value
+        return await self._call(
+            storage_name, "set_study_user_attr", study_id=study_id, key=key, value=value
         )
 
-    def set_study_system_attr(
+    async def set_study_system_attr(
         self, comm, study_id: int, key: str, value: Any, storage_name: str = None
     ) -> None:
-        return self.get_storage(storage_name).set_study_system_attr(
+        return await self._call(
+            storage_name,
+            "set_study_system_attr",
             study_id=study_id,
             key=key,
             value=value,
         )
 
-    def set_study_direction(
+    async def set_study_direction(
         self,
         comm,
         study_id: int,
         direction: study.StudyDirection,
         storage_name: str = None,
     ) -> None:
-        return self.get_storage(storage_name).set_study_direction(
+        return await self._call(
+            storage_name,
+            "set_study_direction",
             study_id=study_id,
             direction=deserialize_studydirection(direction),
         )
 
-    def get_study_id_from_name(
+    async def get_study_id_from_name(
         self, comm, study_name: str, storage_name: str = None
     ) -> int:
-        return self.get_storage(storage_name).get_study_id_from_name(
-            study_name=study_name
+        return await self._call(
+            storage_name, "get_study_id_from_name", study_name=study_name
         )
 
-    def get_study_id_from_trial_id(
+    async def get_study_id_from_trial_id(
         self, comm, trial_id: int, storage_name: str = None
     ) -> int:
-        return self.get_storage(storage_name).get_study_id_from_trial_id(
-            trial_id=trial_id
+        return await self._call(
+            storage_name, "get_study_id_from_trial_id", trial_id=trial_id
         )
 
-    def get_study_name_from_id(
+    async def get_study_name_from_id(
         self, comm, study_id: int, storage_name: str = None
     ) -> str:
-        return self.get_storage(storage_name).get_study_name_from_id(study_id=study_id)
+        return await self._call(
+            storage_name, "get_study_name_from_id", study_id=study_id
+        )
 
-    def get_study_direction(
+    async def get_study_direction(
         self, comm, study_id: int, storage_name: str = None
     ) -> study.StudyDirection:
-        direction = self.get_storage(storage_name).get_study_direction(
-            study_id=study_id
+        direction = await self._call(
+            storage_name, "get_study_direction", study_id=study_id
         )
         return serialize_studydirection(direction)
 
-    def get_study_user_attrs(
+    async def get_study_user_attrs(
         self, comm, study_id: int, storage_name: str = None
     ) -> Dict[str, Any]:
-        return self.get_storage(storage_name).get_study_user_attrs(study_id=study_id)
+        return await self._call(storage_name, "get_study_user_attrs", study_id=study_id)
 
-    def get_study_system_attrs(
+    async def get_study_system_attrs(
         self, comm, study_id: int, storage_name: str = None
     ) -> Dict[str, Any]:
-        return self.get_storage(storage_name).get_study_system_attrs(study_id=study_id)
+        return await self._call(
+            storage_name, "get_study_system_attrs", study_id=study_id
+        )
 
-    def get_all_study_summaries(
-        self, comm, storage_name: str = None
+    async def get_all_study_summaries(
+        self, comm, wire_format: str = "dict", storage_name: str = None
     ) -> List[study.StudySummary]:
-        summaries = self.get_storage(storage_name).get_all_study_summaries()
-        return [serialize_studysummary(s) for s in summaries]
+        def _(storage):
+            summaries = storage.get_all_study_summaries()
+            return serialize_studysummaries(summaries, wire_format)
 
-    def create_new_trial(
+        return await self._read(
+            storage_name, ("get_all_study_summaries", wire_format), _
+        )
+
+    async def create_new_trial(
         self,
         comm,
         study_id: int,
         template_trial: Optional[FrozenTrial] = None,
         storage_name: str = None,
     ) -> int:
-        return self.get_storage(storage_name).create_new_trial(
-            study_id=study_id,
-            template_trial=template_trial,
-        )
+        def _(storage):
+            trial_id = storage.create_new_trial(
+                study_id=study_id, template_trial=template_trial
+            )
+            state = TrialState.RUNNING
+            if template_trial is not None:
+                state = template_trial.state
+            self._trial_state_changed(storage_name, storage, study_id, trial_id, state)
+            return trial_id
+
+        trial_id = await self._run(storage_name, _)
+        self._trial_updated(storage_name, study_id, trial_id)
+        return trial_id
 
-    def set_trial_state(
-        self, comm, trial_id: int, state: TrialState, storage_name: str = None
+    async def start_trial(
+        self,
+        comm,
+        study_id: int,
+        template_trial: Optional[FrozenTrial] = None,
+        storage_name: str = None,
+    ) -> Dict[str, Any]:
+        """Create a new trial and get its ID, number, and any fixed parameters"""
+
+        def _(storage):
+            trial_id = storage.create_new_trial(
+                study_id=study_id, template_trial=template_trial
+            )
+            trial = storage.get_trial(trial_id)
+            self._trial_state_changed(
+                storage_name, storage, study_id, trial_id, trial.state, trial
+            )
+            return {
+                "trial_id": trial_id,
+                "number": trial.number,
+                "fixed_params": trial.system_attrs.get("fixed_params"),
+            }
+
+        info = await self._run(storage_name, _)
+        self._trial_updated(storage_name, study_id, info["trial_id"])
+        return info
+
+    async def finish_trial(
+        self,
+        comm,
+        trial_id: int,
+        value: Optional[float] = None,
+        state: str = "COMPLETE",
+        wire_format: str = "dict",
+        distributions: Optional[List] = None,
+        storage_name: str = None,
+    ) -> Dict[str, Any]:
+        """Set a trial's value and state, then get the finished trial
+
+        Everything happens in a single storage call so other clients never
+        see the trial with its value set but not its state, or vice versa.
+        """
+
+        def _(storage):
+            if value is not None:
+                storage.set_trial_value(trial_id=trial_id, value=value)
+            storage.set_trial_state(trial_id=trial_id, state=getattr(TrialState, state))
+            trial = storage.get_trial(trial_id)
+            study_id = self._trial_study_id(storage_name, storage, trial_id)
+            self._trial_state_changed(
+                storage_name, storage, study_id, trial_id, trial.state, trial
+            )
+            return self._encode_trials(
+                storage_name, study_id, [trial], wire_format, distributions
+            )
+
+        return await self._run_trial_update(storage_name, trial_id, _)
+
+    async def set_trial_state(
+        self,
+        comm,
+        trial_id: int,
+        state: TrialState,
+        value: Optional[float] = None,
+        storage_name: str = None,
     ) -> bool:
-        return self.get_storage(storage_name).set_trial_state(
-            trial_id=trial_id,
-            state=getattr(TrialState, state),
-        )
+        """Set a trial's state, and its value first if ``value`` isn't ``None``
+
+        The value and state are set in a single storage call, like with
+        ``finish_trial``, see ``_merge_trial_writes``.
+        """
+        state = getattr(TrialState, state)
+
+        def _(storage):
+            if value is not None:
+                storage.set_trial_value(trial_id=trial_id, value=value)
+            updated = storage.set_trial_state(trial_id=trial_id, state=state)
+            if updated:
+                study_id = self._trial_study_id(storage_name, storage, trial_id)
+                self._trial_state_changed(
+                    storage_name, storage, study_id, trial_id, state
+                )
+            return updated
 
-    def set_trial_param(
+        return await self._run_trial_update(storage_name, trial_id, _)
+
+    async def set_trial_param(
         self,
         comm,
         trial_id: int,
         param_name: str,
         param_value_internal: float,
-        distribution: BaseDistribution,
+        distribution: Optional[str] = None,
+        distribution_id: Optional[int] = None,
+        distributions_token: Optional[str] = None,
         storage_name: str = None,
     ) -> None:
-        distribution = json_to_distribution(distribution)
-        return self.get_storage(storage_name).set_trial_param(
-            trial_id=trial_id,
-            param_name=param_name,
-            param_value_internal=param_value_internal,
-            distribution=distribution,
-        )
+        """Set a trial parameter
+
+        The distribution is either sent as JSON with ``distribution``, or as
+        ``distribution_id``, its ID in the ``DistributionTable`` identified by
+        ``distributions_token`` for the trial's study.
+        """
+
+        def _(storage):
+            study_id = self._trial_study_id(storage_name, storage, trial_id)
+            table = self.distribution_tables[storage_name][study_id]
+            if distribution_id is None:
+                d = table.distributions[table.intern_json(distribution)]
+            elif distributions_token != table.token or distribution_id >= len(table):
+                raise ValueError(
+                    f"Unknown distribution {distribution_id} for trial {trial_id}"
+                )
+            else:
+                d = table.distributions[distribution_id]
+            return storage.set_trial_param(
+                trial_id=trial_id,
+                param_name=param_name,
+                param_value_internal=param_value_internal,
+                distribution=d,
+            )
+
+        return await self._run_trial_update(storage_name, trial_id, _)
 
-    def get_trial_number_from_id(
+    async def get_trial_number_from_id(
         self, comm, trial_id: int, storage_name: str = None
     ) -> int:
-        return self.get_storage(storage_name).get_trial_number_from_id(
-            trial_id=trial_id
+        return await self._call(
+            storage_name, "get_trial_number_from_id", trial_id=trial_id
         )
 
-    def get_trial_param(
+    async def get_trial_param(
         self, comm, trial_id: int, param_name: str, storage_name: str = None
     ) -> float:
-        return self.get_storage(storage_name).get_trial_param(
+        return await self._call(
+            storage_name,
+            "get_trial_param",
             trial_id=trial_id,
             param_name=param_name,
         )
 
-    def set_trial_value(
+    async def set_trial_value(
         self, comm, trial_id: int, value: float, storage_name: str = None
     ) -> None:
-        return self.get_storage(storage_name).set_trial_value(
+        return await self._call_trial_update(
+            storage_name,
+            "set_trial_value",
             trial_id=trial_id,
             value=value,
         )
 
-    def set_trial_intermediate_value(
+    async def set_trial_intermediate_value(
         self,
         comm,
         trial_id: int,
@@ -215,71 +1267,791 @@ class OptunaSchedulerExtension:
         intermediate_value: float,
         storage_name: str = None,
     ) -> None:
-        return self.get_storage(storage_name).set_trial_intermediate_value(
+        return await self._call_trial_update(
+            storage_name,
+            "set_trial_intermediate_value",
             trial_id=trial_id,
             step=step,
             intermediate_value=intermediate_value,
         )
 
-    def set_trial_user_attr(
+    async def set_trial_user_attr(
         self, comm, trial_id: int, key: str, value: Any, storage_name: str = None
     ) -> None:
-        return self.get_storage(storage_name).set_trial_user_attr(
+        return await self._call_trial_update(
+            storage_name,
+            "set_trial_user_attr",
             trial_id=trial_id,
             key=key,
             value=value,
         )
 
-    def set_trial_system_attr(
+    async def set_trial_system_attr(
         self, comm, trial_id: int, key: str, value: Any, storage_name: str = None
     ) -> None:
-        return self.get_storage(storage_name).set_trial_system_attr(
+        return await self._call_trial_update(
+            storage_name,
+            "set_trial_system_attr",
             trial_id=trial_id,
             key=key,
             value=value,
         )
 
-    def get_trial(self, comm, trial_id: int, storage_name: str = None) -> FrozenTrial:
-        trial = self.get_storage(storage_name).get_trial(trial_id=trial_id)
-        return serialize_frozentrial(trial)
+    async def get_trial(
+        self,
+        comm,
+        trial_id: int,
+        wire_format: str = "dict",
+        distributions: Optional[List] = None,
+        storage_name: str = None,
+    ) -> FrozenTrial:
+        def _(storage):
+            trial = storage.get_trial(trial_id=trial_id)
+            study_id = self._trial_study_id(storage_name, storage, trial_id)
+            message = self._encode_trials(
+                storage_name, study_id, [trial], wire_format, distributions
+            )
+            if wire_format == "dict":
+                return message[0]
+            return message
+
+        return await self._read(
+            storage_name, ("get_trial", trial_id, wire_format, distributions), _
+        )
 
-    def get_all_trials(
-        self, comm, study_id: int, deepcopy: bool = True, storage_name: str = None
+    async def get_all_trials(
+        self,
+        comm,
+        study_id: int,
+        deepcopy: bool = True,
+        wire_format: str = "dict",
+        distributions: Optional[List] = None,
+        storage_name: str = None,
     ) -> List[FrozenTrial]:
-        trials = self.get_storage(storage_name).get_all_trials(
-            study_id=study_id,
-            deepcopy=deepcopy,
+        def _(storage):
+            trials = storage.get_all_trials(study_id=study_id, deepcopy=False)
+            return self._encode_trials(
+                storage_name, study_id, trials, wire_format, distributions
+            )
+
+        return await self._read(
+            storage_name,
+            ("get_all_trials", study_id, wire_format, distributions),
+            _,
+        )
+
+    async def get_trials_since(
+        self,
+        comm,
+        study_id: int,
+        epoch: Optional[str] = None,
+        version: Optional[int] = None,
+        wire_format: str = "dict",
+        distributions: Optional[List] = None,
+        storage_name: str = None,
+    ) -> Dict[str, Any]:
+        """Get the trials in a study which changed after ``version``
+
+        ``epoch`` and ``version`` are the watermark returned by a previous call.
+        If the watermark can't be used (e.g. this is the first call, or the
+        storage or study has since been recreated) every trial in the study is
+        returned and ``"full"`` is ``True`` in the result.
+
+        Trials written to the same database by other processes are found
+        first, at most every ``remote_sync_interval``, see
+        ``_sync_remote_changes``.
+        """
+
+        async def read():
+            await self._sync_remote_changes(storage_name, study_id)
+            changes = self.changes[storage_name]
+            # Take the watermark before reading any trials so that changes which
+            # land while we're reading are sent again on the next call
+            current = changes.version
+            trial_ids = None
+            if epoch == changes.epoch:
+                trial_ids = changes.since(study_id, version)
+
+            def _(storage):
+                if trial_ids is None:
+                    trials = storage.get_all_trials(study_id=study_id, deepcopy=False)
+                else:
+                    trials = [storage.get_trial(trial_id) for trial_id in trial_ids]
+                return self._encode_trials(
+                    storage_name, study_id, trials, wire_format, distributions
+                )
+
+            return {
+                "epoch": changes.epoch,
+                "version": current,
+                "full": trial_ids is None,
+                "wire_format": wire_format,
+                "trials": await self._run(storage_name, _, read_only=True),
+            }
+
+        return await self._coalesce(
+            storage_name,
+            ("get_trials_since", study_id, epoch, version, wire_format, distributions),
+            read,
+        )
+
+    async def get_best_trial(
+        self,
+        comm,
+        study_id: int,
+        wire_format: str = "dict",
+        distributions: Optional[List] = None,
+        storage_name: str = None,
+    ) -> Any:
+        """Get the best trial in a study from the ``BestTrialIndex``
+
+        Trials completed by other processes are added to the index first, at
+        most every ``remote_sync_interval``, see ``_sync_remote_changes``.
+        """
+
+        def _(storage):
+            trial = self.best_trials[storage_name].get(storage, study_id)
+            message = self._encode_trials(
+                storage_name, study_id, [trial], wire_format, distributions
+            )
+            if wire_format == "dict":
+                return message[0]
+            return message
+
+        await self._sync_remote_changes(storage_name, study_id)
+        return await self._read(
+            storage_name, ("get_best_trial", study_id, wire_format, distributions), _
+        )
+
+    async def get_trials_columnar(
+        self,
+        comm,
+        study_id: int,
+        params: Optional[List[str]] = None,
+        states: Optional[List[str]] = None,
+        storage_name: str = None,
+    ) -> Dict[str, Any]:
+        """Get the trials in a study as NumPy arrays, see ``columnar_frozentrials``
+
+        ``states`` are the names of the trial states to include, by default
+        trials in every state are included. The arrays are sent as contiguous
+        buffers rather than msgpack encoded.
+        """
+
+        def _(storage):
+            trials = storage.get_all_trials(study_id=study_id, deepcopy=False)
+            if states is not None:
+                selected = {getattr(TrialState, state) for state in states}
+                trials = [t for t in trials if t.state in selected]
+            columns = columnar_frozentrials(trials, params)
+            columns["params"] = {
+                name: to_serialize(column) for name, column in columns["params"].items()
+            }
+            return {
+                key: column if key == "params" else to_serialize(column)
+                for key, column in columns.items()
+            }
+
+        return await self._read(
+            storage_name, ("get_trials_columnar", study_id, params, states), _
+        )
+
+    async def query_trials(
+        self,
+        comm,
+        study_id: int,
+        states: Optional[List[str]] = None,
+        fields: Optional[List[str]] = None,
+        numbers: Optional[List[Optional[int]]] = None,
+        storage_name: str = None,
+    ) -> List[Dict[str, Any]]:
+        """Get selected fields of the trials in a study which match a filter
+
+        ``states`` are the names of the trial states to include, ``fields`` are
+        the names of the fields to include (see ``TRIAL_FIELDS``), and
+        ``numbers`` is a ``(start, stop)`` range of trial numbers, where either
+        end may be ``None``. The filter and projection are applied before the
+        trials are serialized, see ``project_frozentrial``.
+        """
+        if fields is None:
+            fields = TRIAL_FIELDS
+        start, stop = numbers if numbers is not None else (None, None)
+        selected = None
+        if states is not None:
+            selected = {getattr(TrialState, state) for state in states}
+
+        def _(storage):
+            trials = storage.get_all_trials(study_id=study_id, deepcopy=False)
+            table = self.distribution_tables[storage_name][study_id]
+            return [
+                project_frozentrial(t, fields, table)
+                for t in trials
+                if (selected is None or t.state in selected)
+                and (start is None or t.number >= start)
+                and (stop is None or t.number < stop)
+            ]
+
+        return await self._read(
+            storage_name, ("query_trials", study_id, states, fields, numbers), _
         )
-        return [serialize_frozentrial(t) for t in trials]
 
-    def get_n_trials(
+    async def wire_formats(self, comm, storage_name: str = None) -> List[str]:
+        """Wire formats for trials which this extension supports"""
+        return list(WIRE_FORMATS)
+
+    async def set_trial_intermediate_values(
+        self, comm, values: List = None, storage_name: str = None
+    ) -> Dict[int, str]:
+        """Set many intermediate values, possibly for several trials
+
+        ``values`` is a list of ``(trial_id, step, intermediate_value)`` tuples
+        which are applied in order. A failure for one trial doesn't stop values
+        for other trials from being set. Returns a dictionary which maps the IDs
+        of trials that failed to their error message.
+        """
+        errors = {}
+        for trial_id, step, intermediate_value in values:
+            if trial_id in errors:
+                continue
+            try:
+                await self.set_trial_intermediate_value(
+                    comm,
+                    trial_id=trial_id,
+                    step=step,
+                    intermediate_value=intermediate_value,
+                    storage_name=storage_name,
+                )
+            except Exception as e:
+                errors[trial_id] = f"{type(e).__name__}: {e}"
+        return errors
+
+    async def batch(
+        self, comm, operations: List = None, storage_name: str = None
+    ) -> List[Any]:
+        """Run several storage operations, in order, from a single message
+
+        ``operations`` is a list of ``(method, kwargs)`` pairs, where ``method``
+        is the name of a storage operation's handler without its ``"optuna_"``
+        prefix. Other handlers, e.g. ``close_storage``, raise a ``ValueError``
+        before any operation is run. Returns the list of results. If an
+        operation raises, later operations aren't run.
+        """
+        for method, _ in operations:
+            if method == "batch":
+                raise ValueError("Batches can't be nested")
+            if method not in _BATCH_METHODS:
+                raise ValueError(f"{method!r} can't be run in a batch")
+        results = []
+        for method, kwargs in operations:
+            handler = self.scheduler.handlers[f"optuna_{method}"]
+            result = await handler(comm, storage_name=storage_name, **kwargs)
+            results.append(result)
+        return results
+
+    async def get_n_trials(
         self,
         comm,
         study_id: int,
-        state: Optional[TrialState] = None,
+        state: Optional[str] = None,
         storage_name: str = None,
     ) -> int:
-        return self.get_storage(storage_name).get_n_trials(
-            study_id=study_id,
-            state=state,
+        """Number of trials in a study, from the study's ``TrialCounter``
+
+        Trials created or changed by other processes are counted first, at
+        most every ``remote_sync_interval``, see ``_sync_remote_changes``.
+        """
+        if state is not None:
+            state = getattr(TrialState, state)
+        await self._sync_remote_changes(storage_name, study_id)
+        return await self._read(
+            storage_name,
+            ("get_n_trials", study_id, state),
+            lambda storage: self.trial_counts[storage_name].get(
+                storage, study_id, state
+            ),
         )
 
-    def read_trials_from_remote_storage(
+    async def read_trials_from_remote_storage(
         self, comm, study_id: int, storage_name: str = None
     ) -> None:
-        return self.get_storage(storage_name).read_trials_from_remote_storage(
-            study_id=study_id
+        """Read the trials in a study which other processes may have changed
+
+        Changes found in a database are recorded, see ``_sync_remote_changes``.
+        Since this is an explicit request, they're always looked for.
+        """
+        storage = self.get_storage(storage_name)
+        if _is_rdb_storage(storage):
+            return await self._sync_remote_changes(storage_name, study_id, max_age=0)
+        return await self._call(
+            storage_name, "read_trials_from_remote_storage", study_id=study_id
         )
 
 
-def register_with_scheduler(dask_scheduler=None, storage=None, name=None):
+def register_with_scheduler(
+    dask_scheduler=None,
+    storage=None,
+    name=None,
+    offload: bool = False,
+    trial_cache_size: Union[int, str] = "100 MiB",
+    sidecar: bool = False,
+    idle_timeout: Union[str, float, None] = None,
+    sqlite_tuning: Union[bool, Dict[str, Any]] = False,
+    persist: Union[str, Dict[str, Any], None] = None,
+):
     if "optuna" not in dask_scheduler.extensions:
         ext = OptunaSchedulerExtension(dask_scheduler)
     else:
         ext = dask_scheduler.extensions["optuna"]
 
-    if name not in ext.storages:
-        ext.storages[name] = optuna.storages.get_storage(storage)
+    if name in ext.sidecars or name in ext.storages:
+        return
+    if idle_timeout is not None:
+        ext.idle_timeouts[name] = parse_timedelta(idle_timeout)
+        ext.last_used[name] = time()
+        ext._start_idle_checks()
+    if sidecar:
+        ext.sidecars[name] = StorageSidecar(
+            storage=storage,
+            name=name,
+            offload=offload,
+            trial_cache_size=trial_cache_size,
+            sqlite_tuning=sqlite_tuning,
+            persist=persist,
+        )
+    else:
+        ext.storages[name], executor = ext._acquire_storage(
+            name, storage, offload, sqlite_tuning, persist
+        )
+        ext._track_storage(name, trial_cache_size)
+        if executor is not None:
+            ext.executors[name] = executor
+
+
+def _estimate_storage_nbytes(storage, sample_size=10):
+    """Estimated memory used by the trials which an Optuna storage holds in memory
+
+    The size of each study's trials is estimated from their number and the
+    ``dask.sizeof`` of up to ``sample_size`` of them, so the cost doesn't grow
+    with the number of trials.
+    """
+    # e.g. the in-memory storage of a ``HybridStorage`` or ``JournalStorage``
+    storage = getattr(storage, "_primary", storage)
+    nbytes = 0
+    # Studies of an ``InMemoryStorage``, or those cached by a ``_CachedStorage``
+    for info in list(getattr(storage, "_studies", {}).values()):
+        trials = info.trials
+        if isinstance(trials, dict):
+            trials = list(trials.values())
+        if not trials:
+            continue
+        sample = trials[:: max(1, len(trials) // sample_size)][:sample_size]
+        trial_nbytes = sum(sizeof(vars(trial)) for trial in sample) / len(sample)
+        nbytes += int(trial_nbytes * len(trials))
+    return nbytes
+
+
+def _open_storage(storage):
+    """Like ``optuna.storages.get_storage``, but also for ``journal://`` URLs"""
+    if isinstance(storage, str) and storage.startswith("journal:"):
+        # Not imported at module level since ``journal`` imports this module
+        from .journal import JournalStorage
+
+        return JournalStorage.from_url(storage)
+    return optuna.storages.get_storage(storage)
+
+
+def _close_base_storage(storage):
+    """Release the resources held by an Optuna storage, like database connections"""
+    if hasattr(storage, "close"):
+        # e.g. HybridStorage or JournalStorage
+        storage.close()
+        return
+    # RDB storages are wrapped in a _CachedStorage
+    backend = getattr(storage, "_backend", storage)
+    engine = getattr(backend, "engine", None)
+    if engine is not None:
+        engine.dispose()
+
+
+def _unwrap_serialized(obj):
+    """Replace ``to_serialize`` wrappers in a handler's result with the wrapped objects"""
+    if isinstance(obj, Serialize):
+        return obj.data
+    if isinstance(obj, dict):
+        return {k: _unwrap_serialized(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_unwrap_serialized(v) for v in obj]
+    return obj
+
+
+class OptunaStorageActor:
+    """Dask Actor which hosts an Optuna storage for ``DaskStorage``
+
+    This is an alternative to hosting the storage on the scheduler, which
+    keeps the storage's memory use and CPU time out of the scheduler process.
+    The storage is served by the same handlers as ``OptunaSchedulerExtension``,
+    which run on the worker's event loop (or the storage's executor thread
+    when ``offload=True``). Workers call them directly over worker-to-worker
+    comms.
+
+    If the worker holding the actor dies, the storage goes with it, so use a
+    persistent backend like SQLite if trials need to survive that.
+    """
+
+    def __init__(
+        self,
+        storage=None,
+        name: str = None,
+        offload: bool = False,
+        trial_cache_size: Union[int, str] = "100 MiB",
+        sqlite_tuning: Union[bool, Dict[str, Any]] = False,
+        persist: Union[str, Dict[str, Any], None] = None,
+    ):
+        self.name = name
+        # Stands in for the scheduler, which is where the handlers usually live
+        self.host = SimpleNamespace(handlers={}, extensions={})
+        register_with_scheduler(
+            self.host,
+            storage=storage,
+            name=name,
+            offload=offload,
+            trial_cache_size=trial_cache_size,
+            sqlite_tuning=sqlite_tuning,
+            persist=persist,
+        )
+
+    async def call(self, method: str, kwargs: Dict[str, Any]) -> Any:
+        """Call the ``optuna_{method}`` handler with ``kwargs``"""
+        handler = self.host.handlers[f"optuna_{method}"]
+        result = await handler(None, storage_name=self.name, **kwargs)
+        # Actor results are pickled as a whole, so nested wrappers aren't unwrapped
+        return _unwrap_serialized(result)
+
+    def get_base_storage(self):
+        return self.host.extensions["optuna"].storages[self.name]
+
+
+class TrialMirror:
+    """Local copy of the trials in a study, kept up to date with ``get_trials_since``"""
+
+    def __init__(self):
+        self.epoch = None
+        self.version = None
+        self.trials = {}
+        # Whether changes published by the scheduler are being applied, see ``push``
+        self.live = False
+
+    def update(self, result, table=None):
+        """Apply a result from ``get_trials_since``
+
+        ``table`` is the local copy of the study's ``DistributionTable``.
+        """
+        if result["epoch"] == self.epoch and result["version"] <= self.version:
+            # A concurrent, more recent, sync has already been applied
+            return
+        if result["full"]:
+            self.trials = {}
+        new_trials = False
+        trials = decode_frozentrials(
+            result["trials"], result.get("wire_format", "dict"), table
+        )
+        for trial in trials:
+            new_trials = new_trials or trial._trial_id not in self.trials
+            self.trials[trial._trial_id] = trial
+        if new_trials:
+            self.trials = dict(
+                sorted(self.trials.items(), key=lambda item: item[1].number)
+            )
+        self.epoch = result["epoch"]
+        self.version = result["version"]
+
+    def push(self, message, table=None):
+        """Apply changes published by the scheduler
+
+        See ``OptunaSchedulerExtension._publish_trial_changes``. If earlier
+        changes were missed the message is dropped, and the mirror isn't
+        ``live`` until it's synced with ``get_trials_since`` and a later
+        message is applied.
+        """
+        if not message["full"] and (
+            message["epoch"] != self.epoch
+            or self.version is None
+            or self.version < message["since"]
+        ):
+            self.live = False
+            return
+        self.update(message, table)
+        self.live = True
+
+
+class TrialReplica:
+    """Subscription to the changes published for the trials in a storage
+
+    Published changes are applied, as they arrive, to the ``TrialMirror`` of
+    every study in the storage which this process has synced. Must be
+    created on the client's event loop.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.sub = Sub(trials_topic(name))
+        # Whether this process modified the storage since it last synced a study
+        self.wrote = False
+        self._consumer = asyncio.ensure_future(self._consume())
+
+    async def _consume(self):
+        metadata = _metadata_caches[self.name]
+        async for messages in self.sub:
+            for message in messages:
+                study_id = message["study_id"]
+                mirror = _trial_mirrors.get((self.name, study_id))
+                if mirror is not None:
+                    mirror.push(message, metadata.distribution_tables[study_id])
+
+
+class MetadataCache:
+    """Study and trial metadata which can't change once it's been set
+
+    Some storages (e.g. SQLite) reuse the IDs of deleted studies and trials,
+    and studies may be deleted by other processes, so cached metadata is
+    checked against the study's name whenever a call to the scheduler reveals
+    which study an ID belongs to, see ``study_seen``.
+    """
+
+    def __init__(self):
+        self.wire_format = None
+        self.study_names = {}
+        self.study_directions = {}
+        self.trial_study_ids = {}
+        self.trial_numbers = {}
+        # study_id -> local copy of the scheduler's DistributionTable
+        self.distribution_tables = defaultdict(DistributionTable)
+
+    def distributions_known(self, study_id):
+        """Describes the local copy of a study's ``DistributionTable``, if there is one"""
+        if study_id is None or study_id not in self.distribution_tables:
+            return None
+        return self.distribution_tables[study_id].known
+
+    def study_seen(self, study_id, study_name):
+        """Record that ``study_id`` is the ID of the study named ``study_name``
+
+        Metadata cached for a different study with the same ID is dropped.
+        """
+        if self.study_names.get(study_id, study_name) != study_name:
+            self.clear_study(study_id)
+        self.study_names[study_id] = study_name
+
+    def clear_study(self, study_id):
+        self.study_names.pop(study_id, None)
+        self.distribution_tables.pop(study_id, None)
+        self.study_directions.pop(study_id, None)
+        trial_ids = [
+            trial_id
+            for trial_id, trial_study_id in list(self.trial_study_ids.items())
+            if trial_study_id == study_id
+        ]
+        for trial_id in trial_ids:
+            self.trial_study_ids.pop(trial_id, None)
+            self.trial_numbers.pop(trial_id, None)
+
+
+class IntermediateValueStream:
+    """Sends intermediate values to the scheduler in the background
+
+    Reported values are queued and sent from the client's event loop, so
+    reporting doesn't wait on the network. Values reported while a message is
+    in flight are coalesced into the next message. There's at most one message
+    in flight at a time, so values for each trial arrive in the order they were
+    reported. A message which fails to be sent (e.g. because of a network
+    error) is retried with the next one, up to ``max_attempts`` times.
+
+    The stream also keeps a local copy of each trial which values are being
+    reported for, so that ``Trial.report`` and ``Trial.should_prune``, which
+    call ``get_trial`` every time, don't wait on the network either. Copies
+    are dropped with ``forget`` when the trial is changed in any other way.
+    """
+
+    max_attempts = 3
+
+    def __init__(self, client, send):
+        self.client = client
+        # Async function which sends values, see ``DaskStorage._rpc``
+        self.send = send
+        # (trial_id, step) -> value
+        self.pending = {}
+        self.in_flight = {}
+        # trial_id -> error message from the scheduler
+        self.errors = {}
+        # trial_id -> local copy of the trial, or None until it's fetched
+        self.trials = {}
+        self._sending = False
+        self._condition = threading.Condition()
+
+    def report(self, trial_id, step, value):
+        with self._condition:
+            self.pending[(trial_id, step)] = value
+            trial = self.trials.setdefault(trial_id, None)
+            if trial is not None:
+                trial.intermediate_values[step] = value
+            if self._sending:
+                return
+            self._sending = True
+        self.client.loop.add_callback(self._send)
+
+    async def _send(self):
+        attempts = 0
+        while True:
+            with self._condition:
+                if not self.pending:
+                    self._sending = False
+                    self._condition.notify_all()
+                    return
+                self.in_flight, self.pending = self.pending, {}
+            values = [
+                (trial_id, step, value)
+                for (trial_id, step), value in self.in_flight.items()
+            ]
+            try:
+                errors = await self.send(values=values)
+            except Exception as e:
+                attempts += 1
+                if attempts < self.max_attempts:
+                    with self._condition:
+                        # Values reported since take precedence
+                        for key, value in self.in_flight.items():
+                            self.pending.setdefault(key, value)
+                        self.in_flight = {}
+                    continue
+                errors = {trial_id: str(e) for trial_id, _, _ in values}
+            attempts = 0
+            with self._condition:
+                for trial_id, error in errors.items():
+                    self.errors.setdefault(trial_id, error)
+                self.in_flight = {}
+                self._condition.notify_all()
+
+    def _has_unsent(self, trial_id):
+        return any(key[0] == trial_id for key in self.pending) or any(
+            key[0] == trial_id for key in self.in_flight
+        )
+
+    def wait(self, trial_id):
+        """Block until all values reported for ``trial_id`` have been set
+
+        Raises a ``RuntimeError`` if setting any of them failed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._has_unsent(trial_id))
+            error = self.errors.pop(trial_id, None)
+        if error is not None:
+            raise RuntimeError(
+                f"Failed to set intermediate values for trial {trial_id}: {error}"
+            )
+
+    def wait_all(self):
+        """Block until every value reported so far has been sent"""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._sending)
+
+    def overlay(self, trial):
+        """Add values reported for ``trial`` which may not have been set yet
+
+        If values are being reported for the trial, a copy is kept for ``cached``.
+        """
+        with self._condition:
+            unsent = {
+                step: value
+                for unsent in (self.in_flight, self.pending)
+                for (trial_id, step), value in unsent.items()
+                if trial_id == trial._trial_id
+            }
+            if unsent:
+                trial.intermediate_values = {**trial.intermediate_values, **unsent}
+            if trial._trial_id in self.trials:
+                self.trials[trial._trial_id] = copy.deepcopy(trial)
+        return trial
+
+    def cached(self, trial_id):
+        """Local copy of a trial which values are being reported for, if any"""
+        with self._condition:
+            trial = self.trials.get(trial_id)
+            return None if trial is None else copy.deepcopy(trial)
+
+    def forget(self, trial_id, finished=False):
+        """Drop the local copy of a trial which is about to change
+
+        Once the trial is ``finished``, values are no longer expected for it.
+        """
+        with self._condition:
+            if finished:
+                self.trials.pop(trial_id, None)
+            elif trial_id in self.trials:
+                self.trials[trial_id] = None
+
+
+# Intermediate value streams are shared by all DaskStorage instances in a
+# process which point to the same storage. Keys are storage names.
+_intermediate_value_streams = {}
+
+# Metadata caches are shared by all DaskStorage instances in a process
+# which point to the same storage. Keys are storage names.
+_metadata_caches = defaultdict(MetadataCache)
+
+# Trial mirrors are shared by all DaskStorage instances in a process
+# which point to the same storage. Keys are (storage name, study_id).
+# Mirrors are only read and updated on the client's event loop.
+_trial_mirrors = {}
+
+# Trial replicas are shared by all DaskStorage instances in a process
+# which point to the same storage. Keys are storage names.
+_trial_replicas = {}
+
+# Storages unpickled in a process, shared by every task which receives the
+# same storage. Keys are storage names, see ``_restore_storage``.
+_storage_handles = {}
+
+# Storage operations which may be run in a batch, see ``OptunaSchedulerExtension.batch``
+_BATCH_METHODS = {
+    "create_new_study",
+    "delete_study",
+    "set_study_user_attr",
+    "set_study_system_attr",
+    "set_study_direction",
+    "get_study_id_from_name",
+    "get_study_id_from_trial_id",
+    "get_study_name_from_id",
+    "read_trials_from_remote_storage",
+    "get_study_direction",
+    "get_study_user_attrs",
+    "get_study_system_attrs",
+    "get_all_study_summaries",
+    "create_new_trial",
+    "set_trial_state",
+    "set_trial_param",
+    "get_trial_number_from_id",
+    "get_trial_param",
+    "set_trial_value",
+    "set_trial_intermediate_value",
+    "set_trial_user_attr",
+    "set_trial_system_attr",
+    "get_trial",
+    "get_all_trials",
+    "get_trials_since",
+    "get_trials_columnar",
+    "get_best_trial",
+    "query_trials",
+    "get_n_trials",
+    "start_trial",
+    "finish_trial",
+}
+
+# Handlers which don't modify the storage
+_READ_ONLY_METHODS = {
+    "wire_formats",
+    "query_trials",
+    "read_trials_from_remote_storage",
+}
 
 
 def use_basestorage_doc(func):
@@ -289,6 +2061,54 @@ def use_basestorage_doc(func):
     return func
 
 
+def _merge_trial_writes(operations):
+    """Merge ``set_trial_value`` operations into a ``set_trial_state`` right after them
+
+    Optuna sets a finished trial's value and then its state. When both are sent
+    together (e.g. with ``write_behind`` or in a ``batch`` block), they're
+    merged into one ``set_trial_state`` operation which sets both in a single
+    storage call, so other clients never see one without the other.
+    """
+    merged = []
+    for method, kwargs in operations:
+        if (
+            method == "set_trial_state"
+            and merged
+            and merged[-1][0] == "set_trial_value"
+            and merged[-1][1]["trial_id"] == kwargs["trial_id"]
+        ):
+            kwargs = dict(kwargs, value=merged.pop()[1]["value"])
+        merged.append((method, kwargs))
+    return merged
+
+
+def _restore_storage(name, actor, options):
+    """Unpickle a ``DaskStorage``, see ``DaskStorage.__reduce__``
+
+    The storage was registered by whoever created it, so unlike ``DaskStorage``
+    this doesn't talk to the scheduler. The unpickled storage is cached and
+    reused for later copies of the same storage in this process.
+
+    The client is looked up when the storage is first used rather than here,
+    since storages may be unpickled where no client can be found yet, e.g.
+    by worker processes outside of a task.
+    """
+    storage = _storage_handles.get(name)
+    if (
+        storage is None
+        or storage._options() != options
+        or getattr(storage._actor, "key", None) != getattr(actor, "key", None)
+        or (
+            storage._client is not None
+            and storage._client.status in ("closing", "closed")
+        )
+    ):
+        storage = DaskStorage.__new__(DaskStorage)
+        storage._init_handle(name, None, actor=actor, **options)
+        _storage_handles[name] = storage
+    return storage
+
+
 class DaskStorage(optuna.storages.BaseStorage):
     """Dask-compatible Storage class
 
@@ -297,6 +2117,8 @@ class DaskStorage(optuna.storages.BaseStorage):
     storage
         Optuna storage class or url to use for underlying Optuna storage to wrap
         (e.g. ``None`` for in-memory storage, ``sqlite:///example.db`` for SQLite storage).
+        ``journal:///path/to/file`` hosts a ``JournalStorage``, with its other
+        arguments as query parameters (e.g. ``?sync_interval=1s``).
         Defaults to ``None``.
     name
         Unique identifier for the Dask storage class. If not provided, a random name
@@ -304,26 +2126,192 @@ class DaskStorage(optuna.storages.BaseStorage):
     client
         Dask ``Client`` to connect to. If not provided, will attempt to find an
         existing ``Client``.
+    offload
+        Whether to run calls to the underlying Optuna storage on a separate thread
+        on the scheduler instead of the scheduler's event loop. This keeps slow
+        storage operations (e.g. SQLite commits or fetching many trials) from
+        blocking task scheduling. Only used when registering a new ``name``.
+        Defaults to ``False``.
+    trial_cache_size
+        Maximum memory (e.g. ``"100 MiB"`` or a number of bytes) the scheduler
+        uses to cache serialized finished trials for this storage. Set to ``0`` to
+        disable caching. Only used when registering a new ``name``.
+        Defaults to ``"100 MiB"``.
+    write_behind
+        Whether to buffer ``set_trial_param``, ``set_trial_value``,
+        ``set_trial_user_attr``, and ``set_trial_system_attr`` calls locally
+        instead of sending each one to the scheduler right away. A trial's
+        buffered writes are sent along with the next call involving that trial
+        (e.g. ``get_trial`` or ``set_trial_state``), the next call which reads
+        trials from the whole study (e.g. ``get_all_trials``), when ``flush``
+        is called, or once there are ``max_buffered_writes`` of them. Like
+        ``batch``, buffering is per-thread.
+        Other threads and processes won't see buffered writes until they're sent,
+        and they're lost if this process dies before then.
+        Defaults to ``False``.
+    max_buffered_writes
+        Maximum number of writes buffered for a single trial when
+        ``write_behind=True``. Defaults to ``100``.
+    stream_intermediate_values
+        Whether ``set_trial_intermediate_value`` should send values to the scheduler
+        in the background instead of waiting for each one to be set. Values
+        are coalesced into as few messages as possible and are set in the order
+        they were reported. ``get_trial`` includes values which haven't been set
+        yet, and is answered from a local copy of the trial while values are
+        reported for it, so ``Trial.report`` doesn't wait on the network
+        either. Other calls involving the same trial (e.g. ``set_trial_state``)
+        wait until they have been. If values couldn't be set, such a call marks
+        the trial as failed and raises a ``RuntimeError``. Defaults to ``False``.
+    actor
+        Whether to host the storage in a Dask Actor on a worker instead of on
+        the scheduler. Either ``True`` to let the scheduler pick the worker, or
+        the address of the worker to use. Clients and workers talk to the actor's
+        worker directly, which keeps storage operations from using the
+        scheduler's CPU and memory. The storage is lost if the actor's worker
+        dies. Defaults to ``False``.
+    read_replica
+        Whether ``get_all_trials`` should read from a copy of the study's trials
+        in this process, which the scheduler keeps up to date by publishing
+        changes to trials on a Dask pub/sub topic, instead of asking the
+        scheduler for changes on every call. The copy is synced with the
+        scheduler if changes were missed (e.g. right after subscribing) and as
+        required by ``consistency``. Only storages hosted on the scheduler
+        publish changes. Defaults to ``False``.
+    consistency
+        Consistency of reads from the read replica. With ``"read-your-writes"``,
+        the replica is synced with the scheduler first if this process modified
+        the storage since it was last synced. With ``"eventual"``, reads never
+        wait on the scheduler, but may miss changes which are still being
+        published, including this process's own. Defaults to
+        ``"read-your-writes"``.
+    sidecar
+        Whether to host the storage in a subprocess on the scheduler's machine,
+        see ``StorageSidecar``. The scheduler forwards storage operations to the
+        subprocess, which also serializes their results, so optimization traffic
+        doesn't compete with task scheduling for the scheduler's GIL. Can't be
+        combined with ``actor``. Only used when registering a new ``name``.
+        Defaults to ``False``.
+    idle_timeout
+        Time (e.g. ``"1 hour"`` or a number of seconds) after which the scheduler
+        removes the storage, as with ``close``, if no requests were made for it
+        in the meantime. By default storages are kept until they're closed.
+        Not supported for storages hosted in an actor. Only used when
+        registering a new ``name``. Defaults to ``None``.
+    sqlite_tuning
+        Whether to open a SQLite ``storage`` URL with settings tuned for a
+        single writer, see ``tuned_sqlite_storage``: write-ahead logging, a
+        configurable ``synchronous`` level, a single connection used from the
+        storage's own thread (as with ``offload=True``), and group commit of
+        writes which arrive within a short window. Either ``True`` for the
+        default settings or a dict of keyword arguments for
+        ``tuned_sqlite_storage`` (e.g. ``{"group_commit": "50ms"}``). Writes
+        are acknowledged once their group is committed. Only used when
+        registering a new ``name``. Defaults to ``False``.
+    persist
+        URL (e.g. ``"sqlite:///example.db"``) of a storage to which an in-memory
+        ``storage`` is persisted in the background, see ``HybridStorage``. All
+        calls are served from memory, and the storage is loaded from the URL
+        when it's registered, e.g. after the scheduler restarts. Either the URL
+        or a dict of keyword arguments for ``HybridStorage``, e.g.
+        ``{"url": ..., "flush_interval": "5s", "max_unpersisted_writes": 100}``.
+        ``sqlite_tuning`` applies to the persistent storage. The storage is
+        always offloaded, since a write may wait for queued changes to be
+        persisted. Only used when
+        registering a new ``name``. Defaults to ``None``.
     """
 
-    def __init__(self, storage=None, name: str = None, client: Client = None):
-        self.name = name or f"dask-storage-{uuid.uuid4().hex}"
-        self.client = client or get_client()
-
-        if self.client.asynchronous or getattr(
+    def __init__(
+        self,
+        storage=None,
+        name: str = None,
+        client: Client = None,
+        offload: bool = False,
+        trial_cache_size: Union[int, str] = "100 MiB",
+        write_behind: bool = False,
+        max_buffered_writes: int = 100,
+        stream_intermediate_values: bool = False,
+        actor: Union[bool, str, Actor] = False,
+        sidecar: bool = False,
+        read_replica: bool = False,
+        consistency: str = "read-your-writes",
+        idle_timeout: Union[str, float, None] = None,
+        sqlite_tuning: Union[bool, Dict[str, Any]] = False,
+        persist: Union[str, Dict[str, Any], None] = None,
+    ):
+        if actor is not False and sidecar:
+            raise ValueError("A storage can't be hosted in both an actor and a sidecar")
+        if consistency not in ("read-your-writes", "eventual"):
+            raise ValueError(
+                f"consistency must be 'read-your-writes' or 'eventual', got {consistency!r}"
+            )
+        self._init_handle(
+            name or f"dask-storage-{uuid.uuid4().hex}",
+            client or get_client(),
+            write_behind=write_behind,
+            max_buffered_writes=max_buffered_writes,
+            stream_intermediate_values=stream_intermediate_values,
+            read_replica=read_replica,
+            consistency=consistency,
+        )
+        asynchronous = self.client.asynchronous or getattr(
             thread_state, "on_event_loop_thread", False
-        ):
+        )
+
+        if isinstance(actor, Actor):
+            # An existing storage
+            self._actor = actor
+        elif actor:
+            future = self.client.submit(
+                OptunaStorageActor,
+                storage=storage,
+                name=self.name,
+                offload=offload,
+                trial_cache_size=trial_cache_size,
+                sqlite_tuning=sqlite_tuning,
+                persist=persist,
+                actor=True,
+                workers=None if actor is True else [actor],
+                key=f"optuna-storage-{self.name}",
+            )
+            # The actor is released once nothing holds a future for it
+            self._actor_future = future
+            if asynchronous:
+
+                async def _start():
+                    self._actor = await future
+                    return self
+
+                self._started = asyncio.ensure_future(_start())
+            else:
+                self._actor = future.result()
+        elif asynchronous:
 
             async def _register():
                 await self.client.run_on_scheduler(
-                    register_with_scheduler, storage=storage, name=self.name
+                    register_with_scheduler,
+                    storage=storage,
+                    name=self.name,
+                    offload=offload,
+                    trial_cache_size=trial_cache_size,
+                    sidecar=sidecar,
+                    idle_timeout=idle_timeout,
+                    sqlite_tuning=sqlite_tuning,
+                    persist=persist,
                 )
                 return self
 
             self._started = asyncio.ensure_future(_register())
         else:
             self.client.run_on_scheduler(
-                register_with_scheduler, storage=storage, name=self.name
+                register_with_scheduler,
+                storage=storage,
+                name=self.name,
+                offload=offload,
+                trial_cache_size=trial_cache_size,
+                sidecar=sidecar,
+                idle_timeout=idle_timeout,
+                sqlite_tuning=sqlite_tuning,
+                persist=persist,
             )
 
     def __await__(self):
@@ -336,125 +2324,400 @@ class DaskStorage(optuna.storages.BaseStorage):
 
             return _().__await__()
 
+    def _init_handle(self, name, client, actor=None, **options):
+        """Set up everything but the storage itself, see ``_restore_storage``
+
+        ``options`` are the client-side options returned by ``_options``. If
+        ``client`` is ``None``, it's looked up the first time it's needed.
+        """
+        self.name = name
+        self._client = client
+        self.write_behind = options["write_behind"]
+        self.max_buffered_writes = options["max_buffered_writes"]
+        self.stream_intermediate_values = options["stream_intermediate_values"]
+        self.read_replica = options["read_replica"]
+        self.consistency = options["consistency"]
+        self._local = threading.local()
+        self._metadata = _metadata_caches[self.name]
+        self._actor = actor
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            self._client = get_client()
+        return self._client
+
+    def _options(self):
+        return {
+            "write_behind": self.write_behind,
+            "max_buffered_writes": self.max_buffered_writes,
+            "stream_intermediate_values": self.stream_intermediate_values,
+            "read_replica": self.read_replica,
+            "consistency": self.consistency,
+        }
+
     def __reduce__(self):
-        return (DaskStorage, (None, self.name))
+        return (_restore_storage, (self.name, self._actor, self._options()))
+
+    def _call(self, method, **kwargs):
+        """Call the scheduler's ``optuna_{method}`` handler for this storage
+
+        Any pending operations which must be applied first (deferred operations
+        from a ``batch`` block and buffered writes for the same trial) are sent
+        in the same message and run before ``method``.
+        """
+        trial_id = kwargs.get("trial_id")
+        stream = self._intermediate_value_stream()
+        if stream is not None and trial_id is not None and method != "get_trial":
+            self._forget_trial(method, trial_id)
+            # Make sure reported intermediate values land before, for example,
+            # the trial is marked as finished
+            try:
+                stream.wait(trial_id)
+            except RuntimeError:
+                # Some of the trial's values are lost, so it mustn't be left
+                # running (or be completed) as if nothing happened
+                operations = self._pop_pending(trial_id)
+                operations.append(
+                    ("set_trial_state", {"trial_id": trial_id, "state": "FAIL"})
+                )
+                try:
+                    self._send_batch(operations)
+                except Exception:
+                    # e.g. the trial has already finished
+                    logger.warning(
+                        "Failed to mark trial %s as failed", trial_id, exc_info=True
+                    )
+                raise
+        operations = self._pop_pending(trial_id)
+        if operations:
+            operations.append((method, kwargs))
+            return self._send_batch(operations)[-1]
+        return self.client.sync(self._rpc(method), **kwargs)
+
+    def _rpc(self, method):
+        """Async function which calls the ``optuna_{method}`` handler for this storage
+
+        The handler runs on the scheduler, or on the actor hosting the storage.
+        """
+        if self._actor is None:
+            handler = getattr(self.client.scheduler, f"optuna_{method}")
+            call = partial(handler, storage_name=self.name)
+        else:
+            # Talk to the actor's worker directly. Calls through the actor handle
+            # go through the scheduler unless the handle was deserialized inside a
+            # task, which isn't the case for e.g. storages sent with joblib.
+            worker = self.client.rpc(self._actor._address)
+
+            async def call(**kwargs):
+                response = await worker.actor_execute(
+                    function="call",
+                    actor=self._actor.key,
+                    args=[to_serialize(method), to_serialize(kwargs)],
+                    kwargs={},
+                )
+                if response["status"] != "OK":
+                    raise response["exception"]
+                return response["result"]
+
+        if method.startswith("get_") or method in _READ_ONLY_METHODS:
+            return call
+
+        async def write(**kwargs):
+            # For read-your-writes consistency of the read replica
+            replica = _trial_replicas.get(self.name)
+            if replica is not None:
+                replica.wrote = True
+            return await call(**kwargs)
+
+        return write
+
+    def _call_deferred(self, method, **kwargs):
+        """Like ``_call``, but for methods without a result
+
+        Inside a ``batch`` block the call is queued instead of sent right away.
+        """
+        operations = getattr(self._local, "batch", None)
+        if operations is None:
+            return self._call(method, **kwargs)
+        self._forget_trial(method, kwargs.get("trial_id"))
+        operations.append((method, kwargs))
+
+    def _call_buffered(self, method, trial_id, **kwargs):
+        """Like ``_call_deferred``, but buffers the call when ``write_behind=True``"""
+        if not self.write_behind:
+            return self._call_deferred(method, trial_id=trial_id, **kwargs)
+        self._forget_trial(method, trial_id)
+        write_buffer = getattr(self._local, "write_buffer", None)
+        if write_buffer is None:
+            write_buffer = self._local.write_buffer = {}
+        writes = write_buffer.setdefault(trial_id, [])
+        writes.append((method, dict(trial_id=trial_id, **kwargs)))
+        if len(writes) >= self.max_buffered_writes:
+            self._send_batch(self._pop_pending(trial_id))
+
+    def _forget_trial(self, method, trial_id):
+        """Drop the stream's local copy of a trial which ``method`` changes"""
+        stream = self._intermediate_value_stream()
+        if stream is not None and trial_id is not None:
+            stream.forget(
+                trial_id, finished=method in ("set_trial_state", "finish_trial")
+            )
+
+    def _wire_format(self):
+        """Newest wire format for trials supported by both us and the scheduler"""
+        if self._metadata.wire_format is None:
+            try:
+                remote = self.client.sync(self._rpc("wire_formats"))
+            except Exception:
+                # Schedulers from before wire formats were negotiated
+                remote = ["dict"]
+            self._metadata.wire_format = [f for f in WIRE_FORMATS if f in remote][-1]
+        return self._metadata.wire_format
+
+    def _intermediate_value_stream(self):
+        if not self.stream_intermediate_values:
+            return None
+        stream = _intermediate_value_streams.get(self.name)
+        if stream is None or stream.client is not self.client:
+            stream = _intermediate_value_streams[self.name] = IntermediateValueStream(
+                self.client, self._rpc("set_trial_intermediate_values")
+            )
+        return stream
+
+    def _pop_batch(self):
+        operations = getattr(self._local, "batch", None)
+        if operations:
+            self._local.batch = []
+        return operations
+
+    def _pop_pending(self, trial_id=None):
+        """Pop operations which must be sent before a call involving ``trial_id``
+
+        If ``trial_id`` is ``None``, buffered writes for all trials are included.
+        """
+        operations = []
+        write_buffer = getattr(self._local, "write_buffer", None)
+        if write_buffer:
+            if trial_id is None:
+                for writes in write_buffer.values():
+                    operations.extend(writes)
+                write_buffer.clear()
+            else:
+                operations.extend(write_buffer.pop(trial_id, []))
+        operations.extend(self._pop_batch() or [])
+        return operations
+
+    def _send_batch(self, operations):
+        if operations:
+            # The last result is still that of the last operation
+            return self.client.sync(
+                self._rpc("batch"), operations=_merge_trial_writes(operations)
+            )
+
+    def flush(self) -> None:
+        """Send this thread's buffered writes and queued batch operations"""
+        self._send_batch(self._pop_pending())
+
+    def close(self) -> None:
+        """Remove the storage from the scheduler, or its actor, freeing its memory
+
+        This thread's buffered writes and any streamed intermediate values are
+        sent first. Afterwards neither this storage nor any copy of it (e.g. on
+        workers) can be used, and the trials of an in-memory storage are lost.
+        """
+        self.flush()
+        stream = _intermediate_value_streams.pop(self.name, None)
+        if stream is not None:
+            stream.wait_all()
+        self.client.sync(self._rpc("close_storage"))
+        if getattr(self, "_actor_future", None) is not None:
+            self._actor_future.release()
+            self._actor_future = None
+
+        # Drop what this process kept for the storage
+        replica = _trial_replicas.pop(self.name, None)
+        if replica is not None:
+            self.client.loop.add_callback(replica._consumer.cancel)
+        for key in [key for key in _trial_mirrors if key[0] == self.name]:
+            del _trial_mirrors[key]
+        _metadata_caches.pop(self.name, None)
+        _storage_handles.pop(self.name, None)
+
+    def memory_usage(self) -> Dict[str, Dict[str, Any]]:
+        """Estimated memory used by every storage hosted on the scheduler
+
+        Returns a dictionary which maps the name of each storage to its memory
+        use in bytes, see ``OptunaSchedulerExtension.memory_usage``.
+        """
+        return self.client.sync(self.client.scheduler.optuna_memory_usage)
+
+    @contextmanager
+    def batch(self):
+        """Group storage operations into as few scheduler round trips as possible
+
+        Inside this block, operations which don't return a result (e.g.
+        ``set_trial_param`` or ``set_trial_value``) are queued instead of being
+        sent to the scheduler immediately. Queued operations are sent, in order,
+        together with the next operation that returns a result or when the block
+        exits. Batching is per-thread, so each thread using this storage groups
+        only its own operations.
+
+        Note that errors from queued operations (e.g. setting a parameter on a
+        finished trial) are raised when the batch is sent, not when the
+        operation is made.
+
+        Examples
+        --------
+        >>> def objective(trial):
+        ...     with trial.study._storage.batch():
+        ...         x = trial.suggest_uniform("x", -10, 10)
+        ...         y = trial.suggest_uniform("y", -10, 10)
+        ...     return (x - 2) ** 2 + y ** 2
+        """
+        if getattr(self._local, "batch", None) is not None:
+            # Already batching
+            yield self
+            return
+        self._local.batch = []
+        try:
+            yield self
+        finally:
+            operations = self._local.batch
+            self._local.batch = None
+            self._send_batch(operations)
 
     def get_base_storage(self):
-        def _(dask_scheduler=None, name=None):
-            return dask_scheduler.extensions["optuna"].storages[name]
+        if self._actor is not None:
+            return self._actor.get_base_storage().result()
+
+        async def _(dask_scheduler=None, name=None):
+            ext = dask_scheduler.extensions["optuna"]
+            if name in ext.sidecars:
+                result = await ext.sidecars[name].call("get_base_storage", {})
+                return deserialize(result.header, result.frames)
+            return ext.storages[name]
 
         return self.client.run_on_scheduler(_, name=self.name)
 
     @use_basestorage_doc
     def create_new_study(self, study_name: Optional[str] = None) -> int:
-        return self.client.sync(
-            self.client.scheduler.optuna_create_new_study,
+        study_id = self._call(
+            "create_new_study",
             study_name=study_name,
-            storage_name=self.name,
         )
+        # Anything cached for the ID is from a deleted study
+        self._metadata.clear_study(study_id)
+        return study_id
 
     @use_basestorage_doc
     def delete_study(self, study_id: int) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_delete_study,
+        _trial_mirrors.pop((self.name, study_id), None)
+        self._metadata.clear_study(study_id)
+        return self._call(
+            "delete_study",
             study_id=study_id,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def set_study_user_attr(self, study_id: int, key: str, value: Any) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_study_user_attr,
+        return self._call_deferred(
+            "set_study_user_attr",
             study_id=study_id,
             key=key,
             value=value,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def set_study_system_attr(self, study_id: int, key: str, value: Any) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_study_system_attr,
+        return self._call_deferred(
+            "set_study_system_attr",
             study_id=study_id,
             key=key,
             value=value,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def set_study_direction(
         self, study_id: int, direction: study.StudyDirection
     ) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_study_direction,
+        return self._call_deferred(
+            "set_study_direction",
             study_id=study_id,
             direction=direction.name,
-            storage_name=self.name,
         )
 
     # Basic study access
 
     @use_basestorage_doc
     def get_study_id_from_name(self, study_name: str) -> int:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_study_id_from_name,
+        study_id = self._call(
+            "get_study_id_from_name",
             study_name=study_name,
-            storage_name=self.name,
         )
+        self._metadata.study_seen(study_id, study_name)
+        return study_id
 
     @use_basestorage_doc
     def get_study_id_from_trial_id(self, trial_id: int) -> int:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_study_id_from_trial_id,
-            trial_id=trial_id,
-            storage_name=self.name,
-        )
+        study_id = self._metadata.trial_study_ids.get(trial_id)
+        if study_id is None:
+            study_id = self._call(
+                "get_study_id_from_trial_id",
+                trial_id=trial_id,
+            )
+            self._metadata.trial_study_ids[trial_id] = study_id
+        return study_id
 
     @use_basestorage_doc
     def get_study_name_from_id(self, study_id: int) -> str:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_study_name_from_id,
-            study_id=study_id,
-            storage_name=self.name,
-        )
+        study_name = self._metadata.study_names.get(study_id)
+        if study_name is None:
+            study_name = self._call(
+                "get_study_name_from_id",
+                study_id=study_id,
+            )
+            self._metadata.study_names[study_id] = study_name
+        return study_name
 
     @use_basestorage_doc
     def get_study_direction(self, study_id: int) -> study.StudyDirection:
-        direction = self.client.sync(
-            self.client.scheduler.optuna_get_study_direction,
-            study_id=study_id,
-            storage_name=self.name,
-        )
-        return deserialize_studydirection(direction)
+        direction = self._metadata.study_directions.get(study_id)
+        if direction is None:
+            direction = self._call(
+                "get_study_direction",
+                study_id=study_id,
+            )
+            direction = deserialize_studydirection(direction)
+            # A study's direction can only be set once
+            if direction != study.StudyDirection.NOT_SET:
+                self._metadata.study_directions[study_id] = direction
+        return direction
 
     @use_basestorage_doc
     def get_study_user_attrs(self, study_id: int) -> Dict[str, Any]:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_study_user_attrs,
+        return self._call(
+            "get_study_user_attrs",
             study_id=study_id,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def get_study_system_attrs(self, study_id: int) -> Dict[str, Any]:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_study_system_attrs,
+        return self._call(
+            "get_study_system_attrs",
             study_id=study_id,
-            storage_name=self.name,
         )
 
-    async def _get_all_study_summaries(self) -> List[study.StudySummary]:
-        print(f"name = {self.name}")
-        serialized_summaries = (
-            await self.client.scheduler.optuna_get_all_study_summaries(
-                storage_name=self.name
-            )
-        )
-        return [deserialize_studysummary(s) for s in serialized_summaries]
-
     @use_basestorage_doc
     def get_all_study_summaries(self) -> List[study.StudySummary]:
-        return self.client.sync(self._get_all_study_summaries)
+        wire_format = self._wire_format()
+        serialized_summaries = self._call(
+            "get_all_study_summaries", wire_format=wire_format
+        )
+        summaries = deserialize_studysummaries(serialized_summaries, wire_format)
+        for summary in summaries:
+            self._metadata.study_seen(summary._study_id, summary.study_name)
+        return summaries
 
     # Basic trial manipulation
 
@@ -462,20 +2725,96 @@ class DaskStorage(optuna.storages.BaseStorage):
     def create_new_trial(
         self, study_id: int, template_trial: Optional[FrozenTrial] = None
     ) -> int:
-        return self.client.sync(
-            self.client.scheduler.optuna_create_new_trial,
+        trial_id = self._call(
+            "create_new_trial",
             study_id=study_id,
             template_trial=template_trial,
-            storage_name=self.name,
         )
+        self._metadata.trial_study_ids[trial_id] = study_id
+        # In case the ID belonged to a deleted trial
+        self._metadata.trial_numbers.pop(trial_id, None)
+        return trial_id
+
+    def start_trial(
+        self, study_id: int, template_trial: Optional[FrozenTrial] = None
+    ) -> Dict[str, Any]:
+        """Create a new trial and get its ID, number, and any fixed parameters
+
+        Equivalent to ``create_new_trial`` followed by ``get_trial``, but makes
+        a single call to the scheduler. Optuna's own ``Study.optimize`` doesn't
+        call this, it's meant for code which runs trials itself.
+
+        Parameters
+        ----------
+        study_id
+            ID of the study to create the trial in.
+        template_trial
+            Template ``FrozenTrial`` with default values for the trial's attributes.
+
+        Returns
+        -------
+        info
+            Dictionary with the new trial's ``"trial_id"`` and ``"number"``, as well
+            as its ``"fixed_params"`` (``None`` if the trial has no fixed parameters).
+        """
+        info = self._call(
+            "start_trial",
+            study_id=study_id,
+            template_trial=template_trial,
+        )
+        self._metadata.trial_study_ids[info["trial_id"]] = study_id
+        self._metadata.trial_numbers[info["trial_id"]] = info["number"]
+        return info
+
+    def finish_trial(
+        self,
+        trial_id: int,
+        value: Optional[float] = None,
+        state: TrialState = TrialState.COMPLETE,
+    ) -> FrozenTrial:
+        """Set a trial's value and state, then get the finished trial
+
+        Equivalent to ``set_trial_value``, ``set_trial_state`` and ``get_trial``,
+        but makes a single call to the scheduler and updates the trial atomically.
+        Optuna's own ``Study.optimize`` doesn't call this, it's meant for code
+        which runs trials itself. ``Study.optimize`` calls ``set_trial_value``
+        and ``set_trial_state`` instead, which are only merged into a single
+        storage call when they're sent together, i.e. with ``write_behind`` or
+        in a ``batch`` block.
+
+        Parameters
+        ----------
+        trial_id
+            ID of the trial to finish.
+        value
+            Objective value of the trial. Not set if ``None``.
+        state
+            New state of the trial. Defaults to ``TrialState.COMPLETE``.
+
+        Returns
+        -------
+        trial
+            The finished trial.
+        """
+        wire_format = self._wire_format()
+        serialized_trial = self._call(
+            "finish_trial",
+            trial_id=trial_id,
+            value=value,
+            state=state.name,
+            wire_format=wire_format,
+            distributions=self._metadata.distributions_known(
+                self._metadata.trial_study_ids.get(trial_id)
+            ),
+        )
+        return self._decode_trials(serialized_trial, wire_format)[0]
 
     @use_basestorage_doc
     def set_trial_state(self, trial_id: int, state: TrialState) -> bool:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_trial_state,
+        return self._call(
+            "set_trial_state",
             trial_id=trial_id,
             state=state.name,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
@@ -486,93 +2825,189 @@ class DaskStorage(optuna.storages.BaseStorage):
         param_value_internal: float,
         distribution: BaseDistribution,
     ) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_trial_param,
+        kwargs = {"distribution": distribution_to_json(distribution)}
+        study_id = self._metadata.trial_study_ids.get(trial_id)
+        if study_id in self._metadata.distribution_tables:
+            # Send the distribution's ID if the scheduler already knows about it
+            table = self._metadata.distribution_tables[study_id]
+            distribution_id = table.ids.get(distribution)
+            if distribution_id is not None:
+                kwargs = {
+                    "distribution_id": distribution_id,
+                    "distributions_token": table.token,
+                }
+        return self._call_buffered(
+            "set_trial_param",
             trial_id=trial_id,
             param_name=param_name,
             param_value_internal=param_value_internal,
-            distribution=distribution_to_json(distribution),
-            storage_name=self.name,
+            **kwargs,
         )
 
     @use_basestorage_doc
     def get_trial_number_from_id(self, trial_id: int) -> int:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_trial_number_from_id,
-            trial_id=trial_id,
-            storage_name=self.name,
-        )
+        number = self._metadata.trial_numbers.get(trial_id)
+        if number is None:
+            number = self._call(
+                "get_trial_number_from_id",
+                trial_id=trial_id,
+            )
+            self._metadata.trial_numbers[trial_id] = number
+        return number
 
     @use_basestorage_doc
     def get_trial_param(self, trial_id: int, param_name: str) -> float:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_trial_param,
+        return self._call(
+            "get_trial_param",
             trial_id=trial_id,
             param_name=param_name,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def set_trial_value(self, trial_id: int, value: float) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_trial_value,
+        return self._call_buffered(
+            "set_trial_value",
             trial_id=trial_id,
             value=value,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def set_trial_intermediate_value(
         self, trial_id: int, step: int, intermediate_value: float
     ) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_trial_intermediate_value,
+        stream = self._intermediate_value_stream()
+        if stream is not None:
+            return stream.report(trial_id, step, intermediate_value)
+        return self._call_deferred(
+            "set_trial_intermediate_value",
             trial_id=trial_id,
             step=step,
             intermediate_value=intermediate_value,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def set_trial_user_attr(self, trial_id: int, key: str, value: Any) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_trial_user_attr,
+        return self._call_buffered(
+            "set_trial_user_attr",
             trial_id=trial_id,
             key=key,
             value=value,
-            storage_name=self.name,
         )
 
     @use_basestorage_doc
     def set_trial_system_attr(self, trial_id: int, key: str, value: Any) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_set_trial_system_attr,
+        return self._call_buffered(
+            "set_trial_system_attr",
             trial_id=trial_id,
             key=key,
             value=value,
-            storage_name=self.name,
         )
 
     # Basic trial access
-    async def _get_trial(self, trial_id: int) -> FrozenTrial:
-        serialized_trial = await self.client.scheduler.optuna_get_trial(
-            trial_id=trial_id, storage_name=self.name
-        )
-        return deserialize_frozentrial(serialized_trial)
 
     @use_basestorage_doc
     def get_trial(self, trial_id: int) -> FrozenTrial:
-        return self.client.sync(self._get_trial, trial_id=trial_id)
+        stream = self._intermediate_value_stream()
+        if stream is not None:
+            trial = stream.cached(trial_id)
+            if trial is not None:
+                return trial
+        wire_format = self._wire_format()
+        serialized_trial = self._call(
+            "get_trial",
+            trial_id=trial_id,
+            wire_format=wire_format,
+            distributions=self._metadata.distributions_known(
+                self._metadata.trial_study_ids.get(trial_id)
+            ),
+        )
+        if wire_format == "dict":
+            serialized_trial = [serialized_trial]
+        trial = self._decode_trials(serialized_trial, wire_format)[0]
+        if stream is not None:
+            trial = stream.overlay(trial)
+        return trial
+
+    def _decode_trials(self, data, wire_format):
+        """Decode trials sent by the scheduler from a single study"""
+        if wire_format == "dict":
+            return decode_frozentrials(data, wire_format)
+        study_id = data["study_id"]
+        trials = decode_frozentrials(
+            data, wire_format, self._metadata.distribution_tables[study_id]
+        )
+        for trial in trials:
+            self._metadata.trial_study_ids[trial._trial_id] = study_id
+        return trials
 
-    async def _get_all_trials(
-        self, study_id: int, deepcopy: bool = True
-    ) -> List[FrozenTrial]:
-        serialized_trials = await self.client.scheduler.optuna_get_all_trials(
+    @use_basestorage_doc
+    def get_best_trial(self, study_id: int) -> FrozenTrial:
+        wire_format = self._wire_format()
+        serialized_trial = self._call(
+            "get_best_trial",
             study_id=study_id,
-            deepcopy=deepcopy,
-            storage_name=self.name,
+            wire_format=wire_format,
+            distributions=self._metadata.distributions_known(study_id),
         )
-        return [deserialize_frozentrial(t) for t in serialized_trials]
+        if wire_format == "dict":
+            serialized_trial = [serialized_trial]
+        return self._decode_trials(serialized_trial, wire_format)[0]
+
+    async def _get_all_trials(
+        self,
+        study_id: int,
+        deepcopy: bool = True,
+        operations=None,
+        wire_format: str = "dict",
+    ) -> List[FrozenTrial]:
+        # Only fetch trials which have changed since the last time this
+        # process synced the study
+        key = (self.name, study_id)
+        replica = None
+        if self.read_replica:
+            replica = _trial_replicas.get(self.name)
+            if replica is None:
+                replica = _trial_replicas[self.name] = TrialReplica(self.name)
+        mirror = _trial_mirrors.get(key) or TrialMirror()
+        if (
+            replica is not None
+            and mirror.live
+            and not operations
+            and (self.consistency == "eventual" or not replica.wrote)
+        ):
+            # Served from the replica
+            return self._copy_trials(mirror, deepcopy)
+        if replica is not None:
+            # Writes from before here are included in the result
+            replica.wrote = False
+        kwargs = {
+            "study_id": study_id,
+            "epoch": mirror.epoch,
+            "version": mirror.version,
+            "wire_format": wire_format,
+            "distributions": self._metadata.distributions_known(study_id),
+        }
+        if operations:
+            # Pending operations need to be applied first
+            results = await self._rpc("batch")(
+                operations=operations + [("get_trials_since", kwargs)]
+            )
+            result = results[-1]
+        else:
+            result = await self._rpc("get_trials_since")(**kwargs)
+        mirror = _trial_mirrors.setdefault(key, mirror)
+        table = None
+        if wire_format != "dict":
+            table = self._metadata.distribution_tables[study_id]
+        mirror.update(result, table)
+        return self._copy_trials(mirror, deepcopy)
+
+    @staticmethod
+    def _copy_trials(mirror, deepcopy):
+        trials = list(mirror.trials.values())
+        if deepcopy:
+            trials = [copy.deepcopy(t) for t in trials]
+        return trials
 
     @use_basestorage_doc
     def get_all_trials(self, study_id: int, deepcopy: bool = True) -> List[FrozenTrial]:
@@ -580,21 +3015,132 @@ class DaskStorage(optuna.storages.BaseStorage):
             self._get_all_trials,
             study_id=study_id,
             deepcopy=deepcopy,
+            operations=self._pop_pending(),
+            wire_format=self._wire_format(),
         )
 
+    def get_trials_columnar(
+        self,
+        study_id: int,
+        params: Optional[List[str]] = None,
+        states: Optional[List[TrialState]] = None,
+    ) -> Dict[str, Any]:
+        """Get the trials in a study as NumPy arrays
+
+        The arrays are built on the scheduler, so this is much cheaper than
+        ``get_all_trials`` for code which only needs a few numeric fields of
+        each trial, like samplers and analysis code.
+
+        Parameters
+        ----------
+        study_id
+            ID of the study.
+        params
+            Names of the parameters to include. By default every parameter
+            which is set in any of the trials is included.
+        states
+            Only include trials in these states. By default trials in every
+            state are included.
+
+        Returns
+        -------
+        columns
+            Dictionary with a ``"trial_id"``, ``"number"``, ``"state"`` (the
+            ``TrialState`` values), ``"value"``, ``"datetime_start"``, and
+            ``"datetime_complete"`` array, in order of trial number. Under
+            ``"params"`` is a dictionary with an array for each parameter in
+            its internal representation. Missing values are NaN, and missing
+            timestamps are NaT.
+
+        Examples
+        --------
+        >>> columns = storage.get_trials_columnar(
+        ...     study._study_id, params=["x"], states=[TrialState.COMPLETE]
+        ... )
+        >>> best_x = columns["params"]["x"][columns["value"].argmin()]
+        """
+        if params is not None:
+            params = list(params)
+        if states is not None:
+            states = [state.name for state in states]
+        return self._call(
+            "get_trials_columnar",
+            study_id=study_id,
+            params=params,
+            states=states,
+        )
+
+    def query_trials(
+        self,
+        study_id: int,
+        states: Optional[List[TrialState]] = None,
+        fields: Optional[List[str]] = None,
+        numbers: Optional[Tuple[Optional[int], Optional[int]]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Get selected fields of the trials in a study which match a filter
+
+        The filter and projection are applied on the scheduler, so fields
+        which aren't needed, like large user attributes or intermediate
+        values, are never serialized or sent.
+
+        Parameters
+        ----------
+        study_id
+            ID of the study.
+        states
+            Only include trials in these states. By default trials in every
+            state are included.
+        fields
+            Names of the trial fields to include, out of ``"trial_id"``,
+            ``"number"``, ``"state"``, ``"value"``, ``"datetime_start"``,
+            ``"datetime_complete"``, ``"params"``, ``"distributions"``,
+            ``"user_attrs"``, ``"system_attrs"``, and ``"intermediate_values"``.
+            By default every field is included.
+        numbers
+            Only include trials with numbers in the ``(start, stop)`` range.
+            Either end may be ``None``. ``stop`` is exclusive.
+
+        Returns
+        -------
+        trials
+            A dictionary with the selected fields for each matching trial, in
+            order of trial number.
+
+        Examples
+        --------
+        >>> values = storage.query_trials(
+        ...     study._study_id, states=[TrialState.COMPLETE], fields=["number", "value"]
+        ... )
+        """
+        if states is not None:
+            states = [state.name for state in states]
+        if fields is not None:
+            fields = list(fields)
+            unknown = set(fields) - set(TRIAL_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown trial fields {sorted(unknown)}")
+        if numbers is not None:
+            numbers = list(numbers)
+        trials = self._call(
+            "query_trials",
+            study_id=study_id,
+            states=states,
+            fields=fields,
+            numbers=numbers,
+        )
+        return [deserialize_projection(t) for t in trials]
+
     @use_basestorage_doc
     def get_n_trials(self, study_id: int, state: Optional[TrialState] = None) -> int:
-        return self.client.sync(
-            self.client.scheduler.optuna_get_n_trials,
+        return self._call(
+            "get_n_trials",
             study_id=study_id,
-            state=state,
-            storage_name=self.name,
+            state=state.name if state is not None else None,
         )
 
     @use_basestorage_doc
     def read_trials_from_remote_storage(self, study_id: int) -> None:
-        return self.client.sync(
-            self.client.scheduler.optuna_read_trials_from_remote_storage,
+        return self._call(
+            "read_trials_from_remote_storage",
             study_id=study_id,
-            storage_name=self.name,
         )
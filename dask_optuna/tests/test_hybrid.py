@@ -0,0 +1,244 @@
+import pickle
+import threading
+
+import pytest
+import optuna
+from distributed import Client
+
+import dask_optuna
+from dask_optuna import HybridStorage
+
+from .utils import get_storage_url
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    trial.report(x, step=0)
+    trial.set_user_attr("squared", x**2)
+    return (x - 2) ** 2
+
+
+def persisted_trials(url, study_name):
+    storage = optuna.storages.get_storage(url)
+    try:
+        study = optuna.load_study(study_name=study_name, storage=storage)
+        return study.trials
+    except KeyError:
+        return None
+    finally:
+        storage._backend.engine.dispose()
+
+
+def test_hybrid_storage():
+    with get_storage_url("sqlite") as url:
+        storage = HybridStorage(url, flush_interval="1 hour")
+        study = optuna.create_study(storage=storage, direction="maximize")
+        study.set_user_attr("owner", "me")
+        study.optimize(objective, n_trials=5)
+        # Nothing persisted until the next flush
+        assert persisted_trials(url, study.study_name) is None
+
+        storage.flush()
+        persisted = persisted_trials(url, study.study_name)
+        assert [(t.params, t.value, t.user_attrs) for t in persisted] == [
+            (t.params, t.value, t.user_attrs) for t in study.trials
+        ]
+        assert [t.intermediate_values for t in persisted] == [
+            t.intermediate_values for t in study.trials
+        ]
+
+        # Changes to trials created in an earlier batch
+        trial_id = storage.create_new_trial(study._study_id)
+        storage.flush()
+        storage.set_trial_value(trial_id, 1.0)
+        storage.set_trial_state(trial_id, optuna.trial.TrialState.COMPLETE)
+        other = optuna.create_study(storage=storage)
+        storage.delete_study(other._study_id)
+        storage.close()
+        assert persisted_trials(url, study.study_name)[-1].value == 1.0
+
+        # The persisted storage is loaded when restarted
+        storage = HybridStorage(url)
+        restarted = optuna.load_study(study_name=study.study_name, storage=storage)
+        assert restarted.direction == optuna.study.StudyDirection.MAXIMIZE
+        assert restarted.user_attrs == {"owner": "me"}
+        assert [(t.params, t.value) for t in restarted.trials] == [
+            (t.params, t.value) for t in study.trials
+        ]
+        assert len(storage.get_all_study_summaries()) == 1
+        restarted.optimize(objective, n_trials=2)
+        storage.close()
+        assert len(persisted_trials(url, study.study_name)) == len(study.trials) + 2
+
+        # Pickling copies the in-memory storage
+        copy = pickle.loads(pickle.dumps(storage))
+        assert isinstance(copy, optuna.storages.InMemoryStorage)
+        assert len(copy.get_all_trials(restarted._study_id)) == len(study.trials) + 2
+
+
+def test_max_unpersisted_writes():
+    with get_storage_url("sqlite") as url:
+        storage = HybridStorage(url, flush_interval="1 hour", max_unpersisted_writes=3)
+        study = optuna.create_study(storage=storage)
+        study.optimize(objective, n_trials=5)
+        assert len(storage._pending) <= 3
+        assert len(persisted_trials(url, study.study_name)) >= 4
+        storage.close()
+
+    with get_storage_url("sqlite") as url:
+        storage = HybridStorage(url, flush_interval="1 hour", max_unpersisted_writes=3)
+        study_id = storage.create_new_study()
+        create_new_trial = storage._persistent.create_new_trial
+
+        def fail(*args, **kwargs):
+            raise RuntimeError("disk full")
+
+        storage._persistent.create_new_trial = fail
+        storage.create_new_trial(study_id)
+        storage.create_new_trial(study_id)
+        # Flushed first, which failed
+        storage.create_new_trial(study_id)
+        assert len(storage._pending) == 3
+        # Not queued once the flush failed
+        with pytest.raises(optuna.exceptions.StorageInternalError):
+            storage.create_new_trial(study_id)
+        assert len(storage.get_all_trials(study_id)) == 3
+
+        storage._persistent.create_new_trial = create_new_trial
+        storage.flush()
+        storage.create_new_trial(study_id)
+        storage.close()
+        study_name = storage.get_study_name_from_id(study_id)
+        assert len(persisted_trials(url, study_name)) == 4
+
+    # Also a bound for concurrent writers
+    with get_storage_url("sqlite") as url:
+        storage = HybridStorage(url, flush_interval="1 hour", max_unpersisted_writes=5)
+        study_id = storage.create_new_study()
+        sizes = []
+
+        def write():
+            for _ in range(20):
+                storage.create_new_trial(study_id)
+                sizes.append(len(storage._pending))
+
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(sizes) <= 5
+        storage.close()
+        study_name = storage.get_study_name_from_id(study_id)
+        assert len(persisted_trials(url, study_name)) == 80
+
+
+def test_persist_failure():
+    with get_storage_url("sqlite") as url:
+        storage = HybridStorage(url, flush_interval="1 hour")
+        study = optuna.create_study(storage=storage)
+        create_new_trial = storage._persistent.create_new_trial
+        calls = []
+
+        def fail_once(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError("disk full")
+            return create_new_trial(*args, **kwargs)
+
+        storage._persistent.create_new_trial = fail_once
+        study.optimize(objective, n_trials=3)
+        storage.flush()
+        assert len(persisted_trials(url, study.study_name)) == 1
+        assert storage._pending
+
+        # Retried with the next batch
+        study.optimize(objective, n_trials=1)
+        storage.close()
+        persisted = persisted_trials(url, study.study_name)
+        assert [t.params for t in persisted] == [t.params for t in study.trials]
+
+
+def test_persist_failure_dropped(caplog):
+    with get_storage_url("sqlite") as url:
+        storage = HybridStorage(url, flush_interval="1 hour", max_persist_attempts=2)
+        study = optuna.create_study(storage=storage)
+        create_new_trial = storage._persistent.create_new_trial
+
+        def fail_second(study_id, template_trial):
+            if template_trial.number == 1:
+                raise ValueError("always fails")
+            return create_new_trial(study_id, template_trial=template_trial)
+
+        storage._persistent.create_new_trial = fail_second
+        study.optimize(objective, n_trials=3)
+        storage.flush()
+        assert len(persisted_trials(url, study.study_name)) == 1
+        assert "Dropping" not in caplog.text
+
+        # Dropped instead of retried forever
+        storage.flush()
+        assert "Dropping create_new_trial" in caplog.text
+        storage.flush()
+        assert not storage._pending
+        persisted = persisted_trials(url, study.study_name)
+        assert [t.params for t in persisted] == [
+            t.params for t in study.trials if t.number != 1
+        ]
+        storage.close()
+
+
+def test_dask_storage_persist():
+    with Client(processes=False) as client:
+        with get_storage_url("sqlite") as url:
+            options = {"url": url, "flush_interval": "10ms"}
+            storage = dask_optuna.DaskStorage(persist=options)
+            other = dask_optuna.DaskStorage(persist=options)
+            ext = client.cluster.scheduler.extensions["optuna"]
+            assert isinstance(ext.storages[storage.name], HybridStorage)
+            assert ext.storages[other.name] is ext.storages[storage.name]
+            # Writes may wait for a flush, so off the event loop
+            assert storage.name in ext.executors
+
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=3)
+            storage.close()
+            other.close()
+            assert len(persisted_trials(url, study.study_name)) == 3
+
+            # e.g. after the scheduler restarted
+            storage = dask_optuna.DaskStorage(persist=url)
+            study = optuna.load_study(study_name=study.study_name, storage=storage)
+            assert len(study.trials) == 3
+
+            with pytest.raises(ValueError, match="in-memory"):
+                dask_optuna.DaskStorage(url, persist=url)
+
+
+def test_dask_storage_persist_sidecar():
+    with get_storage_url("sqlite") as url:
+        options = {"url": url, "flush_interval": "60s"}
+        with Client(processes=False):
+            storage = dask_optuna.DaskStorage(persist=options, sidecar=True)
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=5)
+            # Queued changes are persisted when the sidecar stops
+            storage.close()
+            assert len(persisted_trials(url, study.study_name)) == 5
+
+            storage = dask_optuna.DaskStorage(persist=options, sidecar=True)
+            study = optuna.load_study(study_name=study.study_name, storage=storage)
+            study.optimize(objective, n_trials=1)
+        # ... including along with the scheduler
+        assert len(persisted_trials(url, study.study_name)) == 6
+
+
+def test_dask_storage_persist_shutdown():
+    with get_storage_url("sqlite") as url:
+        with Client(processes=False):
+            options = {"url": url, "flush_interval": "60s"}
+            storage = dask_optuna.DaskStorage(persist=options)
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=5)
+        # Queued changes are persisted when the scheduler shuts down
+        assert len(persisted_trials(url, study.study_name)) == 5
@@ -0,0 +1,136 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+import optuna
+from distributed import Client
+
+import dask_optuna
+from dask_optuna import JournalStorage
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    trial.report(x, step=0)
+    trial.set_user_attr("squared", x**2)
+    return (x - 2) ** 2
+
+
+@pytest.fixture
+def path():
+    directory = tempfile.mkdtemp()
+    try:
+        yield os.path.join(directory, "optuna.journal")
+    finally:
+        shutil.rmtree(directory)
+
+
+@pytest.mark.parametrize("sync_interval", [0, "10ms"])
+def test_journal_storage(path, sync_interval):
+    storage = JournalStorage(path, sync_interval=sync_interval)
+    study = optuna.create_study(storage=storage, direction="maximize")
+    study.set_user_attr("owner", "me")
+    study.optimize(objective, n_trials=5)
+    deleted = optuna.create_study(storage=storage)
+    optuna.delete_study(deleted.study_name, storage=storage)
+    storage.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        study.optimize(objective, n_trials=1)
+    expected = study.trials[:5]
+
+    # Replayed from the journal, including when trials started and finished
+    storage = JournalStorage(path)
+    restarted = optuna.load_study(study_name=study.study_name, storage=storage)
+    assert restarted.trials == expected
+    assert restarted.user_attrs == {"owner": "me"}
+    assert restarted.direction == optuna.study.StudyDirection.MAXIMIZE
+    assert len(storage.get_all_study_summaries()) == 1
+    # IDs continue where they left off
+    assert optuna.create_study(storage=storage)._study_id == deleted._study_id + 1
+    storage.close()
+
+
+def test_torn_record(path):
+    storage = JournalStorage(path)
+    study = optuna.create_study(storage=storage)
+    study.optimize(objective, n_trials=3)
+    storage.close()
+    size = os.path.getsize(path)
+    # e.g. the process died while appending a record
+    with open(path, "ab") as file:
+        file.write(b"\x00\x00\x01\x00\x05partial")
+
+    storage = JournalStorage(path)
+    assert os.path.getsize(path) == size
+    study = optuna.load_study(study_name=study.study_name, storage=storage)
+    assert len(study.trials) == 3
+    study.optimize(objective, n_trials=1)
+    storage.close()
+    storage = JournalStorage(path)
+    assert len(storage.get_all_trials(study._study_id)) == 4
+    storage.close()
+
+
+def test_compaction(path):
+    storage = JournalStorage(path, sync_interval=0)
+    study = optuna.create_study(storage=storage)
+    study.optimize(objective, n_trials=2)
+    with open(path, "rb") as file:
+        old_journal = file.read()
+    storage.compact()
+    assert os.path.exists(storage.snapshot_path)
+    # Only the header is left
+    assert os.path.getsize(path) == 13
+    study.optimize(objective, n_trials=1)
+    storage.close()
+    expected = study.trials
+
+    storage = JournalStorage(path)
+    assert optuna.load_study(study.study_name, storage=storage).trials == expected
+    storage.close()
+
+    # A journal from before the latest snapshot (e.g. the process died before
+    # truncating it) is ignored, since the snapshot has its changes
+    with open(path, "wb") as file:
+        file.write(old_journal)
+    storage = JournalStorage(path, compact_after=10)
+    study = optuna.load_study(study.study_name, storage=storage)
+    assert study.trials == expected[:2]
+
+    # Compacted once enough records were appended
+    study.optimize(objective, n_trials=2)
+    storage.sync()
+    assert os.path.getsize(path) == 13
+    storage.close()
+    storage = JournalStorage(path)
+    assert len(storage.get_all_trials(study._study_id)) == 4
+    storage.close()
+
+    os.remove(storage.snapshot_path)
+    with pytest.raises(ValueError, match="snapshot"):
+        JournalStorage(path)
+
+
+def test_dask_storage_journal(path):
+    with Client(processes=False) as client:
+        url = f"journal://{path}?sync_interval=0&compact_after=100"
+        storage = dask_optuna.DaskStorage(url)
+        ext = client.cluster.scheduler.extensions["optuna"]
+        journal = ext.storages[storage.name]
+        assert isinstance(journal, JournalStorage)
+        assert journal.path == path
+        assert journal.sync_interval == 0
+        assert journal.compact_after == 100
+
+        study = optuna.create_study(storage=storage)
+        study.optimize(objective, n_trials=3)
+        storage.close()
+
+        storage = dask_optuna.DaskStorage(f"journal://{path}")
+        study = optuna.load_study(study_name=study.study_name, storage=storage)
+        assert len(study.trials) == 3
+        storage.close()
+
+    with pytest.raises(ValueError, match="journal"):
+        JournalStorage.from_url("sqlite:///example.db")
@@ -0,0 +1,135 @@
+import pickle
+
+import numpy as np
+import pytest
+import optuna
+
+from dask_optuna.serialize import (
+    DistributionTable,
+    WIRE_FORMATS,
+    TRIAL_SERIALIZERS,
+    columnar_frozentrials,
+    project_frozentrial,
+    deserialize_projection,
+    encode_frozentrials,
+    decode_frozentrials,
+    serialize_studysummaries,
+    deserialize_studysummaries,
+)
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    y = trial.suggest_int("y", -10, 10)
+    z = trial.suggest_categorical("z", ["a", "b", None])
+    trial.set_user_attr("z", z)
+    for step in range(3):
+        trial.report(x + y + step, step)
+    if y > 5:
+        raise optuna.TrialPruned()
+    return (x - 2) ** 2 + y
+
+
+@pytest.fixture
+def study():
+    study = optuna.create_study()
+    study.optimize(objective, n_trials=20)
+    # A running trial without a completion time
+    study._storage.create_new_trial(study._study_id)
+    return study
+
+
+@pytest.mark.parametrize("wire_format", WIRE_FORMATS)
+def test_frozentrials_roundtrip(study, wire_format):
+    trials = study.trials
+    table = DistributionTable()
+    records = [TRIAL_SERIALIZERS[wire_format](t, table) for t in trials]
+    # Simulate sending the message to another process
+    data = encode_frozentrials(records, wire_format, table)
+    data = pickle.loads(pickle.dumps(data))
+    assert decode_frozentrials(data, wire_format) == trials
+
+
+def test_compact_shares_distributions(study):
+    table = DistributionTable()
+    records = [TRIAL_SERIALIZERS["compact"](t, table) for t in study.trials]
+    data = encode_frozentrials(records, "compact", table)
+    assert len(data["distributions"]) == 3
+
+
+def test_distribution_table(study):
+    table = DistributionTable()
+    local = DistributionTable()
+    trials = study.trials
+    records = [TRIAL_SERIALIZERS["compact"](t, table) for t in trials[:5]]
+    data = encode_frozentrials(records, "compact", table, local.known)
+    assert decode_frozentrials(data, "compact", local) == trials[:5]
+    assert local.known == table.known
+
+    # Distributions the client already has aren't sent again
+    records = [TRIAL_SERIALIZERS["compact"](t, table) for t in trials[5:]]
+    data = encode_frozentrials(records, "compact", table, local.known)
+    assert data["distributions"] == []
+    assert decode_frozentrials(data, "compact", local) == trials[5:]
+
+    # A copy of a different table is replaced
+    other = DistributionTable()
+    other.intern(optuna.distributions.UniformDistribution(0, 1))
+    data = encode_frozentrials(records, "compact", table, other.known)
+    assert len(data["distributions"]) == 3
+    assert decode_frozentrials(data, "compact", other) == trials[5:]
+    assert other.known == table.known
+
+
+@pytest.mark.parametrize("wire_format", WIRE_FORMATS)
+def test_studysummaries_roundtrip(study, wire_format):
+    optuna.create_study(storage=study._storage)
+    summaries = study._storage.get_all_study_summaries()
+    assert summaries[1].best_trial is None
+
+    data = serialize_studysummaries(summaries, wire_format)
+    data = pickle.loads(pickle.dumps(data))
+    result = deserialize_studysummaries(data, wire_format)
+    for a, b in zip(result, summaries):
+        assert a.__dict__ == b.__dict__
+
+
+def test_columnar_frozentrials(study):
+    trials = study.trials
+    columns = columnar_frozentrials(trials)
+    assert list(columns["number"]) == [t.number for t in trials]
+    assert list(columns["state"]) == [t.state.value for t in trials]
+    np.testing.assert_equal(
+        columns["value"], [np.nan if t.value is None else t.value for t in trials]
+    )
+    assert np.isnat(columns["datetime_complete"][-1])
+    assert columns["datetime_start"][0] == np.datetime64(trials[0].datetime_start)
+    assert set(columns["params"]) == {"x", "y", "z"}
+    z = trials[0].distributions["z"]
+    assert columns["params"]["z"][0] == z.to_internal_repr(trials[0].params["z"])
+    assert np.isnan(columns["params"]["x"][-1])
+
+    columns = columnar_frozentrials(trials, params=["x"])
+    assert list(columns["params"]) == ["x"]
+    assert list(columns["params"]["x"][:-1]) == [t.params["x"] for t in trials[:-1]]
+
+
+def test_project_frozentrial(study):
+    trial = study.trials[0]
+    data = project_frozentrial(trial, ["number", "value", "params"])
+    assert data == {
+        "number": trial.number,
+        "value": trial.value,
+        "params": trial.params,
+    }
+
+    data = project_frozentrial(trial, ["state", "distributions", "datetime_start"])
+    data = deserialize_projection(pickle.loads(pickle.dumps(data)))
+    assert data == {
+        "state": trial.state,
+        "distributions": trial.distributions,
+        "datetime_start": trial.datetime_start,
+    }
+
+    with pytest.raises(ValueError, match="Unknown trial field"):
+        project_frozentrial(trial, ["foo"])
@@ -0,0 +1,86 @@
+import pytest
+import optuna
+import joblib
+from distributed import Client
+from distributed.utils_test import gen_cluster
+
+import dask_optuna
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    return (x - 2) ** 2
+
+
+@pytest.mark.parametrize("actor", [True, False])
+def test_sharded_storage(actor):
+    with Client(processes=False, n_workers=2):
+        storage = dask_optuna.ShardedDaskStorage(n_shards=3, actor=actor)
+        assert storage.n_shards == 3
+        studies = [
+            optuna.create_study(storage=storage, study_name=f"study-{i}")
+            for i in range(6)
+        ]
+        studies.append(optuna.create_study(storage=storage))
+        for study in studies:
+            shard = storage._shard_for_name(study.study_name)
+            assert study._study_id % 3 == shard
+            with joblib.parallel_backend("dask"):
+                study.optimize(objective, n_trials=3, n_jobs=-1)
+        # Studies are spread over more than one shard
+        assert len({study._study_id % 3 for study in studies}) > 1
+
+        for study in studies:
+            trials = study.trials
+            assert len(trials) == 3
+            for trial in trials:
+                assert trial._trial_id % 3 == study._study_id % 3
+                assert storage.get_trial(trial._trial_id) == trial
+                assert (
+                    storage.get_study_id_from_trial_id(trial._trial_id)
+                    == study._study_id
+                )
+            assert study.best_trial == min(trials, key=lambda t: t.value)
+
+        summaries = storage.get_all_study_summaries()
+        assert [s._study_id for s in summaries] == sorted(
+            study._study_id for study in studies
+        )
+        for summary in summaries:
+            study = optuna.load_study(study_name=summary.study_name, storage=storage)
+            assert study._study_id == summary._study_id
+            assert summary.best_trial == study.best_trial
+            assert summary.n_trials == 3
+
+        storage.delete_study(studies[0]._study_id)
+        assert len(storage.get_all_study_summaries()) == len(studies) - 1
+        with pytest.raises(KeyError):
+            storage.get_study_id_from_name(studies[0].study_name)
+
+        # Studies deleted and recreated elsewhere are found under their new ID
+        other = dask_optuna.ShardedDaskStorage(
+            name=storage.name, n_shards=3, actor=actor
+        )
+        study_name = studies[1].study_name
+        assert storage.get_study_id_from_name(study_name) == studies[1]._study_id
+        other.delete_study(studies[1]._study_id)
+        study_id = other.create_new_study(study_name)
+        assert study_id != studies[1]._study_id
+        assert storage.get_study_id_from_name(study_name) == study_id
+
+
+def test_sharded_storage_shard_workers():
+    with Client(processes=False, n_workers=2) as client:
+        workers = list(client.scheduler_info()["workers"])
+        storage = dask_optuna.ShardedDaskStorage(n_shards=2, actor=workers)
+        assert [shard._actor._address for shard in storage.shards] == workers
+
+        with pytest.raises(ValueError, match="actor workers"):
+            dask_optuna.ShardedDaskStorage(n_shards=3, actor=workers)
+
+
+@gen_cluster(client=True)
+async def test_sharded_storage_await(c, s, a, b):
+    storage = await dask_optuna.ShardedDaskStorage(n_shards=2, actor=False)
+    ext = s.extensions["optuna"]
+    assert sorted(ext.storages) == sorted(shard.name for shard in storage.shards)
@@ -0,0 +1,189 @@
+import sqlite3
+import tempfile
+import time
+
+import pytest
+import optuna
+from distributed import Client
+
+import dask_optuna
+from dask_optuna.sqlite import (
+    GroupCommitConnection,
+    deferred_commits,
+    tuned_sqlite_storage,
+)
+from dask_optuna.storage import _close_base_storage
+
+from .utils import get_storage_url
+
+
+def objective(trial):
+    x = trial.suggest_uniform("x", -10, 10)
+    return (x - 2) ** 2
+
+
+def count_trials(url):
+    connection = sqlite3.connect(url.replace("sqlite:///", "", 1))
+    try:
+        return connection.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_group_commit():
+    with get_storage_url("sqlite") as url:
+        storage = tuned_sqlite_storage(url, group_commit="1 hour")
+        connection = storage._backend.engine.pool.connection.connection
+        assert isinstance(connection, GroupCommitConnection)
+        assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+        assert connection.execute("PRAGMA synchronous").fetchone() == (1,)
+
+        with deferred_commits() as commits:
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=3)
+        # Visible through the storage, but not committed yet
+        assert len(study.trials) == 3
+        assert count_trials(url) == 0
+        assert len(set(commits)) == 1
+        assert not commits[0].done()
+
+        # A failed transaction doesn't roll back the waiting writes
+        with pytest.raises(optuna.exceptions.DuplicatedStudyError):
+            optuna.create_study(storage=storage, study_name=study.study_name)
+        assert len(study.trials) == 3
+
+        connection.flush()
+        assert count_trials(url) == 3
+        assert commits[0].result() is None
+
+        with deferred_commits():
+            study.optimize(objective, n_trials=1)
+        _close_base_storage(storage)
+        assert count_trials(url) == 4
+
+
+def test_group_commit_window():
+    with get_storage_url("sqlite") as url:
+        storage = tuned_sqlite_storage(url, synchronous="full", group_commit=0.1)
+        study = optuna.create_study(storage=storage)
+        start = time.time()
+        study.optimize(objective, n_trials=2)
+        # Each write waited for its group to be committed in the background
+        assert time.time() >= start + 0.1
+        assert count_trials(url) == 2
+        _close_base_storage(storage)
+
+    with pytest.raises(ValueError, match="SQLite URL"):
+        tuned_sqlite_storage("mysql://localhost/optuna")
+    with pytest.raises(ValueError, match="synchronous"):
+        tuned_sqlite_storage("sqlite://", synchronous="sometimes")
+
+
+def test_lost_group_commit():
+    def connect(database, group_commit):
+        connection = GroupCommitConnection(
+            sqlite3.connect(database, check_same_thread=False), group_commit
+        )
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def write(connection, statement):
+        connection.cursor().execute(statement)
+        connection.commit()
+
+    def count(connection):
+        result = connection.cursor().execute("SELECT COUNT(*) FROM parents").fetchone()
+        connection.commit()
+        return result[0]
+
+    with tempfile.NamedTemporaryFile() as file:
+        connection = connect(file.name, group_commit=3600)
+        connection.execute("CREATE TABLE parents (id INTEGER PRIMARY KEY)")
+        connection.execute(
+            "CREATE TABLE children (parent INTEGER REFERENCES parents "
+            "DEFERRABLE INITIALLY DEFERRED)"
+        )
+
+        # SQLite rolls back the whole transaction, not just the caller's
+        with deferred_commits() as commits:
+            write(connection, "INSERT INTO parents VALUES (1)")
+            with pytest.raises(sqlite3.IntegrityError):
+                write(connection, "INSERT OR ROLLBACK INTO parents VALUES (1)")
+            connection.rollback()
+        with pytest.raises(sqlite3.OperationalError, match="rolled back"):
+            commits[0].result()
+        assert count(connection) == 0
+
+        # The group commit itself fails
+        with deferred_commits() as commits:
+            write(connection, "INSERT INTO parents VALUES (1)")
+            write(connection, "INSERT INTO children VALUES (2)")
+        assert commits[0] is commits[1]
+        connection.flush()
+        with pytest.raises(sqlite3.IntegrityError):
+            commits[0].result()
+        assert count(connection) == 0
+        connection.close()
+
+        # Committers which wait for the group get the error
+        connection = connect(file.name, group_commit=0.01)
+        write(connection, "INSERT INTO parents VALUES (1)")
+        with pytest.raises(sqlite3.IntegrityError):
+            write(connection, "INSERT INTO children VALUES (2)")
+        assert count(connection) == 1
+        connection.close()
+
+
+def test_group_commit_open_transaction():
+    with tempfile.NamedTemporaryFile() as file:
+        connection = GroupCommitConnection(
+            sqlite3.connect(file.name, check_same_thread=False), group_commit=0.01
+        )
+        connection.execute("CREATE TABLE parents (id INTEGER PRIMARY KEY)")
+        with deferred_commits() as commits:
+            connection.cursor().execute("INSERT INTO parents VALUES (1)")
+            connection.commit()
+            # e.g. a SQLAlchemy session which read something after committing
+            connection.cursor().execute("SELECT * FROM parents").fetchall()
+            time.sleep(0.1)
+            # Not ended from the background, the caller may still write to it
+            assert not commits[0].done()
+        # ... but once the block is over
+        assert commits[0].result(timeout=5) is None
+        connection.close()
+
+
+@pytest.mark.parametrize("hosted", ["scheduler", "actor", "sidecar"])
+def test_sqlite_tuning(hosted):
+    with Client(processes=False) as client:
+        with get_storage_url("sqlite") as url:
+            storage = dask_optuna.DaskStorage(
+                url,
+                actor=hosted == "actor",
+                sidecar=hosted == "sidecar",
+                sqlite_tuning={"group_commit": "1ms"},
+            )
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=5)
+            assert len(study.trials) == 5
+            if hosted == "scheduler":
+                ext = client.cluster.scheduler.extensions["optuna"]
+                # Always on the storage's own thread
+                assert storage.name in ext.executors
+            storage.close()
+            assert count_trials(url) == 5
+
+        with pytest.raises(ValueError, match="SQLite URL"):
+            dask_optuna.DaskStorage(sqlite_tuning=True)
+
+
+def test_no_group_commit():
+    with get_storage_url("sqlite") as url:
+        storage = tuned_sqlite_storage(url, group_commit=0)
+        study = optuna.create_study(storage=storage)
+        study.optimize(objective, n_trials=2)
+        assert count_trials(url) == 2
+        with pytest.raises(optuna.exceptions.DuplicatedStudyError):
+            optuna.create_study(storage=storage, study_name=study.study_name)
+        assert count_trials(url) == 2
+        _close_base_storage(storage)
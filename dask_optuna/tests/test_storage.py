@@ -1,3 +1,9 @@
+import asyncio
+from collections import Counter
+from functools import partial, wraps
+import pickle
+import time
+
 import pytest
 import optuna
 import joblib
@@ -6,6 +12,7 @@ from distributed import Client
 from distributed.utils_test import gen_cluster
 
 import dask_optuna
+from dask_optuna.storage import SerializedTrialCache, _merge_trial_writes
 from .utils import get_storage_url
 
 
@@ -44,6 +51,655 @@ async def test_name_unique(c, s, a, b):
     assert s1.name != s2.name
 
 
+@gen_cluster(client=True)
+async def test_get_trials_since(c, s, a, b):
+    await dask_optuna.DaskStorage(name="foo")
+    study_id = await c.scheduler.optuna_create_new_study(storage_name="foo")
+    trial_1 = await c.scheduler.optuna_create_new_trial(
+        study_id=study_id, storage_name="foo"
+    )
+
+    # First sync returns all trials
+    result = await c.scheduler.optuna_get_trials_since(
+        study_id=study_id, storage_name="foo"
+    )
+    assert result["full"]
+    assert [t["trial_id"] for t in result["trials"]] == [trial_1]
+
+    # Later syncs only return trials which have changed
+    trial_2 = await c.scheduler.optuna_create_new_trial(
+        study_id=study_id, storage_name="foo"
+    )
+    await c.scheduler.optuna_set_trial_value(
+        trial_id=trial_1, value=1.0, storage_name="foo"
+    )
+    watermark = {"epoch": result["epoch"], "version": result["version"]}
+    result = await c.scheduler.optuna_get_trials_since(
+        study_id=study_id, storage_name="foo", **watermark
+    )
+    assert not result["full"]
+    assert [t["trial_id"] for t in result["trials"]] == [trial_2, trial_1]
+    assert result["trials"][1]["value"] == 1.0
+
+    watermark = {"epoch": result["epoch"], "version": result["version"]}
+    result = await c.scheduler.optuna_get_trials_since(
+        study_id=study_id, storage_name="foo", **watermark
+    )
+    assert not result["full"]
+    assert len(result["trials"]) == 0
+
+    # Unknown epochs trigger a full sync
+    watermark["epoch"] = "not-an-epoch"
+    result = await c.scheduler.optuna_get_trials_since(
+        study_id=study_id, storage_name="foo", **watermark
+    )
+    assert result["full"]
+    assert len(result["trials"]) == 2
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+def test_get_all_trials_matches_base_storage(storage_specifier):
+    with Client(processes=False):
+        with get_storage_url(storage_specifier) as url:
+            dask_storage = dask_optuna.DaskStorage(url)
+            study = optuna.create_study(storage=dask_storage)
+            for _ in range(3):
+                with joblib.parallel_backend("dask"):
+                    study.optimize(objective, n_trials=5, n_jobs=-1)
+                expected = dask_storage.get_base_storage().get_all_trials(
+                    study._study_id
+                )
+                assert study.trials == expected
+
+
+@gen_cluster(client=True)
+async def test_trial_cache(c, s, a, b):
+    await dask_optuna.DaskStorage(name="foo")
+    cache = s.extensions["optuna"].trial_caches["foo"]
+    study_id = await c.scheduler.optuna_create_new_study(storage_name="foo")
+    trial_ids = []
+    for i in range(3):
+        trial_id = await c.scheduler.optuna_create_new_trial(
+            study_id=study_id, storage_name="foo"
+        )
+        trial_ids.append(trial_id)
+    for trial_id in trial_ids[:2]:
+        await c.scheduler.optuna_set_trial_value(
+            trial_id=trial_id, value=1.0, storage_name="foo"
+        )
+        await c.scheduler.optuna_set_trial_state(
+            trial_id=trial_id, state="COMPLETE", storage_name="foo"
+        )
+
+    # Only finished trials are cached
+    first = await c.scheduler.optuna_get_all_trials(
+        study_id=study_id, storage_name="foo"
+    )
+    assert len(first) == 3
+    assert len(cache) == 2
+    second = await c.scheduler.optuna_get_all_trials(
+        study_id=study_id, storage_name="foo"
+    )
+    assert first == second
+
+    # Cached trials are invalidated when trials are modified
+    await c.scheduler.optuna_set_trial_value(
+        trial_id=trial_ids[2], value=1.0, storage_name="foo"
+    )
+    await c.scheduler.optuna_set_trial_state(
+        trial_id=trial_ids[2], state="COMPLETE", storage_name="foo"
+    )
+    cache.invalidate(trial_ids[0])
+    assert len(cache) == 1
+    trials = await c.scheduler.optuna_get_all_trials(
+        study_id=study_id, storage_name="foo"
+    )
+    assert [t["state"] for t in trials] == ["COMPLETE"] * 3
+    assert len(cache) == 3
+
+
+def test_trial_cache_eviction(monkeypatch):
+    study = optuna.create_study()
+    study.optimize(objective, n_trials=5)
+    trials = study.get_trials(deepcopy=False)
+    # dask.sizeof samples large containers, make trial sizes deterministic
+    monkeypatch.setattr(dask_optuna.storage, "sizeof", lambda data: 1000)
+
+    cache = SerializedTrialCache(2000)
+    for trial in trials[:3]:
+        cache.serialize(trial)
+    assert len(cache) == 2
+    assert cache.nbytes <= cache.max_bytes
+    # Least recently used trials are evicted first
+    cache.serialize(trials[1])
+    cache.serialize(trials[3])
+    assert set(cache._data) == {
+        (trials[1]._trial_id, "dict"),
+        (trials[3]._trial_id, "dict"),
+    }
+
+    cache = SerializedTrialCache(0)
+    cache.serialize(trials[0])
+    assert len(cache) == 0
+
+
+def test_batch():
+    with Client(processes=False):
+        storage = dask_optuna.DaskStorage()
+        base_storage = storage.get_base_storage()
+        study_id = storage.create_new_study()
+        trial_id = storage.create_new_trial(study_id)
+        distribution = optuna.distributions.UniformDistribution(low=0, high=10)
+
+        with storage.batch():
+            storage.set_trial_param(trial_id, "x", 1.0, distribution)
+            storage.set_trial_user_attr(trial_id, "foo", "bar")
+            # Operations without results are queued
+            assert base_storage.get_trial(trial_id).params == {}
+            # and are sent along with the next operation which has a result
+            trial = storage.get_trial(trial_id)
+            assert trial.params == {"x": 1.0}
+            assert trial.user_attrs == {"foo": "bar"}
+
+            storage.set_trial_value(trial_id, 2.0)
+            assert base_storage.get_trial(trial_id).value is None
+        # Remaining operations are sent when the block exits
+        assert base_storage.get_trial(trial_id).value == 2.0
+
+        # Outside of a batch, operations are sent right away
+        storage.set_trial_user_attr(trial_id, "foo", "baz")
+        assert base_storage.get_trial(trial_id).user_attrs == {"foo": "baz"}
+
+        # Only storage operations can be batched, and nothing runs otherwise
+        operations = [
+            ("set_trial_user_attr", {"trial_id": trial_id, "key": "foo", "value": 1}),
+            ("close_storage", {}),
+        ]
+        with pytest.raises(ValueError, match="close_storage"):
+            storage.client.sync(storage._rpc("batch"), operations=operations)
+        assert storage.get_trial(trial_id).user_attrs == {"foo": "baz"}
+
+
+def test_batch_optimize():
+    def objective(trial):
+        with trial.study._storage.batch():
+            x = trial.suggest_uniform("x", -10, 10)
+            y = trial.suggest_int("y", -10, 10)
+        return (x - 2) ** 2 + y**2
+
+    with Client(processes=False):
+        storage = dask_optuna.DaskStorage()
+        study = optuna.create_study(storage=storage)
+        with joblib.parallel_backend("dask"):
+            study.optimize(objective, n_trials=10, n_jobs=-1)
+        assert len(study.trials) == 10
+        assert all(set(t.params) == {"x", "y"} for t in study.trials)
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+def test_start_finish_trial(storage_specifier):
+    with Client(processes=False):
+        with get_storage_url(storage_specifier) as url:
+            storage = dask_optuna.DaskStorage(url)
+            study_id = storage.create_new_study()
+
+            for number in range(2):
+                info = storage.start_trial(study_id)
+                assert info["number"] == number
+                assert info["fixed_params"] is None
+                trial = storage.get_trial(info["trial_id"])
+                assert trial.number == number
+                assert trial.state == optuna.trial.TrialState.RUNNING
+
+            trial = storage.finish_trial(info["trial_id"], value=1.5)
+            assert trial.value == 1.5
+            assert trial.state == optuna.trial.TrialState.COMPLETE
+            assert storage.get_trial(info["trial_id"]) == trial
+
+            info = storage.start_trial(study_id)
+            trial = storage.finish_trial(
+                info["trial_id"], state=optuna.trial.TrialState.FAIL
+            )
+            assert trial.value is None
+            assert trial.state == optuna.trial.TrialState.FAIL
+
+
+def test_metadata_cache():
+    with Client(processes=False) as client:
+        storage = dask_optuna.DaskStorage(name="foo")
+        study_id = storage.create_new_study(study_name="bar")
+        storage.set_study_direction(study_id, optuna.study.StudyDirection.MAXIMIZE)
+        trial_id = storage.create_new_trial(study_id)
+
+        calls = []
+        handlers = client.cluster.scheduler.handlers
+        for method in [
+            "get_study_direction",
+            "get_study_name_from_id",
+            "get_study_id_from_trial_id",
+            "get_trial_number_from_id",
+        ]:
+
+            async def handler(comm, _handler=handlers[f"optuna_{method}"], **kwargs):
+                calls.append(_handler)
+                return await _handler(comm, **kwargs)
+
+            handlers[f"optuna_{method}"] = handler
+
+        def get_metadata(storage):
+            return (
+                storage.get_study_direction(study_id),
+                storage.get_study_name_from_id(study_id),
+                storage.get_study_id_from_trial_id(trial_id),
+                storage.get_trial_number_from_id(trial_id),
+            )
+
+        expected = (optuna.study.StudyDirection.MAXIMIZE, "bar", study_id, 0)
+        assert get_metadata(storage) == expected
+        # The trial's study ID is already known from create_new_trial
+        assert len(calls) == 3
+
+        # Other DaskStorage instances for the same storage share the cache
+        assert get_metadata(dask_optuna.DaskStorage(name="foo")) == expected
+        assert len(calls) == 3
+
+        storage.delete_study(study_id)
+        assert not storage._metadata.study_names
+        assert not storage._metadata.trial_numbers
+
+
+def test_metadata_cache_reused_study_id():
+    with Client(processes=False):
+        with get_storage_url("sqlite") as url:
+            storage = dask_optuna.DaskStorage(url)
+            # e.g. a client in another process
+            other = dask_optuna.DaskStorage(url)
+            study = optuna.create_study(
+                study_name="a", storage=storage, direction="maximize"
+            )
+            study_id = study._study_id
+            assert storage.get_study_direction(study_id).name == "MAXIMIZE"
+            assert storage.get_study_name_from_id(study_id) == "a"
+
+            # SQLite reuses the ID of the deleted study
+            optuna.delete_study("a", storage=other)
+            optuna.create_study(study_name="b", storage=other)
+            study = optuna.load_study("b", storage=storage)
+            assert study._study_id == study_id
+            assert study.direction.name == "MINIMIZE"
+            assert storage.get_study_name_from_id(study_id) == "b"
+
+
+def test_write_behind():
+    with Client(processes=False):
+        storage = dask_optuna.DaskStorage(write_behind=True, max_buffered_writes=3)
+        base_storage = storage.get_base_storage()
+        study_id = storage.create_new_study()
+        trial_id = storage.create_new_trial(study_id)
+        distribution = optuna.distributions.UniformDistribution(low=0, high=10)
+
+        storage.set_trial_param(trial_id, "x", 1.0, distribution)
+        storage.set_trial_user_attr(trial_id, "foo", "bar")
+        # Writes are buffered
+        assert base_storage.get_trial(trial_id).params == {}
+        # and are sent before reading back the same trial
+        assert storage.get_trial_param(trial_id, "x") == 1.0
+        assert storage.get_trial(trial_id).user_attrs == {"foo": "bar"}
+
+        # Reading all trials in a study sends buffered writes
+        storage.set_trial_system_attr(trial_id, "foo", "bar")
+        (trial,) = storage.get_all_trials(study_id)
+        assert trial.system_attrs == {"foo": "bar"}
+
+        # Buffered writes are sent when the buffer is full
+        for i in range(3):
+            storage.set_trial_user_attr(trial_id, str(i), i)
+        assert base_storage.get_trial(trial_id).user_attrs["2"] == 2
+
+        # or when the trial changes state
+        storage.set_trial_user_attr(trial_id, "baz", 1)
+        storage.set_trial_value(trial_id, 1.0)
+        assert base_storage.get_trial(trial_id).value is None
+        storage.set_trial_state(trial_id, optuna.trial.TrialState.COMPLETE)
+        trial = base_storage.get_trial(trial_id)
+        assert trial.user_attrs["baz"] == 1
+        assert trial.value == 1.0
+        assert trial.state == optuna.trial.TrialState.COMPLETE
+
+        # or when explicitly flushed
+        trial_id = storage.create_new_trial(study_id)
+        storage.set_trial_user_attr(trial_id, "foo", "bar")
+        storage.flush()
+        assert base_storage.get_trial(trial_id).user_attrs == {"foo": "bar"}
+
+
+def test_merge_trial_writes():
+    operations = [
+        ("set_trial_value", {"trial_id": 0, "value": 1.0}),
+        ("set_trial_state", {"trial_id": 0, "state": "COMPLETE"}),
+        ("set_trial_value", {"trial_id": 1, "value": 2.0}),
+        ("set_trial_state", {"trial_id": 2, "state": "COMPLETE"}),
+        ("set_trial_value", {"trial_id": 2, "value": 3.0}),
+    ]
+    assert _merge_trial_writes(operations) == [
+        ("set_trial_state", {"trial_id": 0, "state": "COMPLETE", "value": 1.0}),
+        # Only a value directly followed by a state change of the same trial
+        ("set_trial_value", {"trial_id": 1, "value": 2.0}),
+        ("set_trial_state", {"trial_id": 2, "state": "COMPLETE"}),
+        ("set_trial_value", {"trial_id": 2, "value": 3.0}),
+    ]
+
+
+@pytest.mark.parametrize("processes", [True, False])
+def test_write_behind_optimize(processes):
+    with Client(processes=processes):
+        storage = dask_optuna.DaskStorage(write_behind=True)
+        study = optuna.create_study(storage=storage)
+        with joblib.parallel_backend("dask"):
+            study.optimize(objective, n_trials=10, n_jobs=-1)
+        assert len(study.trials) == 10
+        assert all("x" in t.params for t in study.trials)
+
+
+def test_stream_intermediate_values():
+    with Client(processes=False) as client:
+        storage = dask_optuna.DaskStorage(stream_intermediate_values=True)
+        base_storage = storage.get_base_storage()
+        study_id = storage.create_new_study()
+        trial_id = storage.create_new_trial(study_id)
+
+        expected = {step: float(step) for step in range(20)}
+        for step, value in expected.items():
+            storage.set_trial_intermediate_value(trial_id, step, value)
+        # Values which haven't been sent yet are still visible
+        assert storage.get_trial(trial_id).intermediate_values == expected
+
+        # Values are set before the trial is finished
+        storage.set_trial_value(trial_id, 1.0)
+        storage.set_trial_state(trial_id, optuna.trial.TrialState.COMPLETE)
+        assert base_storage.get_trial(trial_id).intermediate_values == expected
+
+        # Errors are raised by the next call involving the trial
+        storage.set_trial_intermediate_value(trial_id, 100, 1.0)
+        with pytest.raises(RuntimeError, match="intermediate values"):
+            storage.set_trial_user_attr(trial_id, "foo", "bar")
+
+        # Reporting from a trial doesn't wait for get_trial every time, and
+        # values reported in the meantime are coalesced
+        study = optuna.load_study(
+            study_name=storage.get_study_name_from_id(study_id), storage=storage
+        )
+        trial = optuna.trial.Trial(study, storage.create_new_trial(study_id))
+        calls = _count_handler_calls(client.cluster.scheduler)
+        for step, value in expected.items():
+            trial.report(value, step)
+        assert calls["optuna_set_trial_intermediate_values"] < len(expected)
+        assert not trial.should_prune()
+        assert calls["optuna_get_trial"] <= 2
+        storage.set_trial_user_attr(trial._trial_id, "foo", "bar")
+        assert storage.get_trial(trial._trial_id).user_attrs == {"foo": "bar"}
+        storage.set_trial_value(trial._trial_id, 1.0)
+        storage.set_trial_state(trial._trial_id, optuna.trial.TrialState.COMPLETE)
+        assert base_storage.get_trial(trial._trial_id).intermediate_values == expected
+        assert trial._trial_id not in storage._intermediate_value_stream().trials
+
+        # Failures to send are retried
+        stream = storage._intermediate_value_stream()
+        send = stream.send
+        failures = []
+
+        async def fail(values, n_failures):
+            if len(failures) < n_failures:
+                failures.append(values)
+                raise OSError("connection reset")
+            return await send(values=values)
+
+        stream.send = partial(fail, n_failures=1)
+        trial_id = storage.create_new_trial(study_id)
+        storage.set_trial_intermediate_value(trial_id, 0, 1.0)
+        storage.set_trial_value(trial_id, 1.0)
+        storage.set_trial_state(trial_id, optuna.trial.TrialState.COMPLETE)
+        assert failures
+        assert base_storage.get_trial(trial_id).intermediate_values == {0: 1.0}
+
+        # ... and if they keep failing, the trial isn't left running
+        failures.clear()
+        stream.send = partial(fail, n_failures=stream.max_attempts)
+        trial_id = storage.create_new_trial(study_id)
+        storage.set_trial_intermediate_value(trial_id, 0, 1.0)
+        with pytest.raises(RuntimeError, match="connection reset"):
+            storage.set_trial_value(trial_id, 1.0)
+        assert storage.get_trial(trial_id).state == optuna.trial.TrialState.FAIL
+
+
+@pytest.mark.parametrize("processes", [True, False])
+def test_stream_intermediate_values_pruning(processes):
+    def objective(trial):
+        x = trial.suggest_uniform("x", -10, 10)
+        for step in range(10):
+            trial.report((x - 2) ** 2 + 10 - step, step)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+        return (x - 2) ** 2
+
+    with Client(processes=processes):
+        storage = dask_optuna.DaskStorage(stream_intermediate_values=True)
+        study = optuna.create_study(storage=storage)
+        with joblib.parallel_backend("dask"):
+            study.optimize(objective, n_trials=10, n_jobs=-1)
+        assert len(study.trials) == 10
+        for trial in study.trials:
+            n_steps = 10 if trial.state == optuna.trial.TrialState.COMPLETE else 1
+            assert len(trial.intermediate_values) >= n_steps
+
+
+@pytest.mark.parametrize("wire_format", ["dict", "compact"])
+def test_wire_formats(wire_format):
+    with Client():
+        storage = dask_optuna.DaskStorage()
+        assert storage._wire_format() == "compact"
+        storage._metadata.wire_format = wire_format
+
+        study = optuna.create_study(storage=storage)
+        optuna.create_study(storage=storage)
+        with joblib.parallel_backend("dask"):
+            study.optimize(objective, n_trials=5, n_jobs=-1)
+        base_storage = storage.get_base_storage()
+
+        assert study.trials == base_storage.get_all_trials(study._study_id)
+        trial = storage.get_trial(study.trials[0]._trial_id)
+        assert trial == study.trials[0]
+        summaries = storage.get_all_study_summaries()
+        expected = base_storage.get_all_study_summaries()
+        assert [s.__dict__ for s in summaries] == [s.__dict__ for s in expected]
+
+
+def test_distribution_ids():
+    with Client(processes=False) as client:
+        storage = dask_optuna.DaskStorage()
+        assert storage._wire_format() == "compact"
+        study = optuna.create_study(storage=storage)
+        study.optimize(objective, n_trials=3)
+        trial = storage.get_trial(study.trials[0]._trial_id)
+
+        ext = client.cluster.scheduler.extensions["optuna"]
+        table = ext.distribution_tables[storage.name][study._study_id]
+        local = storage._metadata.distribution_tables[study._study_id]
+        assert local.known == table.known
+
+        calls = []
+        handler = client.cluster.scheduler.handlers["optuna_set_trial_param"]
+
+        async def set_trial_param(comm, _handler=handler, **kwargs):
+            calls.append(kwargs)
+            return await _handler(comm, **kwargs)
+
+        client.cluster.scheduler.handlers["optuna_set_trial_param"] = set_trial_param
+        trial_id = storage.create_new_trial(study._study_id)
+        distribution = trial.distributions["x"]
+        storage.set_trial_param(trial_id, "x", 0.5, distribution)
+        assert calls[-1]["distribution_id"] == local.ids[distribution]
+        assert "distribution" not in calls[-1]
+        assert storage.get_trial(trial_id).distributions == {"x": distribution}
+
+        # The scheduler rejects IDs from a table it doesn't know about
+        with pytest.raises(ValueError, match="Unknown distribution"):
+            storage._call(
+                "set_trial_param",
+                trial_id=trial_id,
+                param_name="y",
+                param_value_internal=0.5,
+                distribution_id=0,
+                distributions_token="unknown",
+            )
+
+
+@pytest.mark.parametrize("processes", [True, False])
+def test_get_trials_columnar(processes):
+    with Client(processes=processes):
+        storage = dask_optuna.DaskStorage()
+        study = optuna.create_study(storage=storage)
+        study.optimize(objective, n_trials=5)
+        trial_id = storage.create_new_trial(study._study_id)
+        trials = storage.get_base_storage().get_all_trials(study._study_id)
+
+        columns = storage.get_trials_columnar(study._study_id)
+        assert isinstance(columns["value"], np.ndarray)
+        assert list(columns["trial_id"]) == [t._trial_id for t in trials]
+        assert list(columns["params"]["x"][:-1]) == [t.params["x"] for t in trials[:-1]]
+        assert np.isnan(columns["params"]["x"][-1])
+
+        # Buffered writes are applied first
+        with storage.batch():
+            storage.set_trial_param(trial_id, "y", 1.0, trials[0].distributions["x"])
+            columns = storage.get_trials_columnar(
+                study._study_id, params=["y"], states=[optuna.trial.TrialState.RUNNING]
+            )
+        assert list(columns["trial_id"]) == [trial_id]
+        assert list(columns["params"]) == ["y"]
+        assert list(columns["params"]["y"]) == [1.0]
+        assert list(columns["state"]) == [optuna.trial.TrialState.RUNNING.value]
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+def test_query_trials(storage_specifier):
+    with Client(processes=False):
+        with get_storage_url(storage_specifier) as url:
+            storage = dask_optuna.DaskStorage(url)
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=10)
+            trial_id = storage.create_new_trial(study._study_id)
+            storage.set_trial_user_attr(trial_id, "large", "x" * 1000)
+
+            trials = storage.query_trials(
+                study._study_id,
+                states=[optuna.trial.TrialState.COMPLETE],
+                fields=["number", "value"],
+            )
+            assert trials == [
+                {"number": t.number, "value": t.value} for t in study.trials[:10]
+            ]
+
+            trials = storage.query_trials(study._study_id, numbers=(8, None))
+            assert [t["number"] for t in trials] == [8, 9, 10]
+            assert trials[-1]["user_attrs"] == {"large": "x" * 1000}
+            assert trials[-1]["state"] == optuna.trial.TrialState.RUNNING
+            assert trials[0]["distributions"] == study.trials[8].distributions
+
+            trials = storage.query_trials(
+                study._study_id, fields=["trial_id"], numbers=(2, 4)
+            )
+            assert trials == [{"trial_id": t._trial_id} for t in study.trials[2:4]]
+
+            with pytest.raises(ValueError, match="Unknown trial fields"):
+                storage.query_trials(study._study_id, fields=["foo"])
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+@pytest.mark.parametrize("direction", ["minimize", "maximize"])
+def test_get_best_trial(storage_specifier, direction):
+    with Client(processes=False):
+        with get_storage_url(storage_specifier) as url:
+            storage = dask_optuna.DaskStorage(url)
+            study = optuna.create_study(storage=storage, direction=direction)
+            with pytest.raises(ValueError, match="No trials are completed"):
+                study.best_trial
+            base_storage = storage.get_base_storage()
+
+            # The best trial is tracked without asking the storage again
+            calls = []
+            _get_best_trial = base_storage.get_best_trial
+
+            def get_best_trial(study_id):
+                calls.append(study_id)
+                return _get_best_trial(study_id)
+
+            base_storage.get_best_trial = get_best_trial
+            for x in [3, 1, 5, 2, 4]:
+                study.enqueue_trial({"x": x})
+                study.optimize(objective, n_trials=1)
+                expected = _get_best_trial(study._study_id)
+                assert study.best_trial._trial_id == expected._trial_id
+                assert study.best_value == expected.value
+            assert calls == []
+
+            # Completed with set_trial_state and from a template trial
+            trial_id = storage.create_new_trial(study._study_id)
+            value = 100 if direction == "maximize" else -1
+            storage.set_trial_value(trial_id, value)
+            storage.set_trial_state(trial_id, optuna.trial.TrialState.COMPLETE)
+            assert study.best_trial._trial_id == trial_id
+            template = optuna.trial.create_trial(value=value * 2)
+            trial_id = storage.create_new_trial(study._study_id, template)
+            assert study.best_trial._trial_id == trial_id
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+def test_get_n_trials(storage_specifier):
+    def objective(trial):
+        x = trial.suggest_uniform("x", -10, 10)
+        if x < 0:
+            raise optuna.TrialPruned()
+        return x
+
+    with Client(processes=False):
+        with get_storage_url(storage_specifier) as url:
+            storage = dask_optuna.DaskStorage(url)
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=5)
+            base_storage = storage.get_base_storage()
+            assert storage.get_n_trials(study._study_id) == 5
+
+            # Once a study's trials have been counted, counts are kept up to date
+            # without asking the storage
+            calls = []
+            _get_all_trials = base_storage.get_all_trials
+            _get_n_trials = base_storage.get_n_trials
+
+            def get_n_trials(study_id, state=None):
+                calls.append(study_id)
+                return _get_n_trials(study_id, state)
+
+            base_storage.get_n_trials = get_n_trials
+            study.enqueue_trial({"x": 1})
+            study.optimize(objective, n_trials=5)
+            storage.create_new_trial(study._study_id)
+            for state in [None] + list(optuna.trial.TrialState):
+                expected = len(
+                    [
+                        t
+                        for t in _get_all_trials(study._study_id)
+                        if state is None or t.state == state
+                    ]
+                )
+                assert storage.get_n_trials(study._study_id, state) == expected
+            assert calls == []
+
+            storage.delete_study(study._study_id)
+            study = optuna.create_study(storage=storage)
+            assert storage.get_n_trials(study._study_id) == 0
+
+
 @pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
 @pytest.mark.parametrize("processes", [True, False])
 def test_optuna_joblib_backend(storage_specifier, processes):
@@ -66,6 +722,419 @@ def test_get_base_storage(storage_specifier):
             assert isinstance(storage, expected_type)
 
 
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+def test_offload(storage_specifier):
+    with Client(processes=False) as client:
+        with get_storage_url(storage_specifier) as url:
+            storage = dask_optuna.DaskStorage(url, offload=True)
+            ext = client.cluster.scheduler.extensions["optuna"]
+            assert storage.name in ext.executors
+
+            study = optuna.create_study(storage=storage)
+            with joblib.parallel_backend("dask"):
+                study.optimize(objective, n_trials=10, n_jobs=-1)
+            assert len(study.trials) == 10
+            assert all(
+                t.state == optuna.trial.TrialState.COMPLETE for t in study.trials
+            )
+
+
+def test_coalesce_reads():
+    with Client(processes=False) as client:
+        storage = dask_optuna.DaskStorage(offload=True)
+        study = optuna.create_study(storage=storage)
+        study.optimize(objective, n_trials=5)
+        base_storage = storage.get_base_storage()
+
+        calls = []
+        _get_all_trials = base_storage.get_all_trials
+
+        def get_all_trials(*args, **kwargs):
+            calls.append(args)
+            time.sleep(0.2)
+            return _get_all_trials(*args, **kwargs)
+
+        base_storage.get_all_trials = get_all_trials
+
+        async def read(n):
+            return await asyncio.gather(
+                *[
+                    client.scheduler.optuna_get_trials_since(
+                        study_id=study._study_id, storage_name=storage.name
+                    )
+                    for _ in range(n)
+                ]
+            )
+
+        results = client.sync(read, 10)
+        assert len(calls) == 1
+        assert all(r == results[0] for r in results)
+        assert len(results[0]["trials"]) == 5
+
+        # Reads which arrive after a write don't reuse an earlier result
+        async def read_write_read():
+            first = asyncio.ensure_future(read(1))
+            await asyncio.sleep(0.05)
+            await client.scheduler.optuna_create_new_trial(
+                study_id=study._study_id, storage_name=storage.name
+            )
+            return await first, await read(1)
+
+        calls.clear()
+        (before,), (after,) = client.sync(read_write_read)
+        assert len(calls) == 2
+        assert len(before["trials"]) == 5
+        assert len(after["trials"]) == 6
+        assert not client.cluster.scheduler.extensions["optuna"].reads
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+@pytest.mark.parametrize("processes", [True, False])
+def test_actor(storage_specifier, processes):
+    with Client(processes=processes, n_workers=2) as client:
+        with get_storage_url(storage_specifier) as url:
+            worker = list(client.scheduler_info()["workers"])[0]
+            storage = dask_optuna.DaskStorage(
+                url, actor=worker, stream_intermediate_values=True
+            )
+            assert storage._actor._address == worker
+            study = optuna.create_study(storage=storage)
+            with joblib.parallel_backend("dask"):
+                study.optimize(objective, n_trials=10, n_jobs=-1)
+            assert len(study.trials) == 10
+            assert all(
+                t.state == optuna.trial.TrialState.COMPLETE for t in study.trials
+            )
+            assert study.best_value == min(t.value for t in study.trials)
+            columns = storage.get_trials_columnar(study._study_id)
+            assert isinstance(columns["params"]["x"], np.ndarray)
+
+            # Nothing is stored on the scheduler
+            def storages(dask_scheduler=None):
+                ext = dask_scheduler.extensions.get("optuna")
+                return list(ext.storages) if ext is not None else []
+
+            assert storage.name not in client.run_on_scheduler(storages)
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+@pytest.mark.parametrize("processes", [True, False])
+def test_sidecar(storage_specifier, processes):
+    with Client(processes=processes, n_workers=2) as client:
+        with get_storage_url(storage_specifier) as url:
+            storage = dask_optuna.DaskStorage(url, sidecar=True)
+            study = optuna.create_study(storage=storage)
+            with joblib.parallel_backend("dask"):
+                study.optimize(objective, n_trials=10, n_jobs=-1)
+            assert len(study.trials) == 10
+            assert study.best_value == min(t.value for t in study.trials)
+            columns = storage.get_trials_columnar(study._study_id)
+            assert isinstance(columns["params"]["x"], np.ndarray)
+            with pytest.raises(KeyError):
+                storage.get_trial(1000)
+            assert len(storage.get_base_storage().get_all_trials(study._study_id)) == 10
+
+            ext = client.cluster.scheduler.extensions["optuna"]
+            assert storage.name not in ext.storages
+            sidecar = ext.sidecars[storage.name]
+            assert sidecar.process.is_alive()
+            usage = storage.memory_usage()[storage.name]
+            assert usage["sidecar"]
+            assert usage["storage"] > 0
+
+            # Closing the storage stops its sidecar
+            storage.close()
+            assert storage.name not in ext.sidecars
+            assert not sidecar.process.is_alive()
+
+            other = dask_optuna.DaskStorage(url, sidecar=True)
+            optuna.create_study(storage=other)
+            sidecar = ext.sidecars[other.name]
+    # The sidecar is stopped along with the scheduler
+    assert not sidecar.process.is_alive()
+
+    with Client(processes=False):
+        with pytest.raises(ValueError, match="actor and a sidecar"):
+            dask_optuna.DaskStorage(actor=True, sidecar=True)
+
+
+@pytest.mark.parametrize("storage_specifier", STORAGE_MODES)
+@pytest.mark.parametrize("offload", [True, False])
+def test_close(storage_specifier, offload):
+    with Client(processes=False) as client:
+        with get_storage_url(storage_specifier) as url:
+            ext = client.cluster.scheduler.extensions
+            storage = dask_optuna.DaskStorage(
+                url, offload=offload, stream_intermediate_values=True
+            )
+            other = dask_optuna.DaskStorage()
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=5)
+            ext = ext["optuna"]
+
+            usage = storage.memory_usage()
+            assert set(usage) == {storage.name, other.name}
+            assert usage[storage.name]["storage"] > usage[other.name]["storage"]
+            assert usage[storage.name]["trial_cache"] > 0
+            assert "idle" not in usage[storage.name]
+
+            storage.close()
+            for state in [
+                ext.storages,
+                ext.executors,
+                ext.changes,
+                ext.trial_caches,
+                ext.distribution_tables,
+                ext.best_trials,
+                ext.trial_counts,
+                ext.generations,
+            ]:
+                assert storage.name not in state
+            assert set(storage.memory_usage()) == {other.name}
+            with pytest.raises(KeyError, match="closed"):
+                storage.get_all_study_summaries()
+
+            # Other storages are unaffected
+            optuna.create_study(storage=other).optimize(objective, n_trials=1)
+
+
+@pytest.mark.parametrize("offload", [False, True])
+def test_shared_url(offload):
+    with Client(processes=False) as client:
+        with get_storage_url("sqlite") as url:
+            storage = dask_optuna.DaskStorage(url, offload=offload)
+            other = dask_optuna.DaskStorage(url, offload=offload)
+            in_memory = dask_optuna.DaskStorage()
+            ext = client.cluster.scheduler.extensions["optuna"]
+            base = ext.storages[storage.name]
+            assert ext.storages[other.name] is base
+            assert ext.storages[in_memory.name] is not base
+            if offload:
+                assert ext.executors[other.name] is ext.executors[storage.name]
+
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=2)
+            other_study = optuna.load_study(study_name=study.study_name, storage=other)
+            assert len(other_study.trials) == 2
+
+            # Reads and writes through either storage see each other's changes
+            for i in range(3):
+                writer, reader = (study, other_study) if i % 2 else (other_study, study)
+                writer.optimize(lambda trial: -i - trial.suggest_uniform("x", 0, 1), 2)
+                assert len(reader.trials) == len(writer.trials) == 4 + 2 * i
+                assert reader.best_trial.number == writer.best_trial.number
+                assert reader.best_value < -i
+                for s in (storage, other):
+                    assert s.get_n_trials(study._study_id) == 4 + 2 * i
+
+            # as well as the studies they delete
+            optuna.delete_study(study.study_name, storage=other)
+            study = optuna.create_study(storage=other)
+            study.optimize(objective, n_trials=1)
+            other_study = optuna.load_study(
+                study_name=study.study_name, storage=storage
+            )
+            assert [t.value for t in other_study.trials] == [study.trials[0].value]
+            assert storage.get_n_trials(study._study_id) == 1
+
+            # The shared storage's memory is only counted once
+            usage = storage.memory_usage()
+            first, second = sorted([storage.name, other.name])
+            assert usage[first]["storage"] > 0
+            assert usage[second]["storage"] == 0
+            assert usage[second]["shared_with"] == first
+            assert "shared_with" not in usage[in_memory.name]
+
+            storage.close()
+            assert list(ext.shared[url].names) == [other.name]
+
+            # The shared storage is still open for the remaining storage
+            study = optuna.load_study(study_name=study.study_name, storage=other)
+            study.optimize(objective, n_trials=2)
+            assert len(study.trials) == 3
+            other.close()
+            assert url not in ext.shared
+            assert not ext.urls
+
+
+def test_remote_changes():
+    with Client(processes=False) as client:
+        with get_storage_url("sqlite") as url:
+            storage = dask_optuna.DaskStorage(url)
+            study = optuna.create_study(storage=storage)
+            study.optimize(objective, n_trials=2)
+            assert len(study.trials) == 2
+            assert study.best_value >= 0
+
+            # Polling reads only look for other processes' changes once per interval
+            ext = client.cluster.scheduler.extensions["optuna"]
+            base_storage = ext.storages[storage.name]
+            read_remote = base_storage.read_trials_from_remote_storage
+            reads = []
+
+            def counted(study_id):
+                reads.append(study_id)
+                return read_remote(study_id)
+
+            base_storage.read_trials_from_remote_storage = counted
+            for _ in range(10):
+                assert storage.get_n_trials(study._study_id) == 2
+                assert study.best_value >= 0
+                assert len(storage.get_all_trials(study._study_id)) == 2
+            assert len(reads) <= 1
+            ext.remote_sync_interval = 0
+
+            # Trials added to the database by another process
+            remote = optuna.load_study(study_name=study.study_name, storage=url)
+            remote.optimize(lambda trial: -1.0, n_trials=2)
+            assert storage.get_n_trials(study._study_id) == 4
+            assert study.best_trial.number == 2
+            assert [t.number for t in study.trials] == [0, 1, 2, 3]
+            assert [t.value for t in study.trials[2:]] == [-1.0, -1.0]
+
+            # and trials changed by it
+            trial_id = remote._storage.create_new_trial(remote._study_id)
+            running = optuna.trial.TrialState.RUNNING
+            assert storage.get_n_trials(study._study_id, state=running) == 1
+            assert study.trials[-1].state == optuna.trial.TrialState.RUNNING
+            remote._storage.set_trial_value(trial_id, -2.0)
+            remote._storage.set_trial_state(trial_id, optuna.trial.TrialState.COMPLETE)
+            assert study.best_value == -2.0
+            assert storage.get_n_trials(study._study_id, state=running) == 0
+            assert study.trials[-1].value == -2.0
+            assert study.trials[-1].state == optuna.trial.TrialState.COMPLETE
+            assert storage.get_all_trials(study._study_id) == study.trials
+
+
+def test_idle_timeout():
+    with Client(processes=False) as client:
+        ext = client.cluster.scheduler.extensions
+        storage = dask_optuna.DaskStorage(idle_timeout=1)
+        kept = dask_optuna.DaskStorage()
+        ext = ext["optuna"]
+        study = optuna.create_study(storage=storage)
+
+        # Storages which are in use aren't removed
+        start = time.time()
+        while time.time() < start + 2:
+            study.optimize(objective, n_trials=1)
+            time.sleep(0.1)
+        assert storage.name in ext.storages
+        assert 0 <= storage.memory_usage()[storage.name]["idle"] < 1
+
+        deadline = time.time() + 10
+        while storage.name in ext.storages:
+            assert time.time() < deadline
+            time.sleep(0.1)
+        assert kept.name in ext.storages
+
+
+def _count_handler_calls(scheduler):
+    """Count the calls to each of the scheduler's RPC handlers"""
+    calls = Counter()
+    for name, handler in list(scheduler.handlers.items()):
+
+        @wraps(handler)
+        def counted(*args, _handler=handler, _name=name, **kwargs):
+            calls[_name] += 1
+            return _handler(*args, **kwargs)
+
+        scheduler.handlers[name] = counted
+    return calls
+
+
+def _unpickle_storages(data, n):
+    storages = [pickle.loads(data) for _ in range(n)]
+    return len({id(storage) for storage in storages}), storages[0].name
+
+
+def test_unpickle_without_scheduler_rpcs():
+    with Client(processes=False, n_workers=1) as client:
+        storage = dask_optuna.DaskStorage(write_behind=True)
+        calls = _count_handler_calls(client.cluster.scheduler)
+        data = pickle.dumps(storage)
+
+        copies = [pickle.loads(data) for _ in range(10)]
+        assert sum(calls.values()) == 0
+        # Copies in a process share a single handle
+        assert all(copy is copies[0] for copy in copies)
+        assert copies[0].name == storage.name
+        assert copies[0].write_behind
+        assert copies[0].client is client
+
+        # Same for copies in tasks on workers
+        n_handles, name = client.submit(_unpickle_storages, data, 10).result()
+        assert n_handles == 1
+        assert name == storage.name
+        assert calls["run_function"] == 0
+        assert not any(name.startswith("optuna_") for name in calls)
+
+        # Copies with different options get their own handle
+        other = dask_optuna.DaskStorage(name=storage.name)
+        assert pickle.loads(pickle.dumps(other)) is not copies[0]
+        assert not pickle.loads(pickle.dumps(other)).write_behind
+
+        # Copies work like the original
+        study_id = copies[0].create_new_study("foo")
+        assert storage.get_study_id_from_name("foo") == study_id
+
+
+def _optimize(storage, study_name, n_trials):
+    study = optuna.load_study(study_name=study_name, storage=storage)
+    study.optimize(objective, n_trials=n_trials)
+
+
+@pytest.mark.parametrize("processes", [True, False])
+@pytest.mark.parametrize("consistency", ["eventual", "read-your-writes"])
+def test_read_replica(processes, consistency):
+    with Client(processes=processes, n_workers=2) as client:
+        storage = dask_optuna.DaskStorage(read_replica=True, consistency=consistency)
+        study = optuna.create_study(storage=storage)
+
+        scheduler = client.cluster.scheduler
+        syncs = []
+        handler = scheduler.handlers["optuna_get_trials_since"]
+
+        async def get_trials_since(comm, **kwargs):
+            syncs.append(kwargs["study_id"])
+            return await handler(comm, **kwargs)
+
+        scheduler.handlers["optuna_get_trials_since"] = get_trials_since
+
+        assert storage.get_all_trials(study._study_id) == []
+        futures = [
+            client.submit(_optimize, storage, study.study_name, 10, pure=False)
+            for _ in range(2)
+        ]
+        client.gather(futures)
+        if consistency == "eventual":
+            # Workers only sync once, then read changes they're sent
+            assert len(syncs) <= 1 + len(futures)
+
+        # Changes are pushed to this process without it asking for them. It
+        # syncs once more if it subscribed after changes started being published.
+        n_syncs = len(syncs)
+        deadline = time.time() + 10
+        while len(storage.get_all_trials(study._study_id)) < 20:
+            assert time.time() < deadline
+            time.sleep(0.01)
+        assert len(syncs) <= n_syncs + 1
+        trials = storage.get_all_trials(study._study_id)
+        assert trials == storage.get_base_storage().get_all_trials(study._study_id)
+
+        n_syncs = len(syncs)
+        trial_id = storage.create_new_trial(study._study_id)
+        trials = storage.get_all_trials(study._study_id)
+        if consistency == "read-your-writes":
+            # Our own write forces a sync
+            assert len(syncs) == n_syncs + 1
+            assert trials[-1]._trial_id == trial_id
+
+    with Client(processes=False):
+        with pytest.raises(ValueError, match="consistency"):
+            dask_optuna.DaskStorage(read_replica=True, consistency="strong")
+
+
 @pytest.mark.parametrize("processes", [True, False])
 @pytest.mark.parametrize("direction", ["maximize", "minimize"])
 def test_study_direction_best_value(processes, direction):